@@ -1,24 +1,104 @@
-# -*- coding: utf-8 -*-
 """
 pyxform is a Python library designed to make authoring XForms for ODK
 Collect easy.
 """
 
+from importlib import import_module
+from typing import TYPE_CHECKING
+
 __version__ = "3.0.0"
 
-from pyxform.builder import (
-    SurveyElementBuilder,
-    create_survey,
-    create_survey_element_from_dict,
-    create_survey_from_path,
-    create_survey_from_xls,
-)
-from pyxform.instance import SurveyInstance
-from pyxform.question import InputQuestion, MultipleChoiceQuestion, Question
-from pyxform.question_type_dictionary import QUESTION_TYPE_DICT
-from pyxform.section import Section
-from pyxform.survey import Survey
-from pyxform.xls2json import SurveyReader as ExcelSurveyReader
-
-# This is what gets imported when someone imports pyxform
-# flake8: noqa
+# This is what gets imported when someone imports pyxform. The submodules are imported
+# when an attribute is first used, so that e.g. tools using only xform2json don't pay
+# for importing the XLSForm converter.
+_LAZY_ATTRIBUTES = {
+    "SurveyElementBuilder": ("pyxform.builder", "SurveyElementBuilder"),
+    "create_survey": ("pyxform.builder", "create_survey"),
+    "create_survey_element_from_dict": (
+        "pyxform.builder",
+        "create_survey_element_from_dict",
+    ),
+    "create_survey_from_path": ("pyxform.builder", "create_survey_from_path"),
+    "create_survey_from_xls": ("pyxform.builder", "create_survey_from_xls"),
+    "SurveyInstance": ("pyxform.instance", "SurveyInstance"),
+    "InputQuestion": ("pyxform.question", "InputQuestion"),
+    "MultipleChoiceQuestion": ("pyxform.question", "MultipleChoiceQuestion"),
+    "Question": ("pyxform.question", "Question"),
+    "QUESTION_TYPE_DICT": ("pyxform.question_type_dictionary", "QUESTION_TYPE_DICT"),
+    "Section": ("pyxform.section", "Section"),
+    "Survey": ("pyxform.survey", "Survey"),
+    "ExcelSurveyReader": ("pyxform.xls2json", "SurveyReader"),
+}
+# The submodules that were imported along with the package attributes above, and so were
+# available as e.g. `pyxform.builder` after `import pyxform`.
+_LAZY_SUBMODULES = {
+    "aliases",
+    "builder",
+    "constants",
+    "entities",
+    "errors",
+    "external_instance",
+    "file_utils",
+    "instance",
+    "parsing",
+    "question",
+    "question_type_dictionary",
+    "section",
+    "survey",
+    "survey_element",
+    "util",
+    "utils",
+    "validators",
+    "xform_instance_parser",
+    "xls2json",
+    "xls2json_backends",
+}
+
+__all__ = [
+    "QUESTION_TYPE_DICT",
+    "ExcelSurveyReader",
+    "InputQuestion",
+    "MultipleChoiceQuestion",
+    "Question",
+    "Section",
+    "Survey",
+    "SurveyElementBuilder",
+    "SurveyInstance",
+    "__version__",
+    "create_survey",
+    "create_survey_element_from_dict",
+    "create_survey_from_path",
+    "create_survey_from_xls",
+]
+
+if TYPE_CHECKING:
+    from pyxform.builder import (
+        SurveyElementBuilder,
+        create_survey,
+        create_survey_element_from_dict,
+        create_survey_from_path,
+        create_survey_from_xls,
+    )
+    from pyxform.instance import SurveyInstance
+    from pyxform.question import InputQuestion, MultipleChoiceQuestion, Question
+    from pyxform.question_type_dictionary import QUESTION_TYPE_DICT
+    from pyxform.section import Section
+    from pyxform.survey import Survey
+    from pyxform.xls2json import SurveyReader as ExcelSurveyReader
+
+
+def __getattr__(name: str):
+    if name in _LAZY_SUBMODULES:
+        # Importing the submodule also sets it as an attribute of the package.
+        return import_module(f"pyxform.{name}")
+    try:
+        module_name, attribute = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f"module 'pyxform' has no attribute '{name}'") from None
+    value = getattr(import_module(module_name), attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *_LAZY_ATTRIBUTES, *_LAZY_SUBMODULES})
@@ -0,0 +1,151 @@
+"""
+Content-addressed cache for XLSForm to XForm conversion results.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from mmap import mmap
+from pathlib import Path
+
+from pyxform import __version__
+
+CACHE_FILE_SUFFIX = ".json"
+
+
+def get_cache_key(data: bytes | mmap, options: dict) -> str:
+    """
+    Get the cache key for a conversion of the XLSForm data with the options.
+
+    The pyxform version is included since the output may change between versions.
+
+    :param data: The XLSForm file content, as bytes or a buffer like bytes.
+    :param options: The conversion options, as JSON-serialisable values.
+    """
+    digest = hashlib.sha256()
+    digest.update(__version__.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class CacheStore(ABC):
+    """
+    Base class for conversion result stores.
+
+    A store maps a cache key to a dict with the "xform", "warnings" and "itemsets" of a
+    ConvertResult. Stores should not raise errors for missing or unreadable entries.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> dict | None:
+        """Get the stored result for the key, or None if there is no stored result."""
+
+    @abstractmethod
+    def set(self, key: str, value: dict) -> None:
+        """Store the result for the key."""
+
+
+class DiskLRUCache(CacheStore):
+    """
+    Store results as files in a directory, evicting the least recently used first.
+
+    Each result is a JSON file named with the cache key. The file modification time is
+    updated on each read, and when the total size of the files is over `max_bytes`, the
+    files with the oldest modification times are deleted until the total is under
+    `EVICT_TO_RATIO` of `max_bytes`. Files are written atomically, so a directory can be
+    shared by many processes.
+
+    The total size is found when the cache is created, and then kept up to date with
+    this cache's writes, so the directory is only scanned again when the total is over
+    the limit. The scan also finds the writes by other processes.
+    """
+
+    EVICT_TO_RATIO = 0.9
+
+    def __init__(self, path: str | os.PathLike[str], max_bytes: int = 256 * 1024**2):
+        """
+        :param path: The cache directory. It is created if it doesn't exist.
+        :param max_bytes: The maximum total size of the cache files.
+        """
+        self.path: Path = Path(path)
+        self.max_bytes: int = max_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._total_bytes: int = sum(e[1] for e in self._scan())
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path / f"{key}{CACHE_FILE_SUFFIX}"
+
+    def get(self, key: str) -> dict | None:
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # Unreadable or partial entry, so treat it as a miss and remove it.
+            try:
+                size = entry_path.stat().st_size
+                entry_path.unlink()
+            except FileNotFoundError:
+                return None  # Deleted by another process.
+            # The entry may have been written by another process, so it may not be in
+            # the total.
+            self._total_bytes = max(0, self._total_bytes - size)
+            return None
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        entry_path = self._entry_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with open(fd, mode="w", encoding="utf-8") as f:
+                json.dump(value, f)
+                size = f.tell()
+            try:
+                replaced_size = entry_path.stat().st_size
+            except FileNotFoundError:
+                replaced_size = 0
+            os.replace(tmp_path, entry_path)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self._total_bytes += size - replaced_size
+        if self.max_bytes < self._total_bytes:
+            self.evict()
+
+    def _scan(self) -> list[tuple[int, int, str]]:
+        """Get the modification time, size, and path of each entry."""
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Deleted by another process.
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used entries if the cache is over max_bytes, until it
+        is under EVICT_TO_RATIO of max_bytes.
+        """
+        entries = self._scan()
+        total = sum(e[1] for e in entries)
+        if self.max_bytes < total:
+            entries.sort()
+            target = self.max_bytes * self.EVICT_TO_RATIO
+            for _, size, path in entries:
+                Path(path).unlink(missing_ok=True)
+                total -= size
+                if total <= target:
+                    break
+        self._total_bytes = total
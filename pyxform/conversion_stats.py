@@ -0,0 +1,131 @@
+"""
+Timing and memory statistics for the stages of an XLSForm to XForm conversion.
+
+The wall time and CPU time are measured for the current thread. The memory is traced
+with tracemalloc, which traces all threads in the process, so memory stats are collected
+for one conversion at a time: another conversion that collects them waits until the
+first is done. They're not supported in the `serve` mode or with concurrent conversions
+(`--jobs`).
+"""
+
+import threading
+import time
+import tracemalloc
+from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# The conversion stages, in the order that they run.
+STAGE_FILE_READ = "file_read"
+STAGE_WORKBOOK_TO_JSON = "workbook_to_json"
+STAGE_BUILDER = "builder"
+STAGE_XML = "xml"
+STAGE_VALIDATE = "validate"
+STAGES = (
+    STAGE_FILE_READ,
+    STAGE_WORKBOOK_TO_JSON,
+    STAGE_BUILDER,
+    STAGE_XML,
+    STAGE_VALIDATE,
+)
+
+
+class ConversionStats:
+    """
+    Collect the wall time, CPU time, and peak allocated memory of each stage.
+
+    The CPU time is for the current thread, so it doesn't include the time used by
+    validator subprocesses or threads. The peak memory is the highest memory traced by
+    tracemalloc during the stage, above the memory in use when the stage started, or 0
+    if memory isn't traced.
+    """
+
+    __slots__ = ("stages", "trace_memory")
+
+    def __init__(self, trace_memory: bool = True):
+        self.stages: dict[str, dict[str, float]] = {}
+        self.trace_memory: bool = trace_memory
+
+    def add(self, name: str, wall: float, cpu: float, peak: int) -> None:
+        """Add the measurements for a stage; if the stage ran before, combine them."""
+        stage = self.stages.get(name)
+        if stage is None:
+            self.stages[name] = {
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "peak_bytes": peak,
+            }
+        else:
+            stage["wall_seconds"] += wall
+            stage["cpu_seconds"] += cpu
+            stage["peak_bytes"] = max(stage["peak_bytes"], peak)
+
+    def as_dict(self) -> dict[str, dict[str, float]]:
+        """Get the stats for each stage that ran, in stage order."""
+        order = {s: i for i, s in enumerate(STAGES)}
+        names = sorted(self.stages, key=lambda s: order.get(s, len(order)))
+        return {s: dict(self.stages[s]) for s in names}
+
+
+_CONVERSION_STATS: ContextVar[ConversionStats | None] = ContextVar(
+    "_CONVERSION_STATS", default=None
+)
+# Held while memory is traced, since tracemalloc measures the whole process. Re-entrant
+# so that a nested collect_stats in the same thread doesn't wait for itself.
+_TRACE_MEMORY_LOCK = threading.RLock()
+
+
+@contextmanager
+def collect_stats(trace_memory: bool = True) -> Generator[ConversionStats, None, None]:
+    """
+    Collect stats for the conversion stages run within the block.
+
+    Memory is traced with tracemalloc during the block, which slows down the conversion,
+    so stats are only collected when requested. If another thread is tracing memory for
+    a conversion, this waits until it is done. If tracemalloc was already started by
+    something else, memory isn't traced, so as not to reset its peak.
+
+    :param trace_memory: If False, don't trace memory, e.g. to measure only the time.
+    """
+    if trace_memory:
+        _TRACE_MEMORY_LOCK.acquire()
+        if tracemalloc.is_tracing():
+            _TRACE_MEMORY_LOCK.release()
+            trace_memory = False
+    stats = ConversionStats(trace_memory=trace_memory)
+    token = _CONVERSION_STATS.set(stats)
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        yield stats
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+            _TRACE_MEMORY_LOCK.release()
+        _CONVERSION_STATS.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Generator[None, None, None]:
+    """Measure a conversion stage, if stats are being collected."""
+    stats = _CONVERSION_STATS.get()
+    if stats is None:
+        yield
+        return
+    if stats.trace_memory:
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        peak = 0
+        if stats.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] - start_memory
+        stats.add(
+            name=name,
+            wall=time.perf_counter() - start_wall,
+            cpu=time.thread_time() - start_cpu,
+            peak=peak,
+        )
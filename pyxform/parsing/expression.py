@@ -1,5 +1,12 @@
 import re
+import sys
+import warnings
+from collections import OrderedDict
+from collections.abc import Generator, Hashable
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import lru_cache
+from typing import Any
 
 
 def get_lexer_rules():
@@ -58,9 +65,13 @@ def get_lexer_rules():
 
 
 LEXER_RULES = get_lexer_rules()
-RE_ONLY_NCNAME = re.compile(rf"""^{LEXER_RULES["NAME"]}$""")
-RE_ONLY_PYXFORM_REF = re.compile(rf"""^{LEXER_RULES["PYXFORM_REF"]}$""")
-RE_ANY_PYXFORM_REF = re.compile(LEXER_RULES["PYXFORM_REF"])
+# These patterns take a while to compile, so they're compiled on first use.
+_PATTERNS = {
+    "RE_ONLY_NCNAME": rf"""^{LEXER_RULES["NAME"]}$""",
+    "RE_ONLY_PYXFORM_REF": rf"""^{LEXER_RULES["PYXFORM_REF"]}$""",
+    "RE_ANY_PYXFORM_REF": LEXER_RULES["PYXFORM_REF"],
+}
+BRACKETED_TAG_REGEX = re.compile(r"\${(last-saved#)?(.*?)}")
 
 
 def get_expression_lexer() -> re.Scanner:
@@ -86,22 +97,184 @@ class ExpLexerToken:
         self.end: int = end
 
 
-# Scanner takes a few 100ms to compile so use the shared instance.
-_EXPRESSION_LEXER = get_expression_lexer()
+@lru_cache(maxsize=len(_PATTERNS))
+def get_pattern(name: str) -> re.Pattern:
+    """Get a compiled pattern, by module attribute name, e.g. "RE_ONLY_NCNAME"."""
+    return re.compile(_PATTERNS[name])
+
+
+def __getattr__(name: str):
+    if name in _PATTERNS:
+        return get_pattern(name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+# Scanner takes a few 100ms to compile so use the shared instance, compiled on first use.
+@lru_cache(maxsize=1)
+def get_lexer() -> re.Scanner:
+    """Get the shared expression lexer."""
+    return get_expression_lexer()
+
+
+# The default ExpressionCache size, in bytes.
+EXPRESSION_CACHE_SIZE = 32 * 1024 * 1024
+# Estimated size of a token, not including the value string.
+_TOKEN_SIZE = sys.getsizeof(ExpLexerToken("", "", 0, 0)) + 2 * sys.getsizeof(2**16)
+
+
+class ExpressionCache:
+    """
+    A least recently used cache of parsed expressions, for one conversion.
+
+    The cache is bounded by an estimate of the memory used by the cached values, rather
+    than the number of entries, since a form may have thousands of distinct expressions.
+    Use `expression_cache` to set the cache for a conversion.
+    """
+
+    __slots__ = ("_entries", "hits", "max_size", "misses", "size")
+
+    def __init__(self, max_size: int = EXPRESSION_CACHE_SIZE):
+        """
+        :param max_size: The maximum estimated size of the cached values, in bytes.
+        """
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.max_size: int = max_size
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        """Get the cached value for the key, or None if it's not cached."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def add(self, key: Hashable, value: Any, size: int) -> None:
+        """
+        Add the value to the cache, removing the least recently used values if needed.
+
+        :param key: The cache key.
+        :param value: The value to cache.
+        :param size: The estimated size of the value, in bytes.
+        """
+        if self.max_size < size:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous[1]
+        self._entries[key] = (value, size)
+        self.size += size
+        while self.max_size < self.size:
+            _, (_, removed_size) = self._entries.popitem(last=False)
+            self.size -= removed_size
+
+    def resize(self, key: Hashable, value: Any, size: int) -> None:
+        """
+        Update the estimated size of a cached value, e.g. after it was expanded.
+
+        Nothing is done if the value isn't the one cached for the key. If the value is
+        now too large for the cache, it is removed.
+
+        :param key: The cache key.
+        :param value: The cached value.
+        :param size: The new estimated size of the value, in bytes.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not value:
+            return
+        if self.max_size < size:
+            del self._entries[key]
+            self.size -= entry[1]
+            return
+        self.add(key=key, value=value, size=size)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def get_stats(self) -> dict[str, int | float]:
+        """
+        Get the cache statistics.
+
+        :return: The number of "hits" and "misses", the "hit_rate" (0 to 1), and the
+          number of "entries" and their estimated "size" in bytes.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "size": self.size,
+        }
+
+
+_EXPRESSION_CACHE: ContextVar[ExpressionCache | None] = ContextVar(
+    "_EXPRESSION_CACHE", default=None
+)
+
+
+def get_expression_cache() -> ExpressionCache | None:
+    """Get the expression cache for the current conversion, if any."""
+    return _EXPRESSION_CACHE.get()
+
+
+@contextmanager
+def expression_cache(
+    max_size: int = EXPRESSION_CACHE_SIZE,
+) -> Generator[ExpressionCache, None, None]:
+    """
+    Cache parsed expressions for the duration of a conversion.
+
+    If a cache was already set by an outer conversion step, that cache is used, so that
+    e.g. the XLSForm parsing and XForm generation steps of `convert` share one cache.
+    The cache is cleared at the end of the outermost block. May also be used as a
+    function decorator.
+
+    :param max_size: The maximum estimated size of the cached values, in bytes.
+    """
+    current = _EXPRESSION_CACHE.get()
+    if current is not None:
+        yield current
+        return
+    cache = ExpressionCache(max_size=max_size)
+    token = _EXPRESSION_CACHE.set(cache)
+    try:
+        yield cache
+    finally:
+        _EXPRESSION_CACHE.reset(token)
+        cache.clear()
 
 
-@lru_cache(maxsize=128)
 def parse_expression(text: str) -> tuple[list[ExpLexerToken], str]:
     """
     Parse an expression.
 
-    Use this function instead of _EXPRESSION_LEXER to take advantage of caching.
+    Use this function instead of get_lexer to take advantage of caching, within
+    an `expression_cache` block.
 
     :param text: The expression.
     :return: The parsed tokens, and any remaining unparsed text.
     """
-    tokens, remainder = _EXPRESSION_LEXER.scan(text)
-    return tokens, remainder
+    cache = _EXPRESSION_CACHE.get()
+    if cache is None:
+        return get_lexer().scan(text)
+    key = ("tokens", text)
+    result = cache.get(key=key)
+    if result is None:
+        result = get_lexer().scan(text)
+        tokens, remainder = result
+        size = sys.getsizeof(text) + sys.getsizeof(remainder) + sys.getsizeof(tokens)
+        size += sum(_TOKEN_SIZE + sys.getsizeof(t.value) for t in tokens)
+        cache.add(key=key, value=result, size=size)
+    return result
 
 
 def is_pyxform_reference(value: str) -> bool:
@@ -109,24 +282,31 @@ def is_pyxform_reference(value: str) -> bool:
     Does the input string contain only a valid Pyxform reference? e.g. ${my_question}
     """
     # Needs 3 characters for "${}", plus a name inside.
-    return value and len(value) > 3 and bool(RE_ONLY_PYXFORM_REF.match(value))
+    return (
+        value and len(value) > 3 and bool(get_pattern("RE_ONLY_PYXFORM_REF").match(value))
+    )
 
 
 def is_xml_tag(value: str) -> bool:
     """
     Does the input string contain only a valid XML tag / element name?
     """
-    return value and bool(RE_ONLY_NCNAME.match(value))
+    return value and bool(get_pattern("RE_ONLY_NCNAME").match(value))
 
 
 def has_last_saved(value: str) -> bool:
     """
     Does the input string contain a valid '#last-saved' Pyxform reference? e.g. ${last-saved#my_question}
+
+    Deprecated: use `pyxform.parsing.expression_tree.has_last_saved`.
     """
-    # Needs 14 characters for "${last-saved#}", plus a name inside.
-    return (
-        value
-        and len(value) > 14
-        and "${last-saved#" in value
-        and RE_ANY_PYXFORM_REF.search(value)
+    warnings.warn(
+        "pyxform.parsing.expression.has_last_saved will be removed in a future version "
+        "of pyxform. Please use pyxform.parsing.expression_tree.has_last_saved instead.",
+        DeprecationWarning,
+        stacklevel=2,  # level 1 = here, 2 = caller.
     )
+    # Imported here to avoid circular references.
+    from pyxform.parsing.expression_tree import has_last_saved as _has_last_saved
+
+    return _has_last_saved(value)
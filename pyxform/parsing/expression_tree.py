@@ -0,0 +1,412 @@
+"""
+A tree of the parts of an expression, parsed once from the expression lexer tokens.
+
+The checks that pyxform does on expressions (e.g. for pyxform references, or dynamic
+defaults) query an `Expression` from `get_expression`, so each unique expression is
+tokenized and parsed once, and the result of each query is kept with the expression.
+"""
+
+import sys
+from collections.abc import Generator
+
+from pyxform.parsing.expression import (
+    ExpLexerToken,
+    get_expression_cache,
+    parse_expression,
+)
+
+# A match on these lexer rules indicates a dynamic default.
+DYNAMIC_TOKENS = {"OPS_MATH", "OPS_UNION", "XPATH_PRED", "PYXFORM_REF", "FUNC_CALL"}
+# Data types which are likely to have non-dynamic defaults containing a hyphen.
+HYPHENATED_TYPES = {"date", "dateTime", "geopoint", "geotrace", "geoshape"}
+# Lexer rules for the tokens in a location path, other than predicates.
+PATH_TOKENS = {"NAME", "PATH_SEP", "PARENT_REF", "SELF_REF"}
+
+
+class ExpNode:
+    """A part of an expression, from the `start` to the `end` position in the text."""
+
+    __slots__ = ("end", "start")
+
+    def __init__(self, start: int, end: int):
+        self.start: int = start
+        self.end: int = end
+
+    @property
+    def children(self) -> tuple["ExpNode", ...]:
+        return ()
+
+    def get_size(self) -> int:
+        """Estimate the memory used by the node, not including its children."""
+        return sys.getsizeof(self)
+
+
+class TokenNode(ExpNode):
+    """A lexer token that isn't part of a larger node, e.g. an operator or literal."""
+
+    __slots__ = ("token",)
+
+    def __init__(self, token: ExpLexerToken):
+        super().__init__(start=token.start, end=token.end)
+        self.token: ExpLexerToken = token
+
+
+class PyxformReference(ExpNode):
+    """A pyxform reference, e.g. ${name} or ${last-saved#name}."""
+
+    __slots__ = ("last_saved", "name")
+
+    def __init__(self, name: str, last_saved: bool, start: int, end: int):
+        super().__init__(start=start, end=end)
+        self.name: str = name
+        self.last_saved: bool = last_saved
+
+    def get_size(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.name)
+
+
+class InvalidReference(ExpNode):
+    """The start of a pyxform reference "${" that isn't followed by a name and "}"."""
+
+    __slots__ = ()
+
+
+class FunctionCall(ExpNode):
+    """A function call, with the nodes of each argument."""
+
+    __slots__ = ("args", "name")
+
+    def __init__(self, name: str, args: list[list[ExpNode]], start: int, end: int):
+        super().__init__(start=start, end=end)
+        self.name: str = name
+        self.args: list[list[ExpNode]] = args
+
+    @property
+    def children(self) -> tuple[ExpNode, ...]:
+        return tuple(n for arg in self.args for n in arg)
+
+    def get_size(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.name) + sys.getsizeof(self.args)
+        return size + sum(sys.getsizeof(arg) for arg in self.args)
+
+
+class Group(ExpNode):
+    """A parenthesised expression."""
+
+    __slots__ = ("nodes",)
+
+    def __init__(self, nodes: list[ExpNode], start: int, end: int):
+        super().__init__(start=start, end=end)
+        self.nodes: list[ExpNode] = nodes
+
+    @property
+    def children(self) -> tuple[ExpNode, ...]:
+        return tuple(self.nodes)
+
+    def get_size(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.nodes)
+
+
+class Predicate(ExpNode):
+    """A location path step with a predicate, e.g. item[name = 'a']."""
+
+    __slots__ = ("nodes", "step")
+
+    def __init__(self, step: str, nodes: list[ExpNode], start: int, end: int):
+        super().__init__(start=start, end=end)
+        self.step: str = step
+        self.nodes: list[ExpNode] = nodes
+
+    @property
+    def children(self) -> tuple[ExpNode, ...]:
+        return tuple(self.nodes)
+
+    def get_size(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.step)
+        return size + sys.getsizeof(self.nodes)
+
+
+class Path(ExpNode):
+    """A location path, with steps that are path tokens or predicates."""
+
+    __slots__ = ("steps",)
+
+    def __init__(self, steps: list[TokenNode | Predicate]):
+        super().__init__(start=steps[0].start, end=steps[-1].end)
+        self.steps: list[TokenNode | Predicate] = steps
+
+    @property
+    def children(self) -> tuple[ExpNode, ...]:
+        return tuple(self.steps)
+
+    def get_size(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.steps)
+
+
+class _TreeParser:
+    """
+    Parse lexer tokens into a tree of nodes.
+
+    The parser doesn't raise errors: unmatched closing tokens are kept as TokenNodes,
+    and nodes that aren't closed end at the last token.
+    """
+
+    __slots__ = ("pos", "tokens")
+
+    def __init__(self, tokens: list[ExpLexerToken]):
+        self.tokens: list[ExpLexerToken] = tokens
+        self.pos: int = 0
+
+    def parse_nodes(self, stop: set[str] | None = None) -> list[ExpNode]:
+        """Parse nodes until a token in `stop`, which is not consumed, or the end."""
+        nodes = []
+        while self.pos < len(self.tokens):
+            if stop and self.tokens[self.pos].name in stop:
+                break
+            node = self.parse_node()
+            is_step = isinstance(node, Predicate) or (
+                isinstance(node, TokenNode) and node.token.name in PATH_TOKENS
+            )
+            if not is_step:
+                nodes.append(node)
+            elif nodes and isinstance(nodes[-1], Path):
+                nodes[-1].steps.append(node)
+                nodes[-1].end = node.end
+            else:
+                nodes.append(Path(steps=[node]))
+        return nodes
+
+    def parse_node(self) -> ExpNode:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        if token.name == "PYXFORM_REF":
+            last_saved = token.value.startswith("${last-saved#")
+            name = token.value[13 if last_saved else 2 : -1]
+            return PyxformReference(
+                name=name, last_saved=last_saved, start=token.start, end=token.end
+            )
+        elif token.name == "PYXFORM_REF_START":
+            return self._parse_reference_start(token=token)
+        elif token.name == "FUNC_CALL":
+            args = []
+            while self.pos < len(self.tokens):
+                args.append(self.parse_nodes(stop={"COMMA", "CLOSE_PAREN"}))
+                if self.pos < len(self.tokens) and self.tokens[self.pos].name == "COMMA":
+                    self.pos += 1
+                else:
+                    break
+            end = self._close(name="CLOSE_PAREN", args=args)
+            return FunctionCall(
+                name=token.value[:-1], args=args, start=token.start, end=end
+            )
+        elif token.name == "OPEN_PAREN":
+            nodes = self.parse_nodes(stop={"CLOSE_PAREN"})
+            end = self._close(name="CLOSE_PAREN", args=[nodes], default=token.end)
+            return Group(nodes=nodes, start=token.start, end=end)
+        elif token.name == "XPATH_PRED_START":
+            nodes = self.parse_nodes(stop={"XPATH_PRED_END"})
+            end = self._close(name="XPATH_PRED_END", args=[nodes], default=token.end)
+            return Predicate(
+                step=token.value[:-1], nodes=nodes, start=token.start, end=end
+            )
+        else:
+            return TokenNode(token=token)
+
+    def _close(self, name: str, args: list[list[ExpNode]], default: int = 0) -> int:
+        """Consume the closing token if present, and get the end position of the node."""
+        if self.pos < len(self.tokens) and self.tokens[self.pos].name == name:
+            self.pos += 1
+            return self.tokens[self.pos - 1].end
+        ends = [n.end for arg in args for n in arg]
+        if ends:
+            return max(ends)
+        return default or self.tokens[self.pos - 1].end
+
+    def _parse_reference_start(self, token: ExpLexerToken) -> ExpNode:
+        """A reference start "${" is only valid if followed by names and then "}"."""
+        end = self.pos
+        while end < len(self.tokens) and self.tokens[end].name == "NAME":
+            end += 1
+        if end < len(self.tokens) and self.tokens[end].name == "PYXFORM_REF_END":
+            name = "".join(t.value for t in self.tokens[self.pos : end])
+            self.pos = end + 1
+            return PyxformReference(
+                name=name, last_saved=False, start=token.start, end=self.tokens[end].end
+            )
+        return InvalidReference(start=token.start, end=token.end)
+
+
+class Expression:
+    """
+    An expression, parsed into a tree of function calls, paths, predicates, and pyxform
+    references.
+
+    The tokens and tree are parsed when first needed, and each query result is kept, so
+    use `get_expression` to take advantage of caching.
+    """
+
+    __slots__ = (
+        "_bracketed_references",
+        "_has_invalid_reference",
+        "_nodes",
+        "_tokens",
+        "text",
+    )
+
+    def __init__(self, text: str):
+        self.text: str = text
+        self._tokens: list[ExpLexerToken] | None = None
+        self._nodes: list[ExpNode] | None = None
+        self._bracketed_references: list[PyxformReference] | None = None
+        self._has_invalid_reference: bool | None = None
+
+    @property
+    def tokens(self) -> list[ExpLexerToken]:
+        if self._tokens is None:
+            self._tokens, _ = parse_expression(self.text)
+        return self._tokens
+
+    @property
+    def nodes(self) -> list[ExpNode]:
+        """The top level nodes of the expression tree."""
+        if self._nodes is None:
+            self._nodes = _TreeParser(tokens=self.tokens).parse_nodes()
+            self._update_cache_size()
+        return self._nodes
+
+    def iter_nodes(self) -> Generator[ExpNode, None, None]:
+        """Iterate over all nodes in the tree, depth first."""
+        stack = list(reversed(self.nodes))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    @property
+    def references(self) -> list[PyxformReference]:
+        """The pyxform references in the tree (not including any in string literals)."""
+        return [n for n in self.iter_nodes() if isinstance(n, PyxformReference)]
+
+    @property
+    def bracketed_references(self) -> list[PyxformReference]:
+        """
+        The pyxform references, including any in string literals, for replacing the
+        references with xpaths. The positions are relative to the start of the text.
+        """
+        if self._bracketed_references is None:
+            if "${" in self.text:
+                self._bracketed_references = list(self._iter_bracketed_references())
+                self._update_cache_size()
+            else:
+                self._bracketed_references = []
+        return self._bracketed_references
+
+    def _iter_bracketed_references(self) -> Generator[PyxformReference, None, None]:
+        for node in self.iter_nodes():
+            if isinstance(node, PyxformReference):
+                yield node
+            elif (
+                isinstance(node, TokenNode)
+                and node.token.name == "SYSTEM_LITERAL"
+                and "${" in node.token.value
+            ):
+                # The literal content is parsed as an expression, without the quotes.
+                offset = node.start + 1
+                literal = get_expression(node.token.value[1:-1])
+                for ref in literal.bracketed_references:
+                    yield PyxformReference(
+                        name=ref.name,
+                        last_saved=ref.last_saved,
+                        start=ref.start + offset,
+                        end=ref.end + offset,
+                    )
+
+    def has_invalid_reference(self) -> bool:
+        """Does the expression have a "${" that isn't followed by a name and "}"?"""
+        if self._has_invalid_reference is None:
+            # Only build the tree if there is a reference start token.
+            self._has_invalid_reference = any(
+                t.name == "PYXFORM_REF_START" for t in self.tokens
+            ) and any(isinstance(n, InvalidReference) for n in self.iter_nodes())
+        return self._has_invalid_reference
+
+    def has_last_saved(self) -> bool:
+        """
+        Does the expression contain a valid '#last-saved' Pyxform reference?
+        e.g. ${last-saved#my_question}
+        """
+        return "${last-saved#" in self.text and any(
+            r.last_saved for r in self.bracketed_references
+        )
+
+    def is_dynamic(self, element_type: str | None = None) -> bool:
+        """
+        Is the expression a dynamic value, for a default?
+
+        Dynamic value for now is defined as:
+        * Contains arithmetic operator, including 'div' and 'mod' (except '-' for 'date' type).
+        * Contains brackets, parentheses or braces.
+        """
+        for t in self.tokens:
+            if t.name in DYNAMIC_TOKENS:
+                return not (
+                    element_type in HYPHENATED_TYPES
+                    and t.name == "OPS_MATH"
+                    and t.value == "-"
+                )
+        return False
+
+    def get_size(self) -> int:
+        """Estimate the memory used by the expression, not including the tokens."""
+        size = _EXPRESSION_SIZE + sys.getsizeof(self.text)
+        if self._nodes is not None:
+            size += sys.getsizeof(self._nodes)
+            size += sum(n.get_size() for n in self.iter_nodes())
+        if self._bracketed_references:
+            # Slightly overestimated, since the references outside of string literals
+            # are also counted as tree nodes.
+            size += sys.getsizeof(self._bracketed_references)
+            size += sum(r.get_size() for r in self._bracketed_references)
+        return size
+
+    def _update_cache_size(self) -> None:
+        """Update the size of the cache entry, after parsing the tree or references."""
+        cache = get_expression_cache()
+        if cache is not None:
+            cache.resize(key=("expression", self.text), value=self, size=self.get_size())
+
+
+_EXPRESSION_SIZE = sys.getsizeof(Expression(text=""))
+
+
+def get_expression(text: str) -> Expression:
+    """
+    Get the parsed expression for the text.
+
+    Use this function instead of Expression() to take advantage of caching, within an
+    `expression_cache` block.
+    """
+    cache = get_expression_cache()
+    if cache is None:
+        return Expression(text=text)
+    key = ("expression", text)
+    expression = cache.get(key=key)
+    if expression is None:
+        expression = Expression(text=text)
+        # The tokens are counted in their own cache entry. The tree is parsed when first
+        # needed, and then the size of this entry is updated.
+        cache.add(key=key, value=expression, size=expression.get_size())
+    return expression
+
+
+def has_last_saved(value: str) -> bool:
+    """
+    Does the input string contain a valid '#last-saved' Pyxform reference? e.g. ${last-saved#my_question}
+    """
+    # Needs 14 characters for "${last-saved#}", plus a name inside.
+    return (
+        value
+        and len(value) > 14
+        and "${last-saved#" in value
+        and get_expression(value).has_last_saved()
+    )
@@ -1,7 +1,6 @@
 from typing import TYPE_CHECKING
 
-from pyxform.parsing.expression import parse_expression
-from pyxform.utils import BRACKETED_TAG_REGEX, node
+from pyxform.parsing.expression_tree import get_expression
 
 if TYPE_CHECKING:
     from pyxform.survey import Survey
@@ -19,9 +18,9 @@ def find_boundaries(xml_text: str) -> list[tuple[int, int]]:
     - instance expressions are valid inside predicates of other instance expressions.
 
     :param xml_text: XML text that may contain an instance expression.
-    :return: Tokens in instance expression, and the string position boundaries.
+    :return: The string position boundaries of each instance expression.
     """
-    tokens, _ = parse_expression(xml_text)
+    tokens = get_expression(xml_text).tokens
     if not tokens:
         return []
     instance_enter = False
@@ -89,38 +88,38 @@ def find_boundaries(xml_text: str) -> list[tuple[int, int]]:
     return pos_bounds
 
 
-def replace_with_output(xml_text: str, context: "SurveyElement", survey: "Survey") -> str:
+def split_with_output(
+    xml_text: str, context: "SurveyElement", survey: "Survey"
+) -> list[tuple[str, bool]]:
     """
-    Find occurrences of instance expressions and replace them with <output/> elements.
+    Split the text into parts, with instance expressions replaced by <output/> values.
 
-    :param xml_text: The text string to search/replace.
+    :param xml_text: The text string to search.
     :param context: The SurveyElement that this string belongs to.
     :param survey: The Survey that the context is in.
-    :return: The possibly modified string.
+    :return: Pairs of (text, False) for unchanged text, and (value, True) for the value
+      of an <output/> element that replaces an instance expression.
     """
     # 9 = len("instance(")
     if 9 >= len(xml_text):
-        return xml_text
-    boundaries = find_boundaries(xml_text=xml_text)
-    if boundaries:
-        new_strings = []
-        for start, end in boundaries:
-            old_str = xml_text[start:end]
-            # Pass the new string through the pyxform reference replacer.
+        return [(xml_text, False)]
+    parts = []
+    last = 0
+    for start, end in find_boundaries(xml_text=xml_text):
+        if last < start:
+            parts.append((xml_text[last:start], False))
+        # Pass the new string through the pyxform reference replacer.
+        text = xml_text[start:end]
+        new_parts = []
+        text_last = 0
+        for reference in get_expression(text).bracketed_references:
+            new_parts.append(text[text_last : reference.start])
             # noinspection PyProtectedMember
-            new_str = BRACKETED_TAG_REGEX.sub(
-                lambda m: survey._var_repl_function(m, context),
-                old_str,
-            )
-            # Generate a node so that character escapes are applied.
-            new_strings.append(
-                (start, end, old_str, node("output", value=new_str).toxml())
-            )
-        # Position-based replacement avoids strings which are substrings of other
-        # replacements being inserted incorrectly. Offset tracking deals with changing
-        # expression positions due to incremental replacement.
-        offset = 0
-        for s, e, o, n in new_strings:
-            xml_text = f"{xml_text[: s + offset]}{n}{xml_text[e + offset :]}"
-            offset += len(n) - len(o)
-    return xml_text
+            new_parts.append(survey._var_repl_function(reference, text, context))
+            text_last = reference.end
+        new_parts.append(text[text_last:])
+        parts.append(("".join(new_parts), True))
+        last = end
+    if last < len(xml_text) or not parts:
+        parts.append((xml_text[last:], False))
+    return parts
@@ -138,7 +138,7 @@ class Section(SurveyElement):
                 )
             if append_template and repeating_template:
                 append_template = not append_template
-                result.insertBefore(repeating_template, result._get_lastChild())
+                result.insertBefore(repeating_template, result.lastChild)
         return result
 
     def generate_repeating_template(self, survey: "Survey", **kwargs):
@@ -4,7 +4,8 @@ Survey module with XForm Survey objects and utility functions.
 
 import os
 import re
-import tempfile
+import shutil
+import warnings
 import xml.etree.ElementTree as ETree
 from collections import defaultdict
 from collections.abc import Generator, Iterable
@@ -15,11 +16,17 @@ from pathlib import Path
 
 from pyxform import aliases, constants
 from pyxform.constants import EXTERNAL_INSTANCE_EXTENSIONS, NSMAP
+from pyxform.conversion_stats import STAGE_VALIDATE, STAGE_XML, stage
 from pyxform.errors import PyXFormError, ValidationError
 from pyxform.external_instance import ExternalInstance
 from pyxform.instance import SurveyInstance
-from pyxform.parsing.expression import has_last_saved
-from pyxform.parsing.instance_expression import replace_with_output
+from pyxform.parsing.expression import expression_cache
+from pyxform.parsing.expression_tree import (
+    PyxformReference,
+    get_expression,
+    has_last_saved,
+)
+from pyxform.parsing.instance_expression import split_with_output
 from pyxform.question import MultipleChoiceQuestion, Option, Question, Tag
 from pyxform.section import SECTION_EXTRA_FIELDS, Section
 from pyxform.survey_element import SURVEY_ELEMENT_FIELDS, SurveyElement
@@ -27,12 +34,14 @@ from pyxform.utils import (
     BRACKETED_TAG_REGEX,
     LAST_SAVED_INSTANCE_NAME,
     DetachableElement,
+    EscapedText,
+    as_text_stream,
     escape_text_for_xml,
     has_dynamic_label,
     node,
 )
-from pyxform.validators import enketo_validate, odk_validate
 from pyxform.validators.pyxform.iana_subtags.validation import get_languages_with_bad_tags
+from pyxform.validators.util import check_xform_file, temp_xform_path
 
 RE_BRACKET = re.compile(r"\[([^]]+)\]")
 RE_FUNCTION_ARGS = re.compile(r"\b[^()]+\((.*)\)$")
@@ -41,6 +50,7 @@ RE_INSTANCE = re.compile(r"instance\([^)]+.+")
 RE_INSTANCE_SECONDARY_REF = re.compile(
     r"(instance\(.*\)\/root\/item\[.*?(\$\{.*\})\]\/.*?)\s"
 )
+RE_OUTPUT_VALUE_WHITESPACE = re.compile(r"\r\n|[\t\n\r]")
 RE_PULLDATA = re.compile(r"(pulldata\s*\(\s*)(.*?),")
 SEARCH_FUNCTION_REGEX = re.compile(r"search\(.*?\)")
 
@@ -75,99 +85,269 @@ def register_nsmap():
 register_nsmap()
 
 
-@lru_cache(maxsize=128)
-def is_parent_a_repeat(survey, xpath):
+class ReferenceIndex:
     """
-    Returns the XPATH of the first repeat of the given xpath in the survey,
-    otherwise False will be returned.
+    Lookups for resolving ${name} references, built once per Survey.xml().
+
+    Relative path queries are answered from the index and memoised, rather than by
+    searching the survey for each reference, so the cost of resolving a reference
+    doesn't grow with the size of the form.
     """
-    parent_xpath = "/".join(xpath.split("/")[:-1])
-    if not parent_xpath:
-        return False
 
-    for item in survey.iter_descendants(condition=lambda i: isinstance(i, Section)):
-        if item.type == constants.REPEAT and item.get_xpath() == parent_xpath:
-            return parent_xpath
+    __slots__ = (
+        "_inserted_xpaths",
+        "_relative_paths",
+        "_repeat_ancestors",
+        "_repeat_parents",
+        "_segments",
+        "elements",
+        "inserted_xpaths_hits",
+        "inserted_xpaths_misses",
+        "repeat_xpaths",
+    )
 
-    return is_parent_a_repeat(survey, parent_xpath)
+    def __init__(self, survey: "Survey"):
+        # The element for each name, or None if more than one element has the name.
+        self.elements: dict[str, Section | Question | None] = survey._xpath
+        self.repeat_xpaths: set[str] = {
+            item.get_xpath()
+            for item in survey.iter_descendants(
+                condition=lambda i: isinstance(i, Section)
+            )
+            if item.type == constants.REPEAT
+        }
+        # Survey.insert_xpaths results, and the memo statistics.
+        self._inserted_xpaths: dict[tuple[str, str | None, bool, bool], str] = {}
+        self.inserted_xpaths_hits: int = 0
+        self.inserted_xpaths_misses: int = 0
+        self._relative_paths: dict[tuple[str, str, bool], tuple] = {}
+        self._repeat_ancestors: dict[int, frozenset[int]] = {}
+        self._repeat_parents: dict[str, str | bool] = {}
+        self._segments: dict[str, list[str]] = {}
+
+    def get_inserted_xpaths(self, key: tuple[str, str | None, bool, bool]) -> str | None:
+        """Get the memoised Survey.insert_xpaths result for the key, if any."""
+        result = self._inserted_xpaths.get(key)
+        if result is None:
+            self.inserted_xpaths_misses += 1
+        else:
+            self.inserted_xpaths_hits += 1
+        return result
 
+    def set_inserted_xpaths(self, key: tuple[str, str | None, bool, bool], value: str):
+        self._inserted_xpaths[key] = value
 
-@lru_cache(maxsize=128)
-def share_same_repeat_parent(survey, xpath, context_xpath, reference_parent=False):
-    """
-    Returns a tuple of the number of steps from the context xpath to the shared
-    repeat parent and the xpath to the target xpath from the shared repeat
-    parent.
+    def get_xpath_segments(self, xpath: str) -> list[str]:
+        """Get the xpath split on "/". The result should not be modified."""
+        segments = self._segments.get(xpath)
+        if segments is None:
+            segments = xpath.split("/")
+            self._segments[xpath] = segments
+        return segments
 
-    For example,
-        xpath =         /data/repeat_a/group_a/name
-        context_xpath = /data/repeat_a/group_b/age
+    def get_repeat_parent(self, xpath: str) -> str | bool:
+        """
+        Returns the XPATH of the first repeat of the given xpath in the survey,
+        otherwise False will be returned.
+        """
+        repeat_parent = self._repeat_parents.get(xpath)
+        if repeat_parent is None:
+            parent_xpath = xpath.rpartition("/")[0]
+            if not parent_xpath:
+                repeat_parent = False
+            elif parent_xpath in self.repeat_xpaths:
+                repeat_parent = parent_xpath
+            else:
+                repeat_parent = self.get_repeat_parent(parent_xpath)
+            self._repeat_parents[xpath] = repeat_parent
+        return repeat_parent
+
+    def _get_repeat_ancestors(self, element: SurveyElement) -> frozenset[int]:
+        """Get the ids of the repeats that are ancestors of the element."""
+        ancestors = self._repeat_ancestors.get(id(element))
+        if ancestors is None:
+            parent = element.parent
+            if parent is None:
+                ancestors = frozenset()
+            elif parent.type == constants.REPEAT:
+                ancestors = self._get_repeat_ancestors(parent) | {id(parent)}
+            else:
+                ancestors = self._get_repeat_ancestors(parent)
+            self._repeat_ancestors[id(element)] = ancestors
+        return ancestors
 
-        returns (2, '/group_a/name')'
-    """
+    def is_related(self, element: SurveyElement, other: SurveyElement) -> bool:
+        """
+        Check if the elements are parent and child, or have a common repeat ancestor.
+        """
+        if element.parent is other or other.parent is element:
+            return True
+        return not self._get_repeat_ancestors(element).isdisjoint(
+            self._get_repeat_ancestors(other)
+        )
 
-    def _get_steps_and_target_xpath(context_parent, xpath_parent, include_parent=False):
-        parts = []
-        steps = 1
-        if not include_parent:
-            remainder_xpath = xpath[len(xpath_parent) :]
-            context_parts = context_xpath[len(xpath_parent) + 1 :].split("/")
-            xpath_parts = xpath[len(xpath_parent) + 1 :].split("/")
-        else:
-            split_idx = len(xpath_parent.split("/"))
-            context_parts = context_xpath.split("/")[split_idx - 1 :]
-            xpath_parts = xpath.split("/")[split_idx - 1 :]
-            remainder_xpath = "/".join(xpath_parts)
+    @staticmethod
+    def get_common_repeat_parent(
+        element: SurveyElement, other: SurveyElement
+    ) -> tuple[str, int | None, SurveyElement | None]:
+        """
+        Get the relation type, steps (generations), and the common ancestor.
 
-        for index, item in enumerate(context_parts[:-1]):
-            try:
-                if xpath[len(context_parent) + 1 :].split("/")[index] != item:
-                    steps = len(context_parts[index:])
-                    parts = xpath_parts[index:]
-                    break
-                else:
-                    parts = remainder_xpath.split("/")[index + 2 :]
-            except IndexError:
-                steps = len(context_parts[index - 1 :])
-                parts = xpath_parts[index - 1 :]
-                break
-        return (steps, f"""/{"/".join(parts)}""" if parts else remainder_xpath)
-
-    context_parent = is_parent_a_repeat(survey, context_xpath)
-    xpath_parent = is_parent_a_repeat(survey, xpath)
-    if context_parent and xpath_parent and xpath_parent in context_parent:
-        if (not context_parent == xpath_parent and reference_parent) or bool(
-            is_parent_a_repeat(survey, context_parent)
-        ):
-            context_shared_ancestor = is_parent_a_repeat(survey, context_parent)
-            if context_shared_ancestor == xpath_parent:
-                # Check if context_parent is a child repeat of the xpath_parent
-                # If the context_parent is a child of the xpath_parent reference the entire
-                # xpath_parent in the generated nodeset
-                context_parent = context_shared_ancestor
-            elif context_parent == xpath_parent and context_shared_ancestor:
-                # If the context_parent is a child of another
-                # repeat and is equal to the xpath_parent
-                # we avoid refrencing the context_parent and instead reference the shared
-                # ancestor
-                reference_parent = False
-        return _get_steps_and_target_xpath(context_parent, xpath_parent, reference_parent)
-    elif context_parent and xpath_parent:
-        # Check if context_parent and xpath_parent share a common
-        # repeat ancestor
-        context_shared_ancestor = is_parent_a_repeat(survey, context_parent)
-        xpath_shared_ancestor = is_parent_a_repeat(survey, xpath_parent)
-
-        if (
-            xpath_shared_ancestor
-            and context_shared_ancestor
-            and xpath_shared_ancestor == context_shared_ancestor
+        Use `is_related` to only check if there is a relation.
+        """
+        if element.parent is other:
+            return "Parent (other)", 1, other
+        elif other.parent is element:
+            return "Parent (self)", 1, element
+        other_distances = {}
+        distance = 0
+        current = other.parent
+        while current is not None:
+            distance += 1
+            other_distances[current] = distance
+            current = current.parent
+        # The first match up from the element is the closest common repeat.
+        distance = 0
+        current = element.parent
+        while current is not None:
+            distance += 1
+            if current.type == constants.REPEAT and current in other_distances:
+                steps = max(distance, other_distances[current])
+                return "Common Ancestor Repeat", steps, current
+            current = current.parent
+        return "Unrelated", None, None
+
+    def share_same_repeat_parent(
+        self, xpath: str, context_xpath: str, reference_parent: bool = False
+    ) -> tuple[int | None, str | None]:
+        """
+        Returns a tuple of the number of steps from the context xpath to the shared
+        repeat parent and the xpath to the target xpath from the shared repeat
+        parent.
+
+        For example,
+            xpath =         /data/repeat_a/group_a/name
+            context_xpath = /data/repeat_a/group_b/age
+
+            returns (2, '/group_a/name')'
+        """
+        key = (xpath, context_xpath, reference_parent)
+        result = self._relative_paths.get(key)
+        if result is None:
+            result = self._share_same_repeat_parent(
+                xpath=xpath,
+                context_xpath=context_xpath,
+                reference_parent=reference_parent,
+            )
+            self._relative_paths[key] = result
+        return result
+
+    def _share_same_repeat_parent(self, xpath, context_xpath, reference_parent):
+        def _get_steps_and_target_xpath(
+            context_parent, xpath_parent, include_parent=False
         ):
+            parts = []
+            steps = 1
+            if not include_parent:
+                remainder_xpath = xpath[len(xpath_parent) :]
+                context_parts = context_xpath[len(xpath_parent) + 1 :].split("/")
+                xpath_parts = xpath[len(xpath_parent) + 1 :].split("/")
+            else:
+                split_idx = len(xpath_parent.split("/"))
+                context_parts = context_xpath.split("/")[split_idx - 1 :]
+                xpath_parts = xpath.split("/")[split_idx - 1 :]
+                remainder_xpath = "/".join(xpath_parts)
+
+            for index, item in enumerate(context_parts[:-1]):
+                try:
+                    if xpath[len(context_parent) + 1 :].split("/")[index] != item:
+                        steps = len(context_parts[index:])
+                        parts = xpath_parts[index:]
+                        break
+                    else:
+                        parts = remainder_xpath.split("/")[index + 2 :]
+                except IndexError:
+                    steps = len(context_parts[index - 1 :])
+                    parts = xpath_parts[index - 1 :]
+                    break
+            return (steps, f"""/{"/".join(parts)}""" if parts else remainder_xpath)
+
+        context_parent = self.get_repeat_parent(context_xpath)
+        xpath_parent = self.get_repeat_parent(xpath)
+        if context_parent and xpath_parent and xpath_parent in context_parent:
+            if (not context_parent == xpath_parent and reference_parent) or bool(
+                self.get_repeat_parent(context_parent)
+            ):
+                context_shared_ancestor = self.get_repeat_parent(context_parent)
+                if context_shared_ancestor == xpath_parent:
+                    # Check if context_parent is a child repeat of the xpath_parent
+                    # If the context_parent is a child of the xpath_parent reference the entire
+                    # xpath_parent in the generated nodeset
+                    context_parent = context_shared_ancestor
+                elif context_parent == xpath_parent and context_shared_ancestor:
+                    # If the context_parent is a child of another
+                    # repeat and is equal to the xpath_parent
+                    # we avoid refrencing the context_parent and instead reference the shared
+                    # ancestor
+                    reference_parent = False
             return _get_steps_and_target_xpath(
-                context_shared_ancestor, xpath_shared_ancestor
+                context_parent, xpath_parent, reference_parent
             )
+        elif context_parent and xpath_parent:
+            # Check if context_parent and xpath_parent share a common
+            # repeat ancestor
+            context_shared_ancestor = self.get_repeat_parent(context_parent)
+            xpath_shared_ancestor = self.get_repeat_parent(xpath_parent)
+
+            if (
+                xpath_shared_ancestor
+                and context_shared_ancestor
+                and xpath_shared_ancestor == context_shared_ancestor
+            ):
+                return _get_steps_and_target_xpath(
+                    context_shared_ancestor, xpath_shared_ancestor
+                )
+
+        return (None, None)
+
+
+def is_parent_a_repeat(survey: "Survey", xpath: str) -> str | bool:
+    """
+    Returns the XPATH of the first repeat of the given xpath in the survey,
+    otherwise False will be returned.
+
+    Deprecated: use `ReferenceIndex.get_repeat_parent`.
+    """
+    warnings.warn(
+        "pyxform.survey.is_parent_a_repeat will be removed in a future version of "
+        "pyxform. Please use ReferenceIndex.get_repeat_parent instead.",
+        DeprecationWarning,
+        stacklevel=2,  # level 1 = here, 2 = caller.
+    )
+    # noinspection PyProtectedMember
+    return survey._get_references().get_repeat_parent(xpath)
+
+
+def share_same_repeat_parent(
+    survey: "Survey", xpath: str, context_xpath: str, reference_parent: bool = False
+) -> tuple[int | None, str | None]:
+    """
+    Returns a tuple of the number of steps from the context xpath to the shared
+    repeat parent and the xpath to the target xpath from the shared repeat
+    parent.
 
-    return (None, None)
+    Deprecated: use `ReferenceIndex.share_same_repeat_parent`.
+    """
+    warnings.warn(
+        "pyxform.survey.share_same_repeat_parent will be removed in a future version of "
+        "pyxform. Please use ReferenceIndex.share_same_repeat_parent instead.",
+        DeprecationWarning,
+        stacklevel=2,  # level 1 = here, 2 = caller.
+    )
+    # noinspection PyProtectedMember
+    return survey._get_references().share_same_repeat_parent(
+        xpath=xpath, context_xpath=context_xpath, reference_parent=reference_parent
+    )
 
 
 @lru_cache(maxsize=128)
@@ -179,6 +359,34 @@ def is_label_dynamic(label: str) -> bool:
     )
 
 
+def _get_output_nodes(parts: list[tuple[str, bool]]) -> list:
+    """
+    Get the text nodes and <output/> elements for the text parts and output values.
+
+    The result is the same as if the parts were joined and parsed as XML: the text is
+    unescaped with normalised line endings, and the value whitespace is normalised.
+    """
+    content = []
+    text = ""
+    for value, is_output in parts:
+        if not is_output:
+            text += value
+            continue
+        if text:
+            content.append(EscapedText(_get_parsed_text(xml_text=text)))
+            text = ""
+        content.append(node("output", value=RE_OUTPUT_VALUE_WHITESPACE.sub(" ", value)))
+    if text:
+        content.append(EscapedText(_get_parsed_text(xml_text=text)))
+    return content
+
+
+def _get_parsed_text(xml_text: str) -> str:
+    # Same as xml.sax.saxutils.unescape, which is slow to import.
+    text = xml_text.replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
 def recursive_dict():
     return defaultdict(recursive_dict)
 
@@ -220,6 +428,8 @@ SURVEY_EXTRA_FIELDS = (
     constants.ENTITY_FEATURES,
 )
 SURVEY_FIELDS = (*SURVEY_ELEMENT_FIELDS, *SECTION_EXTRA_FIELDS, *SURVEY_EXTRA_FIELDS)
+# Internal state that is not a survey field, so it isn't copied or output as JSON.
+SURVEY_EXTRA_SLOTS = ("_references",)
 
 
 class Survey(Section):
@@ -227,7 +437,7 @@ class Survey(Section):
     Survey class - represents the full XForm XML.
     """
 
-    __slots__ = SURVEY_EXTRA_FIELDS
+    __slots__ = (*SURVEY_EXTRA_FIELDS, *SURVEY_EXTRA_SLOTS)
 
     @staticmethod
     def get_slot_names() -> tuple[str, ...]:
@@ -239,6 +449,7 @@ class Survey(Section):
         self._search_lists: set = set()
         self._translations: recursive_dict = recursive_dict()
         self._xpath: dict[str, Section | Question | None] = {}
+        self._references: ReferenceIndex | None = None
 
         # Structure
         # attribute is for custom instance attrs from settings e.g. attribute::abc:xyz
@@ -346,6 +557,7 @@ class Survey(Section):
 
         return NSMAP
 
+    @expression_cache()
     def xml(self):
         """
         calls necessary preparation methods, then returns the xml.
@@ -1058,25 +1270,26 @@ class Survey(Section):
                     if media_type == constants.TYPE:
                         continue
                     if isinstance(media_value, dict):
-                        value, output_inserted = self.insert_output_values(
-                            media_value["text"], context=media_value["output_context"]
-                        )
+                        value = media_value["text"]
+                        output_context = media_value["output_context"]
                     else:
-                        value, output_inserted = self.insert_output_values(media_value)
+                        value, output_context = media_value, None
 
                     if label_type == "hint":
                         if media_type == "guidance":
                             itext_nodes.append(
                                 node(
                                     "value",
-                                    value,
+                                    *self.get_output_content(value, output_context),
                                     form="guidance",
-                                    toParseString=output_inserted,
                                 )
                             )
                         else:
                             itext_nodes.append(
-                                node("value", value, toParseString=output_inserted)
+                                node(
+                                    "value",
+                                    *self.get_output_content(value, output_context),
+                                )
                             )
                         continue
 
@@ -1084,34 +1297,35 @@ class Survey(Section):
                         # I'm ignoring long types for now because I don't know
                         # how they are supposed to work.
                         itext_nodes.append(
-                            node("value", value, toParseString=output_inserted)
+                            node("value", *self.get_output_content(value, output_context))
                         )
                     elif media_type in {"image", "big-image"}:
                         if value != "-":
                             itext_nodes.append(
                                 node(
                                     "value",
-                                    f"jr://images/{value}",
+                                    *self.get_output_content(
+                                        value, output_context, prefix="jr://images/"
+                                    ),
                                     form=media_type,
-                                    toParseString=output_inserted,
                                 )
                             )
                     elif media_type == "image-description":
                         itext_nodes.append(
                             node(
                                 "value",
-                                value,
+                                *self.get_output_content(value, output_context),
                                 form=media_type,
-                                toParseString=output_inserted,
                             )
                         )
                     elif value != "-":
                         itext_nodes.append(
                             node(
                                 "value",
-                                f"jr://{media_type}/{value}",
+                                *self.get_output_content(
+                                    value, output_context, prefix=f"jr://{media_type}/"
+                                ),
                                 form=media_type,
-                                toParseString=output_inserted,
                             )
                         )
 
@@ -1126,6 +1340,26 @@ class Survey(Section):
     def _to_ugly_xml(self) -> str:
         return f"""<?xml version="1.0"?>{self.xml().toxml()}"""
 
+    def write_xml(self, fp, pretty_print: bool = True) -> None:
+        """
+        Write the XForm to a stream, element by element.
+
+        The output is the same as for `to_xml`, but the XForm text is written as it is
+        generated, rather than held in memory all at once.
+
+        :param fp: A text stream, or a binary stream to write UTF-8 text to, e.g. a file,
+          socket file, or gzip file.
+        :param pretty_print: If True, format the XML for readability.
+        """
+        with as_text_stream(fp) as writer:
+            root = self.xml()
+            if pretty_print:
+                writer.write("""<?xml version="1.0"?>\n""")
+                root.writexml(writer, "", "  ", "\n")
+            else:
+                writer.write("""<?xml version="1.0"?>""")
+                root.writexml(writer, "", "", "")
+
     def _to_pretty_xml(self) -> str:
         """Get the XForm with human readable formatting."""
         return f"""<?xml version="1.0"?>\n{self.xml().toprettyxml(indent="  ")}"""
@@ -1143,32 +1377,38 @@ class Survey(Section):
                 self._xpath[element_name] = None
             else:
                 self._xpath[element_name] = element
+        self._references = ReferenceIndex(survey=self)
 
     def _var_repl_function(
-        self, matchobj, context, use_current=False, reference_parent=False
+        self,
+        reference: PyxformReference,
+        text: str,
+        context,
+        use_current=False,
+        reference_parent=False,
     ):
         """
         Given a dictionary of xpaths, return a function we can use to
         replace ${varname} with the xpath to varname.
         """
 
-        name = matchobj.group(2)
-        last_saved = matchobj.group(1) is not None
-        is_indexed_repeat = matchobj.string.find("indexed-repeat(") > -1
+        name = reference.name
+        last_saved = reference.last_saved
+        is_indexed_repeat = text.find("indexed-repeat(") > -1
 
         def _in_secondary_instance_predicate() -> bool:
             """
-            check if ${} expression represented by matchobj
+            check if ${} expression represented by reference
             is in a predicate for a path expression for a secondary instance
             """
 
-            if RE_INSTANCE.search(matchobj.string) is not None:
-                bracket_regex_match_iter = RE_BRACKET.finditer(matchobj.string)
+            if RE_INSTANCE.search(text) is not None:
+                bracket_regex_match_iter = RE_BRACKET.finditer(text)
                 # Check whether current ${varname} is in the correct bracket_regex_match
                 for bracket_regex_match in bracket_regex_match_iter:
                     if (
-                        matchobj.start() >= bracket_regex_match.start()
-                        and matchobj.end() <= bracket_regex_match.end()
+                        reference.start >= bracket_regex_match.start()
+                        and reference.end <= bracket_regex_match.end()
                     ):
                         return True
                 return False
@@ -1177,21 +1417,20 @@ class Survey(Section):
         def _relative_path(ref_name: str, _use_current: bool) -> str | None:
             """Given name in ${name}, return relative xpath to ${name}."""
             return_path = None
+            references = self._get_references()
             xpath = self._xpath[ref_name].get_xpath()
             context_xpath = context.get_xpath()
+            xpath_segments = references.get_xpath_segments(xpath)
+            context_segments = references.get_xpath_segments(context_xpath)
             # share same root i.e repeat_a from /data/repeat_a/...
-            if (
-                len(context_xpath.split("/")) > 2
-                and xpath.split("/")[2] == context_xpath.split("/")[2]
-            ):
+            if len(context_segments) > 2 and xpath_segments[2] == context_segments[2]:
                 # if context xpath and target xpath fall under the same
                 # repeat use relative xpath referencing.
-                relation = context.has_common_repeat_parent(self._xpath[ref_name])
-                if relation[0] == "Unrelated":
+                if not references.is_related(context, self._xpath[ref_name]):
                     return return_path
                 else:
-                    steps, ref_path = share_same_repeat_parent(
-                        self, xpath, context_xpath, reference_parent
+                    steps, ref_path = references.share_same_repeat_parent(
+                        xpath, context_xpath, reference_parent
                     )
                     if steps:
                         ref_path = ref_path if ref_path.endswith(ref_name) else f"/{name}"
@@ -1203,17 +1442,16 @@ class Survey(Section):
         def _is_return_relative_path() -> bool:
             """Determine condition to return relative xpath of current ${name}."""
             indexed_repeat_relative_path_args_index = [0, 1, 3, 5]
-            current_matchobj = matchobj
 
             if not last_saved and context:
                 if not is_indexed_repeat:
                     return True
 
                 # It is possible to have multiple indexed-repeat in an expression
-                indexed_repeats_iter = RE_INDEXED_REPEAT.finditer(matchobj.string)
+                indexed_repeats_iter = RE_INDEXED_REPEAT.finditer(text)
                 for indexed_repeat in indexed_repeats_iter:
                     # Make sure current ${name} is in the correct indexed-repeat
-                    if current_matchobj.end() > indexed_repeat.end():
+                    if reference.end > indexed_repeat.end():
                         try:
                             next(indexed_repeats_iter)
                             continue
@@ -1222,8 +1460,8 @@ class Survey(Section):
 
                     # ${name} outside of indexed-repeat always using relative path
                     if (
-                        current_matchobj.end() < indexed_repeat.start()
-                        or current_matchobj.start() > indexed_repeat.end()
+                        reference.end < indexed_repeat.start()
+                        or reference.start > indexed_repeat.end()
                     ):
                         return True
 
@@ -1247,7 +1485,8 @@ class Survey(Section):
             return False
 
         intro = (
-            f"There has been a problem trying to replace {matchobj.group(0)} with the "
+            f"There has been a problem trying to replace "
+            f"{text[reference.start : reference.end]} with the "
             f"XPath to the survey element named '{name}'."
         )
         if name not in self._xpath:
@@ -1278,64 +1517,165 @@ class Survey(Section):
     ):
         """
         Replace all instances of ${var} with the xpath to var.
-        """
 
-        def _var_repl_function(matchobj):
-            return self._var_repl_function(
-                matchobj, context, use_current, reference_parent
-            )
+        Results are memoised per XForm generation. A relative xpath depends on where the
+        context is in its repeat, so the context xpath is part of the memo key if the
+        context is in a repeat. Otherwise, the xpaths are absolute.
+        """
 
         # "text" may actually be a dict, e.g. for custom attributes.
-        return re.sub(BRACKETED_TAG_REGEX, _var_repl_function, str(text))
+        text = str(text)
+        if "${" not in text:
+            return text
+        references = self._get_references()
+        context_xpath = None
+        if context is not None and references.get_repeat_parent(context.get_xpath()):
+            context_xpath = context.get_xpath()
+        key = (text, context_xpath, use_current, reference_parent)
+        result = references.get_inserted_xpaths(key=key)
+        if result is None:
+            parts = []
+            last = 0
+            for reference in get_expression(text).bracketed_references:
+                parts.append(text[last : reference.start])
+                parts.append(
+                    self._var_repl_function(
+                        reference, text, context, use_current, reference_parent
+                    )
+                )
+                last = reference.end
+            parts.append(text[last:])
+            result = "".join(parts)
+            references.set_inserted_xpaths(key=key, value=result)
+        return result
+
+    def add_child(self, child):
+        super().add_child(child)
+        # The survey tree changed, so the index is out of date.
+        self._references = None
+
+    def _get_references(self) -> ReferenceIndex:
+        """Get the reference index, which is rebuilt each time the XForm is generated."""
+        if self._references is None:
+            self._references = ReferenceIndex(survey=self)
+        return self._references
+
+    def get_insert_xpaths_stats(self) -> dict[str, int | float]:
+        """
+        Get the insert_xpaths memo statistics for the XForm generation.
 
-    def _var_repl_output_function(self, matchobj, context):
+        :return: The number of "hits" and "misses", and the "hit_rate" (0 to 1).
+        """
+        references = self._get_references()
+        hits = references.inserted_xpaths_hits
+        misses = references.inserted_xpaths_misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits or misses else 0.0,
+        }
+
+    def _split_output_values(
+        self, text: str, context: SurveyElement | None = None
+    ) -> list[tuple[str, bool]]:
         """
-        A regex substitution function that will replace
-        ${varname} with an output element that has the xpath to varname.
+        Split the text into XML-escaped text parts, and <output/> value parts.
+
+        The ${variables} and instance expressions in the text are replaced with the value
+        of an <output/> element, which has the xpath to the referenced element.
+
+        :param text: Input text to process.
+        :param context: The document node that the text belongs to.
+        :return: Pairs of (text, False) for escaped text, and (value, True) for the value
+          of an <output/> element.
         """
-        return f"""<output value="{self._var_repl_function(matchobj, context)}" />"""
+        # There was a bug where escaping is completely turned off in labels
+        # where variable replacement is used.
+        # For exampke, `${name} < 3` causes an error but `< 3` does not.
+        # This is my hacky fix for it, which does string escaping prior to
+        # variable replacement.
+        xml_text = escape_text_for_xml(text=text)
+        parts = []
+        for value, is_output in split_with_output(xml_text, context, self):
+            last = 0
+            if not is_output and "{" in value:
+                for reference in get_expression(value).bracketed_references:
+                    if last < reference.start:
+                        parts.append((value[last : reference.start], False))
+                    parts.append(
+                        (self._var_repl_function(reference, value, context), True)
+                    )
+                    last = reference.end
+            if last == 0 or last < len(value):
+                parts.append((value[last:], is_output))
+        return parts
 
-    def insert_output_values(
+    def get_output_content(
         self,
         text: str,
         context: SurveyElement | None = None,
-    ) -> tuple[str, bool]:
+        prefix: str = "",
+    ) -> list:
         """
-        Replace all the ${variables} in text with xpaths.
-        Returns that and a boolean indicating if there were any ${variables}
-        present.
+        Get the content for an element with text that may have ${variables}.
+
+        The content is built directly from the text parts, without parsing any XML.
 
         :param text: Input text to process.
         :param context: The document node that the text belongs to.
-        :return: The output text, and a flag indicating whether any changes were made.
+        :param prefix: Text to put before the processed text.
+        :return: The text, if there are no ${variables}, or otherwise the text nodes and
+          <output/> elements. In either case, the child arguments for `utils.node`.
         """
-        if text == "-":
-            return text, False
-
-        def _var_repl_output_function(matchobj):
-            return self._var_repl_output_function(matchobj, context)
+        if text != "-":
+            parts = self._split_output_values(text=text, context=context)
+            if any(is_output for _, is_output in parts):
+                return _get_output_nodes(
+                    parts=[(escape_text_for_xml(text=prefix), False), *parts]
+                )
+        return [f"{prefix}{text}"]
 
-        # There was a bug where escaping is completely turned off in labels
-        # where variable replacement is used.
-        # For exampke, `${name} < 3` causes an error but `< 3` does not.
-        # This is my hacky fix for it, which does string escaping prior to
-        # variable replacement:
-        original_xml = escape_text_for_xml(text=text)
-
-        # need to make sure we have reason to replace
-        # since at this point < is &lt,
-        # the net effect &lt gets translated again to &amp;lt;
-        xml_text = replace_with_output(original_xml, context, self)
-        if "{" in xml_text:
-            xml_text = re.sub(BRACKETED_TAG_REGEX, _var_repl_output_function, xml_text)
-        changed = xml_text != original_xml
-        if changed:
-            return xml_text, True
+    def _to_xml_str(self, pretty_print: bool = True) -> str:
+        """Get the XForm, with or without human readable formatting."""
+        if pretty_print:
+            return self._to_pretty_xml()
         else:
-            return text, False
+            return self._to_ugly_xml()
+
+    def _check_xform_file(self, path, validate=True, warnings=None, enketo=False):
+        """
+        Run the requested external validators against the XForm file at `path`, and
+        check the translation languages.
+
+        Warnings are appended in the order ODK Validate, Enketo Validate, languages. See
+        `validators.util.check_xform_file`.
+        """
+        warnings.extend(
+            check_xform_file(path=Path(path), validate=validate, enketo=enketo)
+        )
+        self._check_languages(warnings=warnings)
+
+    def _check_languages(self, warnings) -> None:
+        """Warn if one or more translation is missing a valid IANA subtag."""
+        translations = self._translations.keys()
+        if translations:
+            bad_languages = get_languages_with_bad_tags(translations)
+            if bad_languages:
+                warnings.append(
+                    "The following language declarations do not contain "
+                    "valid machine-readable codes: "
+                    + ", ".join(bad_languages)
+                    + ". "
+                    + "Learn more: http://xlsform.org#multiple-language-support"
+                )
 
     def print_xform_to_file(
-        self, path=None, validate=True, pretty_print=True, warnings=None, enketo=False
+        self,
+        path=None,
+        validate=True,
+        pretty_print=True,
+        warnings=None,
+        enketo=False,
     ) -> str:
         """
         Print the xForm to a file and optionally validate it as well by
@@ -1345,10 +1685,7 @@ class Survey(Section):
             warnings = []
         if not path:
             path = f"{self.id_string}.xml"
-        if pretty_print:
-            xml = self._to_pretty_xml()
-        else:
-            xml = self._to_ugly_xml()
+        xml = self._to_xml_str(pretty_print=pretty_print)
         try:
             with open(path, mode="w", encoding="utf-8") as file_obj:
                 file_obj.write(xml)
@@ -1356,51 +1693,64 @@ class Survey(Section):
             if os.path.exists(path):
                 os.unlink(path)
             raise
-        if validate:
-            warnings.extend(odk_validate.check_xform(path))
-        if enketo:
-            warnings.extend(enketo_validate.check_xform(path))
-
-        # Warn if one or more translation is missing a valid IANA subtag
-        translations = self._translations.keys()
-        if translations:
-            bad_languages = get_languages_with_bad_tags(translations)
-            if bad_languages:
-                warnings.append(
-                    "The following language declarations do not contain "
-                    "valid machine-readable codes: "
-                    + ", ".join(bad_languages)
-                    + ". "
-                    + "Learn more: http://xlsform.org#multiple-language-support"
-                )
+        self._check_xform_file(
+            path=path, validate=validate, warnings=warnings, enketo=enketo
+        )
         return xml
 
-    def to_xml(self, validate=True, pretty_print=True, warnings=None, enketo=False):
+    def to_xml(
+        self,
+        validate=True,
+        pretty_print=True,
+        warnings=None,
+        enketo=False,
+        output=None,
+    ):
         """
         Generates the XForm XML.
         validate is True by default - pass the XForm XML through ODK Validator.
         pretty_print is True by default - formats the XML for readability.
         warnings - if a list is passed it stores all warnings generated
         enketo - pass the XForm XML though Enketo Validator.
+        output - if provided, write the XForm to this stream with write_xml, and
+          return None. If validating, it is written after the validators pass.
+
+        The XForm is generated in memory. It is only written to a file if a validator
+        is requested, in which case one temporary file is shared by the validators.
 
         Return XForm XML string.
         """
-        # On Windows, NamedTemporaryFile must be opened exclusively.
-        # So it must be explicitly created, opened, closed, and removed.
-        tmp = tempfile.NamedTemporaryFile(delete=False)
-        tmp.close()
-        tmp_path = Path(tmp.name)
-        try:
-            # this will throw an exception if the xml is not valid
-            xml = self.print_xform_to_file(
-                path=tmp_path,
-                validate=validate,
-                pretty_print=pretty_print,
-                warnings=warnings,
-                enketo=enketo,
-            )
-        finally:
-            tmp_path.unlink(missing_ok=True)
+        if warnings is None:
+            warnings = []
+        if output is None:
+            with stage(STAGE_XML):
+                xml = self._to_xml_str(pretty_print=pretty_print)
+        else:
+            xml = None
+            if not (validate or enketo):
+                with stage(STAGE_XML):
+                    self.write_xml(fp=output, pretty_print=pretty_print)
+        if validate or enketo:
+            with temp_xform_path() as tmp_path:
+                with open(tmp_path, mode="w", encoding="utf-8") as file_obj:
+                    if xml is None:
+                        with stage(STAGE_XML):
+                            self.write_xml(fp=file_obj, pretty_print=pretty_print)
+                    else:
+                        file_obj.write(xml)
+                # this will throw an exception if the xml is not valid
+                with stage(STAGE_VALIDATE):
+                    self._check_xform_file(
+                        path=tmp_path, validate=validate, warnings=warnings, enketo=enketo
+                    )
+                if output is not None:
+                    with (
+                        open(tmp_path, encoding="utf-8") as file_obj,
+                        as_text_stream(output) as writer,
+                    ):
+                        shutil.copyfileobj(file_obj, writer)
+        else:
+            self._check_languages(warnings=warnings)
         return xml
 
     def instantiate(self):
@@ -7,7 +7,7 @@ import re
 import warnings
 from collections.abc import Callable, Generator, Iterable, Mapping
 from itertools import chain
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING
 
 from pyxform import aliases as alias
 from pyxform import constants as const
@@ -199,54 +199,22 @@ class SurveyElement(Mapping):
 
     def has_common_repeat_parent(
         self, other: "SurveyElement"
-    ) -> tuple[str, int | None, Optional["SurveyElement"]]:
+    ) -> tuple[str, int | None, "SurveyElement | None"]:
         """
         Get the relation type, steps (generations), and the common ancestor.
+
+        Deprecated: use `ReferenceIndex.get_common_repeat_parent` or `is_related`.
         """
-        # Quick check for immediate relation.
-        if self.parent is other:
-            return "Parent (other)", 1, other
-        elif other.parent is self:
-            return "Parent (self)", 1, self
-
-        # Traversal tracking
-        self_ancestors = {}
-        other_ancestors = {}
-        self_current = self
-        other_current = other
-        self_distance = 0
-        other_distance = 0
-
-        # Traverse up both ancestor chains as far as necessary.
-        while self_current or other_current:
-            # Step up the self chain
-            if self_current:
-                self_distance += 1
-                self_current = self_current.parent
-                if self_current:
-                    self_ancestors[self_current] = self_distance
-                    if (
-                        self_current.type == const.REPEAT
-                        and self_current in other_ancestors
-                    ):
-                        max_steps = max(self_distance, other_ancestors[self_current])
-                        return "Common Ancestor Repeat", max_steps, self_current
-
-            # Step up the other chain
-            if other_current:
-                other_distance += 1
-                other_current = other_current.parent
-                if other_current:
-                    other_ancestors[other_current] = other_distance
-                    if (
-                        other_current.type == const.REPEAT
-                        and other_current in self_ancestors
-                    ):
-                        max_steps = max(other_distance, self_ancestors[other_current])
-                        return "Common Ancestor Repeat", max_steps, other_current
-
-        # No common ancestor found.
-        return "Unrelated", None, None
+        warnings.warn(
+            "SurveyElement.has_common_repeat_parent will be removed in a future version "
+            "of pyxform. Please use pyxform.survey.ReferenceIndex instead.",
+            DeprecationWarning,
+            stacklevel=2,  # level 1 = here, 2 = caller.
+        )
+        # Imported here to avoid circular references.
+        from pyxform.survey import ReferenceIndex
+
+        return ReferenceIndex.get_common_repeat_parent(element=self, other=other)
 
     def get_xpath(self):
         """
@@ -481,8 +449,7 @@ class SurveyElement(Mapping):
             ref = f"""jr:itext('{self._translation_path("label")}')"""
             return node("label", ref=ref)
         elif self.label:
-            label, output_inserted = survey.insert_output_values(self.label, self)
-            return node("label", label, toParseString=output_inserted)
+            return node("label", *survey.get_output_content(self.label, self))
         else:
             return node("label")
 
@@ -491,8 +458,7 @@ class SurveyElement(Mapping):
             path = self._translation_path("hint")
             return node("hint", ref=f"jr:itext('{path}')")
         elif self.hint:
-            hint, output_inserted = survey.insert_output_values(self.hint, self)
-            return node("hint", hint, toParseString=output_inserted)
+            return node("hint", *survey.get_output_content(self.hint, self))
         else:
             return node("hint")
 
@@ -4,48 +4,100 @@ pyxform utils module.
 
 import copy
 import csv
+import io
 import json
 import re
 from collections.abc import Generator, Iterable
+from contextlib import contextmanager
 from functools import lru_cache
 from io import StringIO
 from itertools import chain
 from json.decoder import JSONDecodeError
 from typing import Any
 from xml.dom import Node
-from xml.dom.minidom import Element, Text, _write_data
-
-from defusedxml.minidom import parseString
 
 from pyxform import constants as const
 from pyxform.errors import PyXFormError
-from pyxform.parsing.expression import parse_expression
+from pyxform.parsing.expression import BRACKETED_TAG_REGEX
+from pyxform.parsing.expression_tree import get_expression
 
 SEP = "_"
 INVALID_XFORM_TAG_REGEXP = re.compile(r"[^a-zA-Z:_][^a-zA-Z:_0-9\-.]*")
 LAST_SAVED_INSTANCE_NAME = "__last-saved"
-BRACKETED_TAG_REGEX = re.compile(r"\${(last-saved#)?(.*?)}")
 PYXFORM_REFERENCE_REGEX = re.compile(r"\$\{(.*?)\}")
 NODE_TYPE_TEXT = {Node.TEXT_NODE, Node.CDATA_SECTION_NODE}
 XML_TEXT_SUBS = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
 XML_TEXT_SUBS_KEYS = set(XML_TEXT_SUBS)
 XML_TEXT_TABLE = str.maketrans(XML_TEXT_SUBS)
+# Same as xml.dom.minidom._write_data, used for attributes.
+XML_ATTRIBUTE_TABLE = str.maketrans({**XML_TEXT_SUBS, '"': "&quot;"})
 
 
-class DetachableElement(Element):
+class DetachableElement:
     """
-    Element classes are not meant to be instantiated directly.   This
-    restriction was not strictly enforced in Python 2, but is effectively
-    enforced in Python 3 via http://bugs.python.org/issue15290.
+    An XML element, supporting the part of the xml.dom.minidom.Element API used by pyxform.
 
-    A simple workaround (for now) is to set an extra attribute on the Element
-    class.  The long term fix will probably be to rewrite node() to use
-    document.createElement rather than Element.
+    The XForm is built from many of these elements, so they are kept small: there is no
+    owner document, the attributes are a dict of strings, and the only link between
+    nodes is the parent. The output is the same as for the minidom-based element that
+    this replaces, including the text escaping and whitespace rules for mixed content.
     """
 
-    def __init__(self, *args, **kwargs):
-        Element.__init__(self, *args, **kwargs)
-        self.ownerDocument = None
+    __slots__ = ("attributes", "childNodes", "parentNode", "tagName")
+    nodeType = Node.ELEMENT_NODE
+
+    def __init__(self, tagName: str):
+        self.tagName: str = tagName
+        self.attributes: dict[str, str] = {}
+        self.childNodes: list = []
+        self.parentNode: DetachableElement | None = None
+
+    @property
+    def nodeName(self) -> str:
+        return self.tagName
+
+    @property
+    def lastChild(self):
+        return self.childNodes[-1] if self.childNodes else None
+
+    def getAttribute(self, name: str) -> str:
+        return self.attributes.get(name, "")
+
+    def setAttribute(self, name: str, value: str) -> None:
+        self.attributes[name] = value
+
+    def appendChild(self, node):
+        """Append the node as the last child, moving it from any previous parent."""
+        if node.parentNode is not None:
+            node.parentNode.removeChild(node)
+        self.childNodes.append(node)
+        node.parentNode = self
+        return node
+
+    def insertBefore(self, newChild, refChild):
+        """Insert the node before `refChild`, or append it if `refChild` is None."""
+        if refChild is None:
+            return self.appendChild(newChild)
+        if newChild.parentNode is not None:
+            newChild.parentNode.removeChild(newChild)
+        index = next(i for i, c in enumerate(self.childNodes) if c is refChild)
+        self.childNodes.insert(index, newChild)
+        newChild.parentNode = self
+        return newChild
+
+    def removeChild(self, oldChild):
+        index = next(i for i, c in enumerate(self.childNodes) if c is oldChild)
+        del self.childNodes[index]
+        oldChild.parentNode = None
+        return oldChild
+
+    def toxml(self) -> str:
+        return self.toprettyxml(indent="", newl="")
+
+    def toprettyxml(self, indent="\t", newl="\n") -> str:
+        writer = StringIO()
+        self.writexml(writer, "", indent, newl)
+        return writer.getvalue()
 
     def writexml(self, writer, indent="", addindent="", newl=""):
         # indent = current indentation
@@ -53,11 +105,11 @@ class DetachableElement(Element):
         # newl = newline string
         writer.write(f"{indent}<{self.tagName}")
 
-        if self._attrs:
-            for k, v in self._attrs.items():
-                writer.write(f' {k}="')
-                _write_data(writer, v.value)
-                writer.write('"')
+        for k, v in self.attributes.items():
+            writer.write(f' {k}="')
+            if v:
+                writer.write(v.translate(XML_ATTRIBUTE_TABLE))
+            writer.write('"')
         if self.childNodes:
             writer.write(">")
             # For text or mixed content, write without adding indents or newlines.
@@ -88,22 +140,53 @@ def escape_text_for_xml(text: str) -> str:
         return text
 
 
-class PatchedText(Text):
+class PatchedText:
+    """
+    An XML text node, supporting the part of the xml.dom.minidom.Text API used by pyxform.
+    """
+
+    __slots__ = ("data", "parentNode")
+    nodeType = Node.TEXT_NODE
+
+    def __init__(self, data: str = ""):
+        self.data: str = data
+        self.parentNode: DetachableElement | None = None
+
+    @property
+    def nodeValue(self) -> str:
+        return self.data
+
     def writexml(self, writer, indent="", addindent="", newl=""):
-        """Same as original but no replacing double quotes with '&quot;'."""
+        """Same as minidom but no replacing double quotes with '&quot;'."""
         data = f"{indent}{self.data}{newl}"
         if data:
             data = escape_text_for_xml(text=data)
         writer.write(data)
 
 
+class EscapedText(PatchedText):
+    """
+    An XML text node written with double quotes escaped, as for xml.dom.minidom.Text.
+
+    Used for text mixed with <output/> elements, as minidom would write it.
+    """
+
+    __slots__ = ()
+
+    def writexml(self, writer, indent="", addindent="", newl=""):
+        data = f"{indent}{self.data}{newl}"
+        if data:
+            data = data.translate(XML_ATTRIBUTE_TABLE)
+        writer.write(data)
+
+
 def node(*args, **kwargs) -> DetachableElement:
     """
     args[0] -- a XML tag
     args[1:] -- an array of children to append to the newly created node
             or if a unicode arg is supplied it will be used to make a text node
     kwargs -- attributes
-    returns a xml.dom.minidom.Element
+    returns a DetachableElement
     """
     blocked_attributes = {"tag"}
     tag = args[0] if len(args) > 0 else kwargs["tag"]
@@ -112,34 +195,18 @@ def node(*args, **kwargs) -> DetachableElement:
     unicode_args = tuple(u for u in args if isinstance(u, str))
     if len(unicode_args) > 1:
         raise PyXFormError("""Invalid value for `unicode_args`.""")
-    parsed_string = False
 
-    # Convert the kwargs xml attribute dictionary to a xml.dom.minidom.Element.
+    # Convert the kwargs xml attribute dictionary to element attributes.
     for k, v in kwargs.items():
         if k in blocked_attributes:
             continue
-        if k == "toParseString":
-            if v is True and len(unicode_args) == 1:
-                parsed_string = True
-                # Add this header string so parseString can be used?
-                s = f"""<?xml version="1.0" ?><{tag}>{unicode_args[0]}</{tag}>"""
-                parsed_node = parseString(s.encode("utf-8")).documentElement
-                # Move node's children to the result Element
-                # discarding node's root
-                for child in parsed_node.childNodes:
-                    result.appendChild(child.cloneNode(deep=False))
-        else:
-            result.setAttribute(k, v)
+        result.attributes[k] = v
 
-    if len(unicode_args) == 1 and not parsed_string:
-        text_node = PatchedText()
-        text_node.data = unicode_args[0]
-        result.appendChild(text_node)
+    if len(unicode_args) == 1:
+        result.appendChild(PatchedText(unicode_args[0]))
     for n in args:
         if isinstance(n, int | float | bytes):
-            text_node = PatchedText()
-            text_node.data = str(n)
-            result.appendChild(text_node)
+            result.appendChild(PatchedText(str(n)))
         elif isinstance(n, Generator):
             for e in n:
                 if e is not None:
@@ -149,6 +216,25 @@ def node(*args, **kwargs) -> DetachableElement:
     return result
 
 
+@contextmanager
+def as_text_stream(fp) -> Generator:
+    """
+    Get a text stream for writing to `fp`, which may be a text or binary stream.
+
+    A binary stream (e.g. a gzip file) is wrapped to write UTF-8 text. The wrapper is
+    flushed and detached on exit, so `fp` is left open.
+    """
+    if not isinstance(fp, io.RawIOBase | io.BufferedIOBase):
+        yield fp
+        return
+    wrapper = io.TextIOWrapper(fp, encoding="utf-8", newline="\n")
+    try:
+        yield wrapper
+    finally:
+        wrapper.flush()
+        wrapper.detach()
+
+
 def get_pyobj_from_json(str_or_path):
     """
     This function takes either a json string or a path to a json file,
@@ -230,26 +316,7 @@ def default_is_dynamic(element_default, element_type=None):
     if not isinstance(element_default, str):
         return False
 
-    tokens, _ = parse_expression(element_default)
-    for t in tokens:
-        # Data types which are likely to have non-dynamic defaults containing a hyphen.
-        if element_type in ("date", "dateTime", "geopoint", "geotrace", "geoshape"):
-            # Nested to avoid extra string comparisons if not a relevant data type.
-            if t.name == "OPS_MATH" and t.value == "-":
-                return False
-
-        # A match on these lexer rules indicates a dynamic default.
-        if t.name in {
-            "OPS_MATH",
-            "OPS_UNION",
-            "XPATH_PRED",
-            "PYXFORM_REF",
-            "FUNC_CALL",
-        }:
-            return True
-
-    # Otherwise assume not dynamic.
-    return False
+    return get_expression(element_default).is_dynamic(element_type=element_type)
 
 
 def has_dynamic_label(choice_list: "list[dict[str, str]]") -> bool:
@@ -2,16 +2,20 @@
 Validate XForms using Enketo validator.
 """
 
+import asyncio
+import atexit
 import os
+import shutil
 from typing import TYPE_CHECKING
 
 from pyxform.validators.error_cleaner import ErrorCleaner
 from pyxform.validators.util import (
     XFORM_SPEC_PATH,
     check_readable,
-    decode_stream,
     run_popen_with_timeout,
+    run_popen_with_timeout_async,
 )
+from pyxform.validators.worker_pool import WorkerCrashedError, WorkerPool
 
 if TYPE_CHECKING:
     from pyxform.validators.util import PopenResult
@@ -19,6 +23,9 @@ if TYPE_CHECKING:
 
 CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 ENKETO_VALIDATE_PATH = os.path.join(CURRENT_DIRECTORY, "bin", "validate")
+ENKETO_VALIDATE_WORKER_PATH = os.path.join(CURRENT_DIRECTORY, "worker.js")
+ENKETO_VALIDATE_MODULE = "enketo-validate"
+_WORKER_POOL: WorkerPool | None = None
 
 
 class EnketoValidateError(Exception):
@@ -36,21 +43,86 @@ def _call_validator(path_to_xform, bin_file_path=ENKETO_VALIDATE_PATH) -> "Popen
     return run_popen_with_timeout([bin_file_path, path_to_xform], 100)
 
 
+async def _call_validator_async(
+    path_to_xform, bin_file_path=ENKETO_VALIDATE_PATH
+) -> "PopenResult":
+    return await run_popen_with_timeout_async([bin_file_path, path_to_xform], 100)
+
+
 def install_ok(bin_file_path=ENKETO_VALIDATE_PATH):
     """
     Check if Enketo-validate functions as expected.
     """
     check_readable(file_path=XFORM_SPEC_PATH)
-    return_code, _, _, _ = _call_validator(
-        path_to_xform=XFORM_SPEC_PATH, bin_file_path=bin_file_path
-    )
-    if return_code == 1:
+    result = _call_validator(path_to_xform=XFORM_SPEC_PATH, bin_file_path=bin_file_path)
+    if result.return_code == 1:
         return False
     else:
         return True
 
 
-def check_xform(path_to_xform):
+def get_worker_command(module=ENKETO_VALIDATE_MODULE) -> list[str]:
+    """
+    Get the command to start a persistent Enketo Validate worker.
+
+    The release binary installed by the updater can't run as a worker, so the worker
+    uses Node.js with the enketo-validate module (e.g. from `npm install enketo-validate`).
+
+    :param module: The enketo-validate module name or path, as for Node.js `require`.
+    """
+    if shutil.which(cmd="node") is None:
+        raise OSError(
+            "The Enketo Validate worker pool requires Node.js, which could not be found."
+        )
+    return ["node", ENKETO_VALIDATE_WORKER_PATH, module]
+
+
+def start_worker_pool(
+    size: int = 2,
+    timeout: float = 100,
+    max_jobs: int = 100,
+    module=ENKETO_VALIDATE_MODULE,
+) -> WorkerPool:
+    """
+    Start a pool of persistent Enketo Validate workers, used by check_xform until stopped.
+
+    Each call to `check_xform` without a worker pool starts a new validator process. With
+    a pool, the processes are started once and reused. Any previously started pool is
+    stopped. See `WorkerPool` for the parameters, and `get_worker_command` for `module`.
+    """
+    global _WORKER_POOL  # noqa: PLW0603
+    pool = WorkerPool(
+        command=get_worker_command(module=module),
+        size=size,
+        timeout=timeout,
+        max_jobs=max_jobs,
+    )
+    stop_worker_pool()
+    _WORKER_POOL = pool
+    return pool
+
+
+def stop_worker_pool() -> None:
+    """
+    Stop the pool started by `start_worker_pool`, if any.
+    """
+    global _WORKER_POOL  # noqa: PLW0603
+    if _WORKER_POOL is not None:
+        _WORKER_POOL.close()
+        _WORKER_POOL = None
+
+
+atexit.register(stop_worker_pool)
+
+
+def _run_on_pool(pool: WorkerPool, path_to_xform) -> "PopenResult":
+    try:
+        return pool.run(path=path_to_xform)
+    except WorkerCrashedError as err:
+        raise EnketoValidateError(f"Enketo Validate Errors:\n{err}") from err
+
+
+def check_xform(path_to_xform, pool: WorkerPool | None = None):
     """
     Check the form with the Enketo validator.
 
@@ -58,28 +130,61 @@ def check_xform(path_to_xform):
     - return code 0: append warning with the stdout content (possibly none).
 
     :param path_to_xform: Path to the XForm to be validated.
+    :param pool: Validate on this worker pool, or the pool from `start_worker_pool`.
     :return: warnings or List[str]
     """
+    if pool is None:
+        pool = _WORKER_POOL
+    if pool is None:
+        _check_install_exists()
+        result = _call_validator(path_to_xform=path_to_xform)
+    else:
+        result = _run_on_pool(pool=pool, path_to_xform=path_to_xform)
+    return _get_warnings(result=result)
+
+
+async def check_xform_async(path_to_xform, pool: WorkerPool | None = None):
+    """
+    Check the form with the Enketo validator, like `check_xform`.
+
+    The validator runs as an asyncio subprocess, or in a thread if using a worker pool,
+    so that the event loop can run other tasks while it runs.
+    """
+    if pool is None:
+        pool = _WORKER_POOL
+    if pool is None:
+        _check_install_exists()
+        result = await _call_validator_async(path_to_xform=path_to_xform)
+    else:
+        result = await asyncio.to_thread(
+            _run_on_pool, pool=pool, path_to_xform=path_to_xform
+        )
+    return _get_warnings(result=result)
+
+
+def _check_install_exists():
     if not install_exists():
         raise OSError(
             "Enketo-validate dependency not found. "
             "Please use the updater tool to install the latest version."
         )
 
-    returncode, timeout, stdout, stderr = _call_validator(path_to_xform=path_to_xform)
+
+def _get_warnings(result: "PopenResult") -> list[str]:
+    """
+    Get the warnings from an Enketo Validate result, or raise an error if it's invalid.
+    """
     warnings = []
-    stderr = decode_stream(stderr)
-    stdout = decode_stream(stdout)
 
-    if timeout:
+    if result.timeout:
         return ["XForm took to long to completely validate."]
-    elif returncode > 0:  # Error invalid
+    elif result.return_code > 0:  # Error invalid
         raise EnketoValidateError(
-            "Enketo Validate Errors:\n" + ErrorCleaner.enketo_validate(stderr)
+            "Enketo Validate Errors:\n" + ErrorCleaner.enketo_validate(result.stderr)
         )
-    elif returncode == 0:
-        if stdout:
-            warnings.append("Enketo Validate Warnings:\n" + stdout)
+    elif result.return_code == 0:
+        if result.stdout:
+            warnings.append("Enketo Validate Warnings:\n" + result.stdout)
         return warnings
-    elif returncode < 0:
+    elif result.return_code < 0:
         return ["Bad return code from Enketo Validate."]
@@ -0,0 +1,46 @@
+/**
+ * A long-lived Enketo Validate worker for pyxform.validators.worker_pool.
+ *
+ * Usage: node worker.js [enketo-validate module name or path]
+ *
+ * Each stdin line is a JSON request like {"path": "/path/to/xform.xml"}. The XForm is
+ * checked with the enketo-validate module `validate` function, and the result is written
+ * as a JSON line like {"return_code": 0, "stdout": "...", "stderr": "..."}, with the same
+ * meaning as the output of the enketo-validate command line tool: warnings in stdout,
+ * errors in stderr, and a return code of 1 if there are errors.
+ */
+'use strict';
+
+const fs = require('fs');
+const readline = require('readline');
+
+const validator = require(process.argv[2] || 'enketo-validate');
+
+async function handle(line) {
+    const { path } = JSON.parse(line);
+    try {
+        const xform = fs.readFileSync(path, 'utf8');
+        const result = await validator.validate(xform, {});
+        const errors = result.errors || [];
+        return {
+            return_code: errors.length ? 1 : 0,
+            stdout: (result.warnings || []).join('\n'),
+            stderr: errors.join('\n'),
+        };
+    } catch (e) {
+        return { return_code: 1, stdout: '', stderr: String(e && e.stack ? e.stack : e) };
+    }
+}
+
+async function main() {
+    const lines = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+    for await (const line of lines) {
+        if (!line.trim()) {
+            continue;
+        }
+        const response = await handle(line);
+        process.stdout.write(JSON.stringify(response) + '\n');
+    }
+}
+
+main();
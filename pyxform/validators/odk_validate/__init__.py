@@ -14,6 +14,7 @@ from pyxform.validators.util import (
     XFORM_SPEC_PATH,
     check_readable,
     run_popen_with_timeout,
+    run_popen_with_timeout_async,
 )
 
 if TYPE_CHECKING:
@@ -33,9 +34,23 @@ def install_exists():
     return os.path.exists(ODK_VALIDATE_PATH)
 
 
+def _get_validator_command(path_to_xform, bin_file_path=ODK_VALIDATE_PATH) -> list:
+    return ["java", "-Djava.awt.headless=true", "-jar", bin_file_path, path_to_xform]
+
+
 def _call_validator(path_to_xform, bin_file_path=ODK_VALIDATE_PATH) -> "PopenResult":
     return run_popen_with_timeout(
-        ["java", "-Djava.awt.headless=true", "-jar", bin_file_path, path_to_xform], 100
+        _get_validator_command(path_to_xform=path_to_xform, bin_file_path=bin_file_path),
+        100,
+    )
+
+
+async def _call_validator_async(
+    path_to_xform, bin_file_path=ODK_VALIDATE_PATH
+) -> "PopenResult":
+    return await run_popen_with_timeout_async(
+        _get_validator_command(path_to_xform=path_to_xform, bin_file_path=bin_file_path),
+        100,
     )
 
 
@@ -79,13 +94,33 @@ def check_xform(path_to_xform):
     # check for available java version
     check_java_available()
 
+    result = _call_validator(path_to_xform=path_to_xform)
+    return _get_warnings(result=result)
+
+
+async def check_xform_async(path_to_xform):
+    """
+    Run ODK Validate against the XForm in `path_to_xform`, like `check_xform`.
+
+    The validator runs as an asyncio subprocess, so that the event loop can run other
+    tasks while it runs.
+    """
+    check_java_available()
+
+    result = await _call_validator_async(path_to_xform=path_to_xform)
+    return _get_warnings(result=result)
+
+
+def _get_warnings(result: "PopenResult") -> list[str]:
+    """
+    Get the warnings from an ODK Validate result, or raise an error if it's invalid.
+    """
     # resultcode indicates validity of the form
     # timeout indicates whether validation ran out of time to complete
     # stdout is not used because it has some warnings that always
     # appear and can be ignored.
     # stderr is treated as a warning if the form is valid or an error
     # if it is invalid.
-    result = _call_validator(path_to_xform=path_to_xform)
     warnings = []
 
     if result.timeout:
@@ -1,6 +1,6 @@
 from pyxform import constants as co
 from pyxform.errors import PyXFormError
-from pyxform.parsing.expression import parse_expression
+from pyxform.parsing.expression_tree import get_expression
 
 PYXFORM_REFERENCE_INVALID = (
     "[row : {row_number}] On the '{sheet}' sheet, the '{column}' value is invalid. "
@@ -25,31 +25,7 @@ def validate_pyxform_reference_syntax(
         if key in {co.LIST_NAME_S, co.LIST_NAME_U}:
             return
 
-    tokens, _ = parse_expression(value)
-    start_token = None
-
-    for t in tokens:
-        # The start of an expression.
-        if t is not None and t.name == "PYXFORM_REF_START" and start_token is None:
-            start_token = t
-        # Tokens that are part of an expression.
-        elif start_token is not None:
-            if t.name == "NAME":
-                continue
-            elif t.name == "PYXFORM_REF_END":
-                start_token = None
-            elif t.name in ("PYXFORM_REF_START", "PYXFORM_REF"):
-                msg = PYXFORM_REFERENCE_INVALID.format(
-                    sheet=sheet_name, row_number=row_number, column=key
-                )
-                raise PyXFormError(msg)
-            else:
-                msg = PYXFORM_REFERENCE_INVALID.format(
-                    sheet=sheet_name, row_number=row_number, column=key
-                )
-                raise PyXFormError(msg)
-
-    if start_token is not None:
+    if get_expression(value).has_invalid_reference():
         msg = PYXFORM_REFERENCE_INVALID.format(
             sheet=sheet_name, row_number=row_number, column=key
         )
@@ -2,6 +2,7 @@
 The validators utility functions.
 """
 
+import asyncio
 import logging
 import os
 import signal
@@ -9,7 +10,10 @@ import subprocess
 import tempfile
 import threading
 import time
-from contextlib import closing
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from pathlib import Path
 from subprocess import PIPE, Popen
 from typing import NamedTuple
 from urllib.error import HTTPError, URLError
@@ -33,21 +37,10 @@ class PopenResult:
         self.stderr: str = decode_stream(stream=stderr)
 
 
-# Adapted from:
-# http://betabug.ch/blogs/ch-athens/1093
-def run_popen_with_timeout(command, timeout) -> "PopenResult":
+def get_popen_kwargs() -> dict:
     """
-    Run a sub-program in subprocess.Popen, pass it the input_data,
-    kill it if the specified timeout has passed.
-    returns a tuple of resultcode, timeout, stdout, stderr
+    Get platform-specific keyword arguments for running a validator with Popen.
     """
-    kill_check = threading.Event()
-
-    def _kill_process_after_a_timeout(pid):
-        os.kill(pid, signal.SIGTERM)
-        kill_check.set()  # tell the main routine that we had to kill
-        # use SIGKILL if hard to kill...
-
     startup_info = None
     env = None
     if os.name == "nt":
@@ -69,9 +62,25 @@ def run_popen_with_timeout(command, timeout) -> "PopenResult":
             for k, v in {k: os.environ.get(k) for k in ("TEMP", "TMP", "TMPDIR")}.items()
         }
 
-    p = Popen(
-        command, env=env, stdin=PIPE, stdout=PIPE, stderr=PIPE, startupinfo=startup_info
-    )
+    return {"env": env, "startupinfo": startup_info}
+
+
+# Adapted from:
+# http://betabug.ch/blogs/ch-athens/1093
+def run_popen_with_timeout(command, timeout) -> "PopenResult":
+    """
+    Run a sub-program in subprocess.Popen, pass it the input_data,
+    kill it if the specified timeout has passed.
+    returns a tuple of resultcode, timeout, stdout, stderr
+    """
+    kill_check = threading.Event()
+
+    def _kill_process_after_a_timeout(pid):
+        os.kill(pid, signal.SIGTERM)
+        kill_check.set()  # tell the main routine that we had to kill
+        # use SIGKILL if hard to kill...
+
+    p = Popen(command, stdin=PIPE, stdout=PIPE, stderr=PIPE, **get_popen_kwargs())
     watchdog = threading.Timer(timeout, _kill_process_after_a_timeout, args=(p.pid,))
     watchdog.start()
     (stdout, stderr) = p.communicate()
@@ -83,6 +92,32 @@ def run_popen_with_timeout(command, timeout) -> "PopenResult":
     )
 
 
+async def run_popen_with_timeout_async(command, timeout) -> "PopenResult":
+    """
+    Run a sub-program as an asyncio subprocess, kill it if the timeout has passed.
+
+    Like `run_popen_with_timeout`, but the event loop can run other tasks while the
+    sub-program runs. If the calling task is cancelled, the sub-program is killed.
+    """
+    p = await asyncio.create_subprocess_exec(
+        *command, stdin=PIPE, stdout=PIPE, stderr=PIPE, **get_popen_kwargs()
+    )
+    timeout_expired = False
+    try:
+        stdout, stderr = await asyncio.wait_for(p.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        timeout_expired = True
+        p.terminate()
+        stdout, stderr = await p.communicate()
+    except asyncio.CancelledError:
+        p.kill()
+        await p.wait()
+        raise
+    return PopenResult(
+        return_code=p.returncode, timeout=timeout_expired, stdout=stdout, stderr=stderr
+    )
+
+
 def decode_stream(stream):
     """
     Decode a stream, e.g. stdout or stderr.
@@ -207,3 +242,95 @@ def check_readable(file_path, retry_limit=10, wait_seconds=0.5):
         else:
             raise OSError(f"Could not read file: {file_path}")
     return True
+
+
+@contextmanager
+def temp_xform_path() -> Iterator[Path]:
+    """
+    Get a path for a temporary XForm file, which is removed afterwards.
+    """
+    # On Windows, NamedTemporaryFile must be opened exclusively.
+    # So it must be explicitly created, opened, closed, and removed.
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+    tmp_path = Path(tmp.name)
+    try:
+        yield tmp_path
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _get_warnings(results: list) -> list[str]:
+    """
+    Get the warnings of each validator in order, or raise the first validator error.
+    """
+    warnings = []
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+        warnings.extend(result)
+    return warnings
+
+
+def check_xform_file(path: Path, validate: bool, enketo: bool) -> list[str]:
+    """
+    Run the requested validators concurrently against the XForm file, and get the
+    warnings.
+
+    Warnings are in the order ODK Validate, Enketo Validate. If a validator raises an
+    exception, the first one in that order is raised, after both validators finish.
+
+    :param path: The XForm file path.
+    :param validate: If True, check the XForm with ODK Validate.
+    :param enketo: If True, check the XForm with Enketo Validate.
+    """
+    from pyxform.validators import enketo_validate, odk_validate
+
+    checks = []
+    if validate:
+        checks.append(odk_validate.check_xform)
+    if enketo:
+        checks.append(enketo_validate.check_xform)
+    if not checks:
+        return []
+    with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        futures = [executor.submit(check, path) for check in checks]
+    return _get_warnings(results=[f.exception() or f.result() for f in futures])
+
+
+async def check_xform_file_async(path: Path, validate: bool, enketo: bool) -> list[str]:
+    """
+    Run the requested validators against the XForm file, like `check_xform_file`.
+
+    The validators run as asyncio subprocesses, so the event loop can run other tasks
+    while they run.
+    """
+    from pyxform.validators import enketo_validate, odk_validate
+
+    checks = []
+    if validate:
+        checks.append(odk_validate.check_xform_async(path))
+    if enketo:
+        checks.append(enketo_validate.check_xform_async(path))
+    results = await asyncio.gather(*checks, return_exceptions=True)
+    return _get_warnings(results=results)
+
+
+def check_xform(xform: str, validate: bool, enketo: bool) -> list[str]:
+    """
+    Write the XForm to a temporary file, and run `check_xform_file` against it.
+    """
+    with temp_xform_path() as tmp_path:
+        tmp_path.write_text(xform, encoding="utf-8")
+        return check_xform_file(path=tmp_path, validate=validate, enketo=enketo)
+
+
+async def check_xform_async(xform: str, validate: bool, enketo: bool) -> list[str]:
+    """
+    Write the XForm to a temporary file, and run `check_xform_file_async` against it.
+    """
+    with temp_xform_path() as tmp_path:
+        tmp_path.write_text(xform, encoding="utf-8")
+        return await check_xform_file_async(
+            path=tmp_path, validate=validate, enketo=enketo
+        )
@@ -0,0 +1,212 @@
+"""
+A pool of long-lived validator worker processes.
+
+Starting a validator runtime (e.g. Node.js for Enketo Validate) can take longer than the
+validation itself, so a worker keeps running between jobs. Workers use a JSON lines
+protocol over stdin and stdout. For each job the pool writes a request line to the worker stdin:
+
+    {"path": "/path/to/xform.xml"}
+
+And the worker writes a response line to its stdout, with the same meaning as the result
+of running the validator once with `run_popen_with_timeout`:
+
+    {"return_code": 0, "stdout": "...", "stderr": "..."}
+
+Anything the worker writes to stderr is discarded.
+"""
+
+import json
+import os
+import queue
+import subprocess
+import threading
+from collections.abc import Sequence
+from subprocess import DEVNULL, PIPE, Popen
+
+from pyxform.errors import PyXFormError
+from pyxform.validators.util import PopenResult, get_popen_kwargs
+
+WORKER_CRASHED = "The validator worker stopped unexpectedly."
+
+
+class WorkerCrashedError(Exception):
+    """The worker stopped during a job, and again when the job was retried."""
+
+
+class _Worker:
+    """A validator worker process, running one job at a time."""
+
+    def __init__(self, command: Sequence[str]):
+        self.jobs: int = 0
+        self.process: Popen = Popen(
+            command, stdin=PIPE, stdout=PIPE, stderr=DEVNULL, **get_popen_kwargs()
+        )
+        self._responses: queue.SimpleQueue[bytes | None] = queue.SimpleQueue()
+        self._reader: threading.Thread = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self) -> None:
+        for line in self.process.stdout:
+            self._responses.put(line)
+        self._responses.put(None)  # The worker has stopped.
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def run(self, path: str | os.PathLike[str], timeout: float) -> PopenResult | None:
+        """
+        Run a validation job, and get the result, or None if the worker stopped.
+
+        If the job takes longer than `timeout` seconds, the worker is stopped.
+        """
+        self.jobs += 1
+        request = json.dumps({"path": os.fspath(path)}) + "\n"
+        try:
+            self.process.stdin.write(request.encode("utf-8"))
+            self.process.stdin.flush()
+        except (OSError, ValueError):
+            return None
+        try:
+            line = self._responses.get(timeout=timeout)
+        except queue.Empty:
+            self.stop(graceful=False)
+            return PopenResult(
+                return_code=self.process.returncode, timeout=True, stdout=b"", stderr=b""
+            )
+        if line is None:
+            return None
+        try:
+            response = json.loads(line)
+            return PopenResult(
+                return_code=int(response["return_code"]),
+                timeout=False,
+                stdout=response.get("stdout", "").encode("utf-8"),
+                stderr=response.get("stderr", "").encode("utf-8"),
+            )
+        except (ValueError, TypeError, KeyError):
+            return None
+
+    def stop(self, graceful: bool = True) -> None:
+        """
+        Stop the worker.
+
+        :param graceful: If True, first close the worker stdin and wait for it to exit.
+        """
+        if graceful and self.is_alive():
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        if self.is_alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self._reader.join(timeout=1)
+        self.process.stdout.close()
+        if not self.process.stdin.closed:
+            self.process.stdin.close()
+
+
+class WorkerPool:
+    """
+    Run validation jobs on long-lived worker processes.
+
+    Up to `size` jobs run at once, and further callers wait for a free worker. Workers
+    are started when first needed, and replaced after `max_jobs` jobs, a timeout, or a
+    crash. The pool can be used by many threads, and as a context manager to close it.
+    """
+
+    def __init__(
+        self,
+        command: Sequence[str],
+        size: int = 2,
+        timeout: float = 100,
+        max_jobs: int = 100,
+    ):
+        """
+        :param command: The command to start a worker, as for subprocess.Popen.
+        :param size: The maximum number of workers.
+        :param timeout: Seconds to wait for each job before stopping the worker.
+        :param max_jobs: The number of jobs to run on a worker before replacing it.
+        """
+        if size < 1:
+            raise ValueError("The worker pool size must be at least 1.")
+        self.command: list[str] = list(command)
+        self.size: int = size
+        self.timeout: float = timeout
+        self.max_jobs: int = max_jobs
+        self._closed: bool = False
+        self._lock: threading.Lock = threading.Lock()
+        self._workers: set[_Worker] = set()
+        # Each item is a slot for a worker, or None if the worker isn't started yet.
+        self._idle: queue.LifoQueue[_Worker | None] = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _start_worker(self) -> _Worker:
+        with self._lock:
+            if self._closed:
+                raise PyXFormError("The validator worker pool is closed.")
+            worker = _Worker(command=self.command)
+            self._workers.add(worker)
+        return worker
+
+    def _stop_worker(self, worker: _Worker) -> None:
+        with self._lock:
+            self._workers.discard(worker)
+        worker.stop()
+
+    def run(self, path: str | os.PathLike[str]) -> PopenResult:
+        """
+        Validate the XForm at `path` on a worker, waiting for a free worker if needed.
+
+        If the worker stops during the job, the job is retried once on a new worker. If
+        that worker stops too, a WorkerCrashedError is raised.
+        """
+        if self._closed:
+            raise PyXFormError("The validator worker pool is closed.")
+        worker = self._idle.get()
+        try:
+            for _ in range(2):
+                if worker is not None and not worker.is_alive():
+                    self._stop_worker(worker)
+                    worker = None
+                if worker is None:
+                    worker = self._start_worker()
+                result = worker.run(path=path, timeout=self.timeout)
+                if result is not None:
+                    break
+                self._stop_worker(worker)
+                worker = None
+            else:
+                raise WorkerCrashedError(WORKER_CRASHED)  # noqa: TRY301
+            if result.timeout or self.max_jobs <= worker.jobs:
+                self._stop_worker(worker)
+                worker = None
+        except BaseException:
+            if worker is not None:
+                self._stop_worker(worker)
+                worker = None
+            raise
+        finally:
+            self._idle.put(worker)
+        return result
+
+    def close(self) -> None:
+        """Stop all workers. Jobs that are running raise an error."""
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
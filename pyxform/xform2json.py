@@ -13,7 +13,6 @@ from xml.etree.ElementTree import Element
 
 from defusedxml.ElementTree import ParseError, XMLParser, fromstring, parse
 
-from pyxform import builder
 from pyxform.constants import NSMAP
 from pyxform.errors import PyXFormError
 
@@ -374,6 +373,8 @@ class XFormToDictBuilder:
         return rs
 
     def survey(self):
+        from pyxform import builder
+
         new_doc = json.dumps(self.new_doc)
         _survey = builder.create_survey_element_from_json(new_doc)
         return _survey
@@ -21,7 +21,11 @@ from pyxform.entities.entities_parsing import (
     validate_entity_saveto,
 )
 from pyxform.errors import PyXFormError
-from pyxform.parsing.expression import is_pyxform_reference, is_xml_tag
+from pyxform.parsing.expression import (
+    expression_cache,
+    is_pyxform_reference,
+    is_xml_tag,
+)
 from pyxform.utils import PYXFORM_REFERENCE_REGEX, coalesce, default_is_dynamic
 from pyxform.validators.pyxform import choices as vc
 from pyxform.validators.pyxform import parameters_generic, select_from_file
@@ -372,6 +376,7 @@ def add_choices_info_to_question(
         question[constants.CHOICES] = choices[list_name]
 
 
+@expression_cache()
 def workbook_to_json(
     workbook_dict,
     form_name: str | None = None,
@@ -4,33 +4,51 @@ XLS-to-dict and csv-to-dict are essentially backends for xls2json.
 
 import csv
 import datetime
+import errno
+import logging
+import mmap
+import os
 import re
-from collections.abc import Callable, Iterator
+from collections.abc import Callable, Collection, Generator, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from enum import Enum
 from functools import reduce
-from io import BytesIO, IOBase, StringIO
+from io import (
+    SEEK_CUR,
+    SEEK_END,
+    SEEK_SET,
+    BytesIO,
+    IOBase,
+    RawIOBase,
+    StringIO,
+    TextIOBase,
+)
 from os import PathLike
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 from zipfile import BadZipFile
 
-from openpyxl import open as pyxl_open
-from openpyxl.cell import Cell as pyxlCell
-from openpyxl.reader.excel import ExcelReader
-from openpyxl.workbook import Workbook as pyxlWorkbook
-from openpyxl.worksheet.worksheet import Worksheet as pyxlWorksheet
-from xlrd import XL_CELL_BOOLEAN, XL_CELL_DATE, XL_CELL_NUMBER, XLRDError
-from xlrd import open_workbook as xlrd_open
-from xlrd.book import Book as xlrdBook
-from xlrd.sheet import Cell as xlrdCell
-from xlrd.sheet import Sheet as xlrdSheet
-from xlrd.xldate import XLDateAmbiguous, xldate_as_tuple
-
 from pyxform import constants
 from pyxform.errors import PyXFormError, PyXFormReadError
 
-aCell = xlrdCell | pyxlCell
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# The spreadsheet libraries are imported when a file of their type is processed.
+if TYPE_CHECKING:
+    from openpyxl.cell import Cell as pyxlCell
+    from openpyxl.workbook import Workbook as pyxlWorkbook
+    from openpyxl.worksheet.worksheet import Worksheet as pyxlWorksheet
+    from xlrd.book import Book as xlrdBook
+    from xlrd.sheet import Cell as xlrdCell
+    from xlrd.sheet import Sheet as xlrdSheet
+
+    from pyxform.xlsx_reader import XlsxCell, XlsxWorkbook, XlsxWorksheet
+
+    aCell = xlrdCell | pyxlCell | XlsxCell
+
 XL_DATE_AMBIGOUS_MSG = (
     "The xls file provided has an invalid date on the %s sheet, under"
     " the %s column on row number %s"
@@ -47,6 +65,11 @@ def _list_to_dict_list(list_items):
     return []
 
 
+# After a run of this many empty rows or columns, assume the end of the data is reached.
+MAX_ADJACENT_EMPTY_ROWS = 60
+MAX_ADJACENT_EMPTY_COLUMNS = 20
+
+
 def trim_trailing_empty(a_list: list, n_empty: int) -> list:
     """
     Trim trailing empty columns or rows. Avoids `[:-0] == []`, and unnecessary list copy.
@@ -57,9 +80,11 @@ def trim_trailing_empty(a_list: list, n_empty: int) -> list:
     return a_list
 
 
-def get_excel_column_headers(first_row: Iterator[str | None]) -> list[str | None]:
+def get_excel_column_headers(
+    first_row: Iterator[str | None],
+    max_adjacent_empty_columns: int = MAX_ADJACENT_EMPTY_COLUMNS,
+) -> list[str | None]:
     """Get column headers from the first row; stop if there's a run of empty columns."""
-    max_adjacent_empty_columns = 20
     column_header_list = []
     adjacent_empty_cols = 0
     for column_header in first_row:
@@ -84,11 +109,16 @@ def get_excel_column_headers(first_row: Iterator[str | None]) -> list[str | None
 
 def get_excel_rows(
     headers: Iterator[str | None],
-    rows: Iterator[tuple[aCell, ...]],
-    cell_func: Callable[[aCell, int, str], Any],
+    rows: Iterator[tuple["aCell", ...]],
+    cell_func: Callable[["aCell", int, str], Any],
+    max_adjacent_empty_rows: int = MAX_ADJACENT_EMPTY_ROWS,
 ) -> list[dict[str, Any]]:
-    """Get rows of cleaned data; stop if there's a run of empty rows."""
-    max_adjacent_empty_rows = 60
+    """
+    Get rows of cleaned data; stop if there's a run of empty rows.
+
+    Sheets may be formatted down to the last possible row, so the rows are read only
+    as far as needed, rather than up to the size that the sheet reports.
+    """
     col_header_enum = list(enumerate(headers))
     adjacent_empty_rows = 0
     result_rows = []
@@ -119,7 +149,11 @@ def get_excel_rows(
     return trim_trailing_empty(result_rows, adjacent_empty_rows)
 
 
-def xls_to_dict(path_or_file):
+def xls_to_dict(
+    path_or_file,
+    sheet_workers: int | None = None,
+    sheet_names: Collection[str] | None = None,
+):
     """
     Return a Python dictionary with a key for each worksheet
     name. For each sheet there is a list of dictionaries, each
@@ -127,10 +161,18 @@ def xls_to_dict(path_or_file):
     dictionary has keys taken from the column headers and values
     equal to the cell value for that row and column.
     All the keys and leaf elements are unicode text.
+
+    :param sheet_workers: See `read_sheets_concurrently`.
+    :param sheet_names: If provided, only these XLSForm sheets are read. The other sheet
+      names are included with no rows.
     """
 
     def xls_clean_cell(
-        wb: xlrdBook, wb_sheet: xlrdSheet, cell: xlrdCell, row_n: int, col_key: str
+        wb: "xlrdBook",
+        wb_sheet: "xlrdSheet",
+        cell: "xlrdCell",
+        row_n: int,
+        col_key: str,
     ) -> str | None:
         value = cell.value
         if isinstance(value, str):
@@ -145,7 +187,7 @@ def xls_to_dict(path_or_file):
 
         return None
 
-    def xls_to_dict_normal_sheet(wb: xlrdBook, wb_sheet: xlrdSheet):
+    def xls_to_dict_normal_sheet(wb: "xlrdBook", wb_sheet: "xlrdSheet"):
         # XLS format: max cols 256, max rows 65536
         first_row = (c.value for c in next(wb_sheet.get_rows(), []))
         headers = get_excel_column_headers(first_row=first_row)
@@ -155,7 +197,7 @@ def xls_to_dict(path_or_file):
         )
 
         # Inject wb/sheet as closure since functools.partial isn't typing friendly.
-        def clean_func(cell: xlrdCell, row_n: int, col_key: str) -> str | None:
+        def clean_func(cell: "xlrdCell", row_n: int, col_key: str) -> str | None:
             return xls_clean_cell(
                 wb=wb, wb_sheet=wb_sheet, cell=cell, row_n=row_n, col_key=col_key
             )
@@ -164,34 +206,59 @@ def xls_to_dict(path_or_file):
         column_header_list = [key for key in headers if key is not None]
         return rows, _list_to_dict_list(column_header_list)
 
-    def process_workbook(wb: xlrdBook):
+    def process_workbook(wb: "xlrdBook"):
         result_book = {}
-        for wb_sheet in wb.sheets():
+        sheetnames = wb.sheet_names()
+        concurrent_sheets = read_sheets_concurrently(
+            definition=wb_file,
+            file_type=SupportedFileTypes.xls,
+            sheet_names=sheetnames if sheet_names is None else (),
+            max_workers=sheet_workers,
+        )
+        for sheetname in sheetnames:
             # Note that the sheet exists but do no further processing here.
-            result_book[wb_sheet.name] = []
+            result_book[sheetname] = []
             # Do not process sheets that have nothing to do with XLSForm.
-            if wb_sheet.name not in constants.SUPPORTED_SHEET_NAMES:
-                if len(wb.sheets()) == 1:
+            if sheetname not in constants.SUPPORTED_SHEET_NAMES:
+                if len(sheetnames) == 1:
                     (
                         result_book[constants.SURVEY],
                         result_book[f"{constants.SURVEY}_header"],
-                    ) = xls_to_dict_normal_sheet(wb=wb, wb_sheet=wb_sheet)
+                    ) = xls_to_dict_normal_sheet(
+                        wb=wb, wb_sheet=wb.sheet_by_name(sheetname)
+                    )
                 else:
                     continue
+            elif sheet_names is not None and sheetname not in sheet_names:
+                continue
+            elif sheetname in concurrent_sheets:
+                (
+                    result_book[sheetname],
+                    result_book[f"{sheetname}_header"],
+                ) = concurrent_sheets[sheetname]
             else:
                 (
-                    result_book[wb_sheet.name],
-                    result_book[f"{wb_sheet.name}_header"],
-                ) = xls_to_dict_normal_sheet(wb=wb, wb_sheet=wb_sheet)
+                    result_book[sheetname],
+                    result_book[f"{sheetname}_header"],
+                ) = xls_to_dict_normal_sheet(wb=wb, wb_sheet=wb.sheet_by_name(sheetname))
         return result_book
 
+    from xlrd import XLRDError
+    from xlrd import open_workbook as xlrd_open
+    from xlrd.xldate import XLDateAmbiguous
+
     try:
-        wb_file = get_definition_data(definition=path_or_file)
-        workbook = xlrd_open(file_contents=wb_file.data.getvalue())
-        try:
-            return process_workbook(wb=workbook)
-        finally:
-            workbook.release_resources()
+        with open_definition(definition=path_or_file) as wb_file:
+            # xlrd closes an mmap when it is done with it, so it gets a copy. Sheets
+            # are loaded when first used, so sheets that are read by the workers or
+            # that aren't XLSForm sheets are not parsed here.
+            workbook = xlrd_open(
+                file_contents=bytes(wb_file.get_content()), on_demand=True
+            )
+            try:
+                return process_workbook(wb=workbook)
+            finally:
+                workbook.release_resources()
     except (AttributeError, TypeError, XLRDError) as read_err:
         raise PyXFormReadError(f"Error reading .xls file: {read_err}") from read_err
 
@@ -200,6 +267,9 @@ def xls_value_to_unicode(value, value_type, datemode) -> str:
     """
     Take a xls formatted value and try to make a unicode string representation.
     """
+    from xlrd import XL_CELL_BOOLEAN, XL_CELL_DATE, XL_CELL_NUMBER
+    from xlrd.xldate import xldate_as_tuple
+
     if value_type == XL_CELL_BOOLEAN:
         return "TRUE" if value else "FALSE"
     elif value_type == XL_CELL_NUMBER:
@@ -226,7 +296,12 @@ def xls_value_to_unicode(value, value_type, datemode) -> str:
         return str(value).replace(chr(160), " ")
 
 
-def xlsx_to_dict(path_or_file):
+def xlsx_to_dict(
+    path_or_file,
+    reader: str | None = None,
+    sheet_workers: int | None = None,
+    sheet_names: Collection[str] | None = None,
+):
     """
     Return a Python dictionary with a key for each worksheet
     name. For each sheet there is a list of dictionaries, each
@@ -234,9 +309,18 @@ def xlsx_to_dict(path_or_file):
     dictionary has keys taken from the column headers and values
     equal to the cell value for that row and column.
     All the keys and leaf elements are strings.
+
+    :param reader: The XLSX reader name, see `xlsx_reader.get_xlsx_reader`. If None and
+      the PYXFORM_XLSX_READER environment variable isn't set, the native reader is used
+      if any sheet does not specify its dimensions, and this is logged at INFO level.
+    :param sheet_workers: See `read_sheets_concurrently`.
+    :param sheet_names: If provided, only these XLSForm sheets are read. The other sheet
+      names are included with no rows.
     """
 
-    def xlsx_clean_cell(cell: pyxlCell, row_n: int, col_key: str) -> str | None:
+    def xlsx_clean_cell(
+        cell: "pyxlCell | XlsxCell", row_n: int, col_key: str
+    ) -> str | None:
         value = cell.value
         if isinstance(value, str):
             value = value.strip()
@@ -245,7 +329,7 @@ def xlsx_to_dict(path_or_file):
 
         return None
 
-    def xlsx_to_dict_normal_sheet(sheet: pyxlWorksheet):
+    def xlsx_to_dict_normal_sheet(sheet: "pyxlWorksheet | XlsxWorksheet"):
         # XLSX format: max cols 16384, max rows 1048576
         first_row = (c.value for c in next(sheet.rows, []))
         headers = get_excel_column_headers(first_row=first_row)
@@ -254,8 +338,15 @@ def xlsx_to_dict(path_or_file):
         column_header_list = [key for key in headers if key is not None]
         return rows, _list_to_dict_list(column_header_list)
 
-    def process_workbook(wb: pyxlWorkbook):
+    def process_workbook(wb: "pyxlWorkbook | XlsxWorkbook"):
         result_book = {}
+        concurrent_sheets = read_sheets_concurrently(
+            definition=wb_file,
+            file_type=SupportedFileTypes.xlsx,
+            sheet_names=wb.sheetnames if sheet_names is None else (),
+            max_workers=sheet_workers,
+            reader=reader,
+        )
         for sheetname in wb.sheetnames:
             wb_sheet = wb[sheetname]
             # Note that the sheet exists but do no further processing here.
@@ -269,6 +360,13 @@ def xlsx_to_dict(path_or_file):
                     ) = xlsx_to_dict_normal_sheet(wb_sheet)
                 else:
                     continue
+            elif sheet_names is not None and sheetname not in sheet_names:
+                continue
+            elif sheetname in concurrent_sheets:
+                (
+                    result_book[sheetname],
+                    result_book[f"{sheetname}_header"],
+                ) = concurrent_sheets[sheetname]
             else:
                 (
                     result_book[sheetname],
@@ -276,15 +374,52 @@ def xlsx_to_dict(path_or_file):
                 ) = xlsx_to_dict_normal_sheet(wb_sheet)
         return result_book
 
+    from pyxform.xlsx_reader import (
+        XLSX_READER_ENV,
+        XLSX_READER_NATIVE,
+        XlsxWorkbook,
+        get_xlsx_reader,
+    )
+
     try:
-        wb_file = get_definition_data(definition=path_or_file)
-        reader = ExcelReader(wb_file.data, read_only=True, data_only=True)
-        reader.read()
-        try:
-            return process_workbook(wb=reader.wb)
-        finally:
-            reader.wb.close()
-            reader.archive.close()
+        with open_definition(definition=path_or_file) as wb_file:
+            if get_xlsx_reader(name=reader) == XLSX_READER_NATIVE:
+                workbook = XlsxWorkbook(source=wb_file.data)
+                try:
+                    return process_workbook(wb=workbook)
+                finally:
+                    workbook.close()
+
+            from openpyxl.reader.excel import ExcelReader
+
+            excel_reader = ExcelReader(wb_file.data, read_only=True, data_only=True)
+            try:
+                # Without sheet dimensions, openpyxl reads every row of every sheet to
+                # find the sizes, which is slow if a sheet is formatted down to the last
+                # row. Unless a reader was chosen, use the native reader in that case:
+                # it gives the same data, and reads only the rows up to the end of the
+                # XLSForm data. It checks the dimensions with the same open archive.
+                if reader is None and not os.environ.get(XLSX_READER_ENV):
+                    workbook = XlsxWorkbook(source=excel_reader.archive)
+                    no_dimensions = [
+                        name
+                        for name in workbook.sheetnames
+                        if not workbook[name].has_dimensions()
+                    ]
+                    if no_dimensions:
+                        logger.info(
+                            "Using the native XLSX reader because these sheets do not "
+                            "specify their dimensions: %s",
+                            ", ".join(no_dimensions),
+                        )
+                        return process_workbook(wb=workbook)
+                excel_reader.read()
+                try:
+                    return process_workbook(wb=excel_reader.wb)
+                finally:
+                    excel_reader.wb.close()
+            finally:
+                excel_reader.archive.close()
     except (BadZipFile, KeyError, OSError, TypeError) as read_err:
         raise PyXFormReadError(f"Error reading .xlsx file: {read_err}") from read_err
 
@@ -395,8 +530,8 @@ def csv_to_dict(path_or_file):
         return _dict
 
     try:
-        csv_data = get_definition_data(definition=path_or_file)
-        csv_str = csv_data.data.getvalue().decode("utf-8")
+        with open_definition(definition=path_or_file) as csv_data:
+            csv_str = bytes(csv_data.get_content()).decode("utf-8")
         if not is_csv(data=csv_str):
             raise PyXFormError("The input data does not appear to be a valid XLSForm.")  # noqa: TRY301
         reader = csv.reader(StringIO(initial_value=csv_str, newline=""))
@@ -465,6 +600,9 @@ def sheet_to_csv(workbook_path, csv_path, sheet_name):
 
 
 def xls_sheet_to_csv(workbook_path, csv_path, sheet_name):
+    from xlrd import XLRDError
+    from xlrd import open_workbook as xlrd_open
+
     wb = xlrd_open(workbook_path)
     try:
         sheet = wb.sheet_by_name(sheet_name)
@@ -494,6 +632,8 @@ def xls_sheet_to_csv(workbook_path, csv_path, sheet_name):
 
 
 def xlsx_sheet_to_csv(workbook_path, csv_path, sheet_name):
+    from openpyxl import open as pyxl_open
+
     wb = pyxl_open(workbook_path, read_only=True, data_only=True)
     try:
         sheet = wb[sheet_name]
@@ -607,8 +747,8 @@ def md_to_dict(md: str | BytesIO):
         return sheets
 
     try:
-        md_data = get_definition_data(definition=md)
-        md_str = md_data.data.getvalue().decode("utf-8")
+        with open_definition(definition=md) as md_data:
+            md_str = bytes(md_data.get_content()).decode("utf-8")
         if not is_markdown_table(data=md_str):
             raise PyXFormError("The input data does not appear to be a valid XLSForm.")  # noqa: TRY301
         return process_md_data(md_=md_str)
@@ -616,12 +756,14 @@ def md_to_dict(md: str | BytesIO):
         raise PyXFormReadError(f"Error reading .md file: {read_err}") from read_err
 
 
-def md_table_to_workbook(mdstr: str) -> pyxlWorkbook:
+def md_table_to_workbook(mdstr: str) -> "pyxlWorkbook":
     """
     Convert Markdown table string to an openpyxl.Workbook. Call wb.save() to persist.
     """
+    from openpyxl.workbook import Workbook
+
     md_data = _md_table_to_ss_structure(mdstr=mdstr)
-    wb = pyxlWorkbook(write_only=True)
+    wb = Workbook(write_only=True)
     for key, rows in md_data:
         sheet = wb.create_sheet(title=key)
         for r in rows:
@@ -674,6 +816,67 @@ def is_csv(data: str) -> bool:
     return 4 <= count_characters_limit(data[:5000], ",", 4)
 
 
+def _read_sheet(
+    file_type: "SupportedFileTypes", source: str | bytes, sheet_name: str, kwargs: dict
+) -> tuple[list[dict], list[dict]]:
+    """
+    Read one XLSForm sheet for `read_sheets_concurrently`.
+
+    This is a module-level function so that it can be pickled for a worker process.
+    """
+    processor = SupportedFileTypes.get_processors()[file_type]
+    result_book = processor(source, sheet_names={sheet_name}, **kwargs)
+    return result_book[sheet_name], result_book[f"{sheet_name}_header"]
+
+
+def read_sheets_concurrently(
+    definition: "Definition",
+    file_type: "SupportedFileTypes",
+    sheet_names: Iterable[str],
+    max_workers: int | None,
+    **kwargs,
+) -> dict[str, tuple[list[dict], list[dict]]]:
+    """
+    Read the XLSForm sheets of a workbook concurrently, using worker processes.
+
+    Each worker opens the workbook and reads one sheet, so this only helps for workbooks
+    with more than one large sheet, e.g. a large external_choices sheet next to a large
+    survey sheet, on a machine with more than one CPU. The workers get the file path if
+    the workbook was read from a file, otherwise a copy of the content.
+
+    :param definition: The workbook data.
+    :param file_type: The workbook type, xlsx or xls.
+    :param sheet_names: The workbook sheet names. Only XLSForm sheets are read.
+    :param max_workers: The number of worker processes, up to the number of CPUs. If
+      None or 1, or if there is only one CPU or XLSForm sheet, no sheets are read and
+      the result is empty.
+    :param kwargs: Other arguments for the file type's processor.
+    :return: The rows and headers of each sheet that was read, by sheet name.
+    """
+    names = [n for n in sheet_names if n in constants.SUPPORTED_SHEET_NAMES]
+    cpu_count = os.cpu_count() or 1
+    if max_workers is None or max_workers <= 1 or len(names) <= 1 or cpu_count <= 1:
+        return {}
+    if definition.file_path is None:
+        source = bytes(definition.get_content())
+    else:
+        source = str(definition.file_path)
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers, len(names), cpu_count)
+    ) as executor:
+        futures = {
+            name: executor.submit(_read_sheet, file_type, source, name, kwargs)
+            for name in names
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+# The signatures at the start of .xlsx (zip archive) and .xls (OLE2 compound file) data.
+ZIP_SIGNATURES = (b"PK\x03\x04", b"PK\x05\x06")
+OLE2_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+SNIFF_SIZE = 5000
+
+
 class SupportedFileTypes(Enum):
     xlsx = ".xlsx"
     xlsm = ".xlsm"
@@ -691,27 +894,202 @@ class SupportedFileTypes(Enum):
         }
 
 
+class MappedFile(RawIOBase):
+    """
+    A read-only binary stream over a memory-mapped file.
+
+    The OS pages in the file content as it is read, rather than it being copied into
+    memory up front, so e.g. the zip reader for .xlsx files only reads the parts it needs.
+    """
+
+    def __init__(self, path: str | PathLike[str]):
+        with open(path, mode="rb") as f:
+            # The map stays valid after the file is closed.
+            self.mmap: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._position: int = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.mmap) if size is None or size < 0 else self._position + size
+        data = self.mmap[self._position : end]
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = SEEK_SET) -> int:
+        if whence == SEEK_SET:
+            position = offset
+        elif whence == SEEK_CUR:
+            position = self._position + offset
+        elif whence == SEEK_END:
+            position = len(self.mmap) + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence}).")
+        if position < 0:
+            # Like a file, rather than a BytesIO (which clamps the position to 0).
+            raise OSError(errno.EINVAL, f"Negative seek position {position}.")
+        self._position = position
+        return position
+
+    def tell(self) -> int:
+        return self._position
+
+    def getvalue(self) -> bytes:
+        return self.mmap[:]
+
+    def close(self) -> None:
+        """Close the map, which releases the file."""
+        if not self.closed:
+            self.mmap.close()
+        super().close()
+
+    def __enter__(self) -> "MappedFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
 @dataclass
 class Definition:
-    data: BytesIO
+    """
+    The form definition data, and hints about it from the file path (if any).
+
+    :param data: The data stream. A MappedFile for paths, the caller's stream for
+      seekable file objects at the start, otherwise a BytesIO.
+    :param file_type: The type suggested by the file path suffix.
+    :param file_path_stem: The file name without the suffix.
+    :param detected_file_type: The type detected from the start of the data, if any.
+    :param file_path: The file path, if the data was read from a file.
+    """
+
+    data: BytesIO | MappedFile | IOBase
     file_type: SupportedFileTypes | None
     file_path_stem: str | None
+    detected_file_type: SupportedFileTypes | None = None
+    file_path: Path | None = None
+
+    def get_content(self) -> bytes | mmap.mmap:
+        """
+        Get the whole data content. For a MappedFile, this is the mmap, which supports
+        the buffer protocol (like bytes), so that the content is not copied.
+        """
+        if isinstance(self.data, MappedFile):
+            return self.data.mmap
+        elif isinstance(self.data, BytesIO):
+            return self.data.getvalue()
+        self.data.seek(0)
+        return self.data.read()
+
+    def get_head(self, size: int = SNIFF_SIZE) -> bytes:
+        """Get up to `size` bytes from the start of the data."""
+        if isinstance(self.data, MappedFile):
+            return self.data.mmap[:size]
+        elif isinstance(self.data, BytesIO):
+            return self.data.getbuffer()[:size].tobytes()
+        position = self.data.tell()
+        try:
+            self.data.seek(0)
+            return self.data.read(size)
+        finally:
+            self.data.seek(position)
+
+    def close(self) -> None:
+        """
+        Close the data stream, if it was opened for a path (a MappedFile). The caller's
+        streams are left open.
+        """
+        if isinstance(self.data, MappedFile):
+            self.data.close()
+
+    def __enter__(self) -> "Definition":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def sniff_file_type(head: bytes) -> SupportedFileTypes | None:
+    """
+    Detect the file type from the start of the data.
+
+    The checks follow the order in which definition_to_dict would otherwise try parsing
+    each type, so e.g. text with enough pipes for a markdown table is markdown, even if
+    it also has enough commas for a CSV.
+
+    :param head: The first bytes of the data, at least SNIFF_SIZE if available.
+    :return: The detected type, or None if it is unclear.
+    """
+    if head.startswith(ZIP_SIGNATURES):
+        return SupportedFileTypes.xlsx
+    elif head.startswith(OLE2_SIGNATURE):
+        return SupportedFileTypes.xls
+    # The head may end part way through a multibyte character.
+    text = head[:SNIFF_SIZE].decode("utf-8", errors="ignore")
+    if is_markdown_table(data=text):
+        return SupportedFileTypes.md
+    elif is_csv(data=text):
+        return SupportedFileTypes.csv
+    return None
+
+
+def _read_path(file_path: Path) -> BytesIO | MappedFile:
+    """Get a stream for the file, memory-mapped if possible."""
+    try:
+        return MappedFile(path=file_path)
+    except (OSError, ValueError):
+        # Empty files can't be mapped, nor can some special files.
+        return BytesIO(file_path.read_bytes())
 
 
 def definition_to_dict(
     definition: str | PathLike[str] | bytes | BytesIO | IOBase | Definition,
     file_type: str | None = None,
+    xlsx_reader: str | None = None,
+    sheet_workers: int | None = None,
 ) -> dict:
     """
     Convert raw definition data to a dict ready for conversion to a XForm.
 
     :param definition: XLSForm definition data.
     :param file_type: If provided, attempt parsing the data only as this type. Otherwise,
-      parsing of supported data types will be attempted until one of them succeeds.
+      the type detected from the data is attempted first, then the other supported data
+      types until one of them succeeds.
+    :param xlsx_reader: The XLSX file reader, see `xlsx_reader.get_xlsx_reader`.
+    :param sheet_workers: For .xlsx and .xls files, the number of worker processes to
+      read the XLSForm sheets concurrently, see `read_sheets_concurrently`.
     :return:
     """
+    with open_definition(definition=definition) as definition_data:
+        return _definition_to_dict(
+            definition=definition_data,
+            file_type=file_type,
+            xlsx_reader=xlsx_reader,
+            sheet_workers=sheet_workers,
+        )
+
+
+def _definition_to_dict(
+    definition: Definition,
+    file_type: str | None,
+    xlsx_reader: str | None,
+    sheet_workers: int | None,
+) -> dict:
     supported = f"Must be one of: {', '.join(t.value for t in SupportedFileTypes)}"
     processors = SupportedFileTypes.get_processors()
+    if file_type is None and definition.detected_file_type in processors:
+        # Try the detected type first, and the others only if it fails.
+        detected = definition.detected_file_type
+        processors = {detected: processors[detected]} | processors
     if file_type is not None:
         try:
             ft = SupportedFileTypes(file_type)
@@ -722,8 +1100,12 @@ def definition_to_dict(
         else:
             processors = {ft: processors[ft]}
 
-    for func in processors.values():
+    for ft, func in processors.items():
         try:
+            if ft == SupportedFileTypes.xlsx:
+                return func(definition, reader=xlsx_reader, sheet_workers=sheet_workers)
+            elif ft == SupportedFileTypes.xls:
+                return func(definition, sheet_workers=sheet_workers)
             return func(definition)
         except PyXFormReadError:  # noqa: PERF203
             continue
@@ -733,20 +1115,43 @@ def definition_to_dict(
     )
 
 
+@contextmanager
+def open_definition(
+    definition: str | PathLike[str] | bytes | BytesIO | IOBase | Definition,
+) -> Generator[Definition, None, None]:
+    """
+    Get the form definition data, and close it at the end of the block.
+
+    A Definition is used as-is and left open, since it belongs to the caller.
+
+    :param definition: See `get_definition_data`.
+    """
+    if isinstance(definition, Definition):
+        yield definition
+        return
+    with get_definition_data(definition=definition) as result:
+        yield result
+
+
 def get_definition_data(
     definition: str | PathLike[str] | bytes | BytesIO | IOBase | Definition,
 ) -> Definition:
     """
     Get the form definition data from a path or bytes.
 
+    Files are memory-mapped, and seekable binary streams at the start are used as-is,
+    rather than being copied into memory. A stream is read from its current position.
+    Close the result when done with it, or use `open_definition`.
+
     :param definition: The path to the file to upload (string or PathLike), or the
-        form definition in memory (string or bytes).
+        form definition in memory (string or bytes), or a binary stream.
     """
     if isinstance(definition, Definition):
         return definition
     definition_data = None
     file_type = None
     file_path_stem = None
+    source_path = None
 
     # Read in data from paths, or failing that try to process the string.
     if isinstance(definition, str | PathLike):
@@ -770,7 +1175,8 @@ def get_definition_data(
                 except ValueError:
                     # The suffix was not a useful hint but we can try to parse anyway.
                     pass
-                definition = BytesIO(file_path.read_bytes())
+                definition = _read_path(file_path=file_path)
+                source_path = file_path
                 file_read = True
         if not file_read and isinstance(definition, str):
             definition = definition.encode("utf-8")
@@ -780,13 +1186,25 @@ def get_definition_data(
         # Normalise to BytesIO.
         if isinstance(definition, bytes):
             definition_data = BytesIO(definition)
-        elif isinstance(definition, BytesIO):  # BytesIO is a subtype of IOBase
+        elif isinstance(definition, BytesIO | MappedFile):  # Subtypes of IOBase.
+            definition_data = definition
+        elif (
+            definition.seekable()
+            and not isinstance(definition, TextIOBase)
+            and definition.tell() == 0
+        ):
+            # The readers seek to absolute positions in the stream, so it is only used
+            # as-is at the start. Otherwise the rest of it is copied, as for others.
             definition_data = definition
         else:
             definition_data = BytesIO(definition.read())
 
-    return Definition(
+    result = Definition(
         data=definition_data,
         file_type=file_type,
         file_path_stem=file_path_stem,
+        file_path=source_path,
     )
+    if definition_data is not None:
+        result.detected_file_type = sniff_file_type(head=result.get_head())
+    return result
@@ -4,19 +4,48 @@ use with ODK Collect.
 """
 
 import argparse
+import asyncio
+import base64
+import glob
 import json
 import logging
+import os
+import secrets
+import socketserver
+import sys
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from dataclasses import dataclass
-from io import BytesIO
+from io import BytesIO, TextIOWrapper
 from os import PathLike
 from os.path import splitext
 from pathlib import Path
-from typing import TYPE_CHECKING, BinaryIO
+from typing import TYPE_CHECKING, BinaryIO, TextIO
 
 from pyxform import builder, xls2json
-from pyxform.utils import coalesce, external_choices_to_csv, has_external_choices
+from pyxform.conversion_cache import CacheStore, get_cache_key
+from pyxform.conversion_stats import (
+    STAGE_BUILDER,
+    STAGE_FILE_READ,
+    STAGE_WORKBOOK_TO_JSON,
+    collect_stats,
+    stage,
+)
+from pyxform.errors import PyXFormError
+from pyxform.parsing.expression import expression_cache
+from pyxform.utils import (
+    as_text_stream,
+    coalesce,
+    external_choices_to_csv,
+    has_external_choices,
+)
 from pyxform.validators.odk_validate import ODKValidateError
+from pyxform.validators.util import check_xform_async
 from pyxform.xls2json_backends import (
+    SupportedFileTypes,
     definition_to_dict,
     get_definition_data,
 )
@@ -44,20 +73,26 @@ class ConvertResult:
     """
     Result data from the XLSForm to XForm conversion.
 
-    :param xform: The result XForm
+    :param xform: The result XForm, or None if it was written to an output stream.
     :param warnings: Warnings raised during conversion.
     :param itemsets: If the XLSForm defined external itemsets, a CSV version of them.
     :param _pyxform: Internal representation of the XForm, may change without notice.
+      None if the result was from a cache.
     :param _survey: Internal representation of the XForm, may change without notice.
+      None if the result was from a cache.
+    :param stats: If requested, the "wall_seconds", "cpu_seconds" and "peak_bytes" of
+      each conversion stage that ran, see `conversion_stats.STAGES`.
     """
 
-    xform: str
+    xform: str | None
     warnings: list[str]
     itemsets: str | None
-    _pyxform: dict
-    _survey: "Survey"
+    _pyxform: dict | None
+    _survey: "Survey | None"
+    stats: dict[str, dict[str, float]] | None = None
 
 
+@expression_cache()
 def convert(
     xlsform: str | PathLike[str] | bytes | BytesIO | BinaryIO | dict,
     warnings: list[str] | None = None,
@@ -67,6 +102,11 @@ def convert(
     form_name: str | None = None,
     default_language: str | None = None,
     file_type: str | None = None,
+    cache: CacheStore | None = None,
+    output: TextIO | BinaryIO | None = None,
+    stats: bool = False,
+    xlsx_reader: str | None = None,
+    sheet_workers: int | None = None,
 ) -> ConvertResult:
     """
     Run the XLSForm to XForm conversion.
@@ -91,34 +131,138 @@ def convert(
     :param file_type: If provided, attempt parsing the data only as this type. Otherwise,
       parsing of supported data types will be attempted until one of them succeeds. If the
       xlsform is provided as a dict, then it is used directly and this argument is ignored.
+    :param cache: If provided, look up the result in this store before converting, and
+      store the result after converting. The cache key is a hash of the XLSForm content,
+      the other arguments, and the pyxform version. A cached result does not include the
+      internal representations (_pyxform, _survey).
+    :param output: If provided, write the XForm to this text or binary stream as it is
+      generated (see Survey.write_xml), instead of returning it in the result. The
+      result xform is None. If a cache is provided, the XForm text is kept for the cache.
+    :param stats: If True, measure the time and memory used by each conversion stage,
+      and include them in the result stats. This slows down the conversion. The memory
+      is traced for the whole process, so a conversion that collects stats waits for
+      any other that is collecting them; see `conversion_stats`.
+    :param xlsx_reader: The XLSX file reader, "openpyxl" (the default) or "native". If
+      not provided, the PYXFORM_XLSX_READER environment variable is used if set. The
+      readers produce the same output.
+    :param sheet_workers: If more than 1, read the XLSForm sheets of an .xlsx or .xls
+      file concurrently using up to this many worker processes (and no more than the
+      number of CPUs). This helps for very large workbooks with more than one large
+      sheet.
     """
+    if stats:
+        with collect_stats() as conversion_stats:
+            result = convert(
+                xlsform=xlsform,
+                warnings=warnings,
+                validate=validate,
+                pretty_print=pretty_print,
+                enketo=enketo,
+                form_name=form_name,
+                default_language=default_language,
+                file_type=file_type,
+                cache=cache,
+                output=output,
+                xlsx_reader=xlsx_reader,
+                sheet_workers=sheet_workers,
+            )
+        result.stats = conversion_stats.as_dict()
+        return result
+
     warnings = coalesce(warnings, [])
     if isinstance(xlsform, dict):
         workbook_dict = xlsform
         fallback_form_name = None
+        definition = None
     else:
-        definition = get_definition_data(definition=xlsform)
+        with stage(STAGE_FILE_READ):
+            definition = get_definition_data(definition=xlsform)
         if file_type is None:
             file_type = definition.file_type
-        workbook_dict = definition_to_dict(definition=definition, file_type=file_type)
         fallback_form_name = definition.file_path_stem
-    pyxform_data = xls2json.workbook_to_json(
-        workbook_dict=workbook_dict,
-        form_name=form_name,
-        fallback_form_name=fallback_form_name,
-        default_language=default_language,
-        warnings=warnings,
-    )
-    survey = builder.create_survey_element_from_dict(pyxform_data)
+
+    try:
+        cache_key = None
+        if cache is not None:
+            if definition is None:
+                data = json.dumps(workbook_dict, sort_keys=True, default=str).encode(
+                    "utf-8"
+                )
+            else:
+                data = definition.get_content()
+            options = {
+                "validate": validate,
+                "pretty_print": pretty_print,
+                "enketo": enketo,
+                "form_name": form_name,
+                "default_language": default_language,
+                "file_type": getattr(file_type, "value", file_type),
+                "fallback_form_name": fallback_form_name,
+            }
+            cache_key = get_cache_key(data=data, options=options)
+            cached = cache.get(key=cache_key)
+            if cached is not None:
+                warnings.extend(cached["warnings"])
+                xform = cached["xform"]
+                if output is not None:
+                    _write_xform(xform=xform, output=output)
+                    xform = None
+                return ConvertResult(
+                    xform=xform,
+                    warnings=warnings,
+                    itemsets=cached["itemsets"],
+                    _pyxform=None,
+                    _survey=None,
+                )
+
+        if definition is not None:
+            with stage(STAGE_FILE_READ):
+                workbook_dict = definition_to_dict(
+                    definition=definition,
+                    file_type=file_type,
+                    xlsx_reader=xlsx_reader,
+                    sheet_workers=sheet_workers,
+                )
+    finally:
+        # Close the file opened for a path, unless the caller provided the Definition.
+        if definition is not None and definition is not xlsform:
+            definition.close()
+    warnings_start = len(warnings)
+
+    with stage(STAGE_WORKBOOK_TO_JSON):
+        pyxform_data = xls2json.workbook_to_json(
+            workbook_dict=workbook_dict,
+            form_name=form_name,
+            fallback_form_name=fallback_form_name,
+            default_language=default_language,
+            warnings=warnings,
+        )
+    with stage(STAGE_BUILDER):
+        survey = builder.create_survey_element_from_dict(pyxform_data)
+    # A cached result needs the XForm text, so it's written to the output afterwards.
+    stream_output = output is not None and cache is None
     xform = survey.to_xml(
         validate=validate,
         pretty_print=pretty_print,
         warnings=warnings,
         enketo=enketo,
+        output=output if stream_output else None,
     )
     itemsets = None
     if has_external_choices(json_struct=pyxform_data):
         itemsets = external_choices_to_csv(workbook_dict=workbook_dict)
+    if cache is not None:
+        cache.set(
+            key=cache_key,
+            value={
+                "xform": xform,
+                "warnings": warnings[warnings_start:],
+                "itemsets": itemsets,
+            },
+        )
+    if output is not None and not stream_output:
+        _write_xform(xform=xform, output=output)
+        xform = None
     return ConvertResult(
         xform=xform,
         warnings=warnings,
@@ -128,31 +272,446 @@ def convert(
     )
 
 
-def xls2xform_convert(
-    xlsform_path: str | PathLike[str],
-    xform_path: str | PathLike[str],
-    validate: bool = True,
-    pretty_print: bool = True,
+async def convert_async(
+    xlsform: str | PathLike[str] | bytes | BytesIO | BinaryIO | dict,
+    warnings: list[str] | None = None,
+    validate: bool = False,
+    pretty_print: bool = False,
     enketo: bool = False,
-) -> list[str]:
-    warnings = []
-    result = convert(
-        xlsform=xlsform_path,
-        validate=validate,
-        pretty_print=pretty_print,
-        enketo=enketo,
+    form_name: str | None = None,
+    default_language: str | None = None,
+    file_type: str | None = None,
+    cache: CacheStore | None = None,
+    output: TextIO | BinaryIO | None = None,
+    stats: bool = False,
+    xlsx_reader: str | None = None,
+    sheet_workers: int | None = None,
+) -> ConvertResult:
+    """
+    Run the XLSForm to XForm conversion, without blocking the event loop.
+
+    The parameters are the same as for `convert`. The conversion runs in a thread with
+    `asyncio.to_thread`. If validate=True or enketo=True, the validators then run as
+    asyncio subprocesses at the same time, so one event loop can run many validations.
+    If the calling task is cancelled, the validator processes are killed.
+
+    Validator results are not cached, and validator warnings are added after the
+    conversion warnings. If validating, the XForm is written to the output only after
+    the validators pass.
+    """
+    warnings = coalesce(warnings, [])
+    check = validate or enketo
+    result = await asyncio.to_thread(
+        convert,
+        xlsform=xlsform,
         warnings=warnings,
+        validate=False,
+        pretty_print=pretty_print,
+        enketo=False,
+        form_name=form_name,
+        default_language=default_language,
+        file_type=file_type,
+        cache=cache,
+        output=None if check else output,
+        stats=stats,
+        xlsx_reader=xlsx_reader,
+        sheet_workers=sheet_workers,
+    )
+    if check:
+        warnings.extend(
+            await check_xform_async(xform=result.xform, validate=validate, enketo=enketo)
+        )
+        if output is not None:
+            _write_xform(xform=result.xform, output=output)
+            result.xform = None
+    return result
+
+
+def _convert_one(xlsform, kwargs: dict) -> ConvertResult | Exception:
+    """
+    Run one conversion for `convert_many`, returning any error instead of raising it.
+
+    This is a module-level function so that it can be pickled for a worker process. The
+    internal representations are not returned, since they are large to send back.
+    """
+    try:
+        result = convert(xlsform=xlsform, **kwargs)
+    except Exception as err:
+        return err
+    return ConvertResult(
+        xform=result.xform,
+        warnings=result.warnings,
+        itemsets=result.itemsets,
+        _pyxform=None,
+        _survey=None,
     )
-    with open(xform_path, mode="w", encoding="utf-8") as f:
+
+
+def _get_future_result(future: Future) -> ConvertResult | Exception:
+    try:
+        return future.result()
+    except Exception as err:
+        return err
+
+
+def convert_many(
+    xlsforms: Iterable[str | PathLike[str] | bytes | dict],
+    max_workers: int | None = None,
+    validate: bool = False,
+    pretty_print: bool = False,
+    enketo: bool = False,
+    form_name: str | None = None,
+    default_language: str | None = None,
+    file_type: str | None = None,
+) -> list[ConvertResult | Exception]:
+    """
+    Run the XLSForm to XForm conversion for many XLSForms using worker processes.
+
+    Each XLSForm is converted independently by `convert`, so an error in one XLSForm
+    does not stop the conversion of the others. Instead of raising, the error is
+    returned in the position of that XLSForm. Warnings are available per XLSForm in
+    `ConvertResult.warnings`. The results do not include the internal representations
+    (_pyxform, _survey).
+
+    The inputs and results are sent between processes by pickling, so the XLSForms must
+    be paths, bytes, or dicts (not open files).
+
+    :param xlsforms: The input XLSForm file paths or contents.
+    :param max_workers: The number of worker processes. If None, the number of CPUs is
+      used. If 1, the conversions are run in the current process.
+    :param validate: If True, check the XForms with ODK Validate
+    :param pretty_print: If True, format the XForms with spaces, line breaks, etc.
+    :param enketo: If True, check the XForms with Enketo Validate.
+    :param form_name: Used for the main instance root node name.
+    :param default_language: The name of the default language for the forms.
+    :param file_type: If provided, attempt parsing the data only as this type.
+    :return: A ConvertResult or Exception for each XLSForm, in the input order.
+    """
+    kwargs = {
+        "validate": validate,
+        "pretty_print": pretty_print,
+        "enketo": enketo,
+        "form_name": form_name,
+        "default_language": default_language,
+        "file_type": file_type,
+    }
+    xlsforms = list(xlsforms)
+    if max_workers == 1 or len(xlsforms) <= 1:
+        return [_convert_one(x, kwargs) for x in xlsforms]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_convert_one, x, kwargs) for x in xlsforms]
+        results = [_get_future_result(f) for f in futures]
+    # If a worker process exits abruptly, all the pending conversions fail. These are
+    # run again one at a time, so that only the XLSForm that caused it fails.
+    for i, result in enumerate(results):
+        if isinstance(result, BrokenProcessPool):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(_convert_one, xlsforms[i], kwargs)
+                results[i] = _get_future_result(future)
+    return results
+
+
+def _write_xform(xform: str, output: TextIO | BinaryIO) -> None:
+    with as_text_stream(output) as writer:
+        writer.write(xform)
+
+
+@contextmanager
+def _open_xform_file(xform_path: str | PathLike[str]) -> Iterator[TextIO]:
+    """
+    Open a temporary file to write the XForm, which replaces `xform_path` when closed.
+
+    The temporary file is next to the output. If an error is raised, it is removed, and
+    any existing XForm file is kept. Unlike mkstemp, open applies the umask, so the file
+    permissions are as before.
+    """
+    tmp_path = Path(xform_path).with_name(
+        f".{Path(xform_path).name}.{secrets.token_hex(8)}.tmp"
+    )
+    try:
+        with open(tmp_path, mode="x", encoding="utf-8") as f:
+            yield f
+        os.replace(tmp_path, xform_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _write_result(result: ConvertResult, xform_path: str | PathLike[str]) -> None:
+    """Write the XForm and any external itemsets CSV to files."""
+    with _open_xform_file(xform_path=xform_path) as f:
         f.write(result.xform)
+    _write_itemsets(result=result, xform_path=xform_path)
+
+
+def _write_itemsets(result: ConvertResult, xform_path: str | PathLike[str]) -> None:
+    """Write any external itemsets CSV to a file next to the XForm."""
     if result.itemsets is not None:
         itemsets_path = Path(xform_path).parent / "itemsets.csv"
         with open(itemsets_path, mode="w", encoding="utf-8", newline="") as f:
             f.write(result.itemsets)
             logger.info("External choices csv is located at: %s", itemsets_path)
+
+
+def xls2xform_convert(
+    xlsform_path: str | PathLike[str],
+    xform_path: str | PathLike[str],
+    validate: bool = True,
+    pretty_print: bool = True,
+    enketo: bool = False,
+    stats: dict[str, dict[str, float]] | None = None,
+) -> list[str]:
+    """
+    Convert the XLSForm file to an XForm file, and get the conversion warnings.
+
+    :param stats: If provided, the conversion stage stats are added to this dict (see
+      ConvertResult.stats).
+    """
+    warnings = []
+    # The XForm replaces the output only if the conversion succeeds.
+    with _open_xform_file(xform_path=xform_path) as f:
+        result = convert(
+            xlsform=xlsform_path,
+            validate=validate,
+            pretty_print=pretty_print,
+            enketo=enketo,
+            warnings=warnings,
+            output=f,
+            stats=stats is not None,
+        )
+    _write_itemsets(result=result, xform_path=xform_path)
+    if stats is not None:
+        stats.update(result.stats)
     return warnings
 
 
+def get_batch_paths(path: str) -> list[Path]:
+    """
+    Get the XLSForm file paths for a directory or glob pattern, in sorted order.
+
+    For a directory, the files with a supported file type suffix are returned.
+    """
+    dir_path = Path(path)
+    if dir_path.is_dir():
+        suffixes = {t.value for t in SupportedFileTypes}
+        return sorted(p for p in dir_path.iterdir() if p.suffix in suffixes)
+    return sorted(Path(p) for p in glob.glob(path, recursive=True) if Path(p).is_file())
+
+
+def xls2xform_convert_many(
+    xlsform_paths: list[Path],
+    output_dir: str | PathLike[str] | None = None,
+    max_workers: int | None = None,
+    validate: bool = True,
+    pretty_print: bool = True,
+    enketo: bool = False,
+) -> list[tuple[Path, list[str] | Exception]]:
+    """
+    Convert many XLSForm files with `convert_many` and write the XForm files.
+
+    :param xlsform_paths: The input XLSForm file paths.
+    :param output_dir: The directory for the XForm files. If None, each XForm is written
+      next to the XLSForm.
+    :param max_workers: The number of worker processes.
+    :return: For each XLSForm, the XForm path and either the warnings or the error. If
+      more than one XLSForm has the same XForm path (e.g. "a.xls" and "a.xlsx"), they
+      are not converted, and get an error.
+    """
+    if output_dir is None:
+        xform_paths = [Path(get_xml_path(str(p))) for p in xlsform_paths]
+    else:
+        xform_paths = [Path(output_dir) / f"{p.stem}.xml" for p in xlsform_paths]
+    xform_path_counts = Counter(xform_paths)
+    results = iter(
+        convert_many(
+            xlsforms=[
+                p
+                for p, x in zip(xlsform_paths, xform_paths, strict=True)
+                if xform_path_counts[x] == 1
+            ],
+            max_workers=max_workers,
+            validate=validate,
+            pretty_print=pretty_print,
+            enketo=enketo,
+        )
+    )
+    output = []
+    for xform_path in xform_paths:
+        if 1 < xform_path_counts[xform_path]:
+            output.append(
+                (
+                    xform_path,
+                    PyXFormError(
+                        f"The XForm path '{xform_path}' is the same for more than one "
+                        f"XLSForm. Rename the XLSForms so that their names are unique."
+                    ),
+                )
+            )
+            continue
+        result = next(results)
+        if isinstance(result, Exception):
+            output.append((xform_path, result))
+            continue
+        try:
+            _write_result(result=result, xform_path=xform_path)
+        except OSError as err:
+            output.append((xform_path, err))
+        else:
+            output.append((xform_path, result.warnings))
+    return output
+
+
+SERVE_OPTIONS = (
+    "validate",
+    "pretty_print",
+    "enketo",
+    "form_name",
+    "default_language",
+    "file_type",
+)
+SERVE_WARM_UP_FORM = """
+| survey |
+|        | type | name | label |
+|        | text | a    | A     |
+"""
+
+
+def handle_serve_request(request: str) -> dict:
+    """
+    Run one conversion job for the `serve` mode, and get the response.
+
+    The request is a JSON object with the XLSForm as either a path / text / dict in
+    "xlsform", or base64-encoded file bytes in "data". Other keys are optional: "id" is
+    copied to the response, and the `convert` options "validate", "pretty_print",
+    "enketo", "form_name", "default_language", and "file_type" are passed through.
+
+    The response has the same "code" and "message" as the --json mode, plus the "xform",
+    "warnings" and "itemsets" from the ConvertResult.
+
+    :param request: A JSON object string.
+    """
+    response = {
+        "id": None,
+        "code": None,
+        "message": None,
+        "xform": None,
+        "warnings": [],
+        "itemsets": None,
+    }
+    try:
+        job = json.loads(request)
+        if not isinstance(job, dict):
+            raise TypeError("The request must be a JSON object.")  # noqa: TRY301
+        response["id"] = job.get("id")
+        if "stats" in job:
+            # The memory stats are for the whole process, so they'd include other jobs.
+            raise ValueError("The stats option is not supported in the serve mode.")  # noqa: TRY301
+        if "data" in job:
+            xlsform = base64.b64decode(job["data"])
+        else:
+            xlsform = job["xlsform"]
+        result = convert(
+            xlsform=xlsform,
+            warnings=[],
+            **{k: job[k] for k in SERVE_OPTIONS if k in job},
+        )
+        response["xform"] = result.xform
+        response["warnings"] = result.warnings
+        response["itemsets"] = result.itemsets
+        response["code"] = 100
+        response["message"] = "Ok!"
+        if result.warnings:
+            response["code"] = 101
+            response["message"] = "Ok with warnings."
+    except Exception as e:
+        # Catch the exception by default.
+        response["code"] = 999
+        response["message"] = str(e)
+    return response
+
+
+def serve(rfile: TextIO, wfile: TextIO) -> None:
+    """
+    Read JSON lines conversion requests from `rfile`, and write responses to `wfile`.
+
+    Runs until `rfile` is exhausted. Blank lines are ignored. See `handle_serve_request`
+    for the request and response format.
+    """
+    for line in rfile:
+        if not line.strip():
+            continue
+        wfile.write(json.dumps(handle_serve_request(request=line)))
+        wfile.write("\n")
+        wfile.flush()
+
+
+class _ServeRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        rfile = TextIOWrapper(self.rfile, encoding="utf-8")
+        wfile = TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+        try:
+            serve(rfile=rfile, wfile=wfile)
+        finally:
+            # The socket streams are closed by the StreamRequestHandler.
+            rfile.detach()
+            wfile.detach()
+
+
+def get_serve_socket_server(socket_path: str | PathLike[str]) -> socketserver.BaseServer:
+    """
+    Get a server for the `serve` protocol listening on a Unix socket.
+
+    Each connection is handled in a separate thread. Call `serve_forever()` to run it.
+
+    :param socket_path: The Unix socket file path. Any existing file is replaced.
+    """
+    Path(socket_path).unlink(missing_ok=True)
+    return socketserver.ThreadingUnixStreamServer(str(socket_path), _ServeRequestHandler)
+
+
+def _warm_up() -> None:
+    """Run a small conversion so that startup costs are paid before the first job."""
+    convert(xlsform=SERVE_WARM_UP_FORM, file_type=SupportedFileTypes.md.value)
+
+
+def _create_serve_parser():
+    """
+    Parse command line arguments for the `serve` mode.
+    """
+    parser = argparse.ArgumentParser(
+        prog="xls2xform --serve",
+        description="Keep pyxform loaded and run conversion jobs sent as JSON lines. "
+        "Each request is a JSON object with the XLSForm path, text or JSON in "
+        "'xlsform', or the base64-encoded XLSForm file in 'data'. Optional keys are "
+        "'id' and the convert() options: " + ", ".join(SERVE_OPTIONS) + ". Each "
+        "response is a JSON object with 'id', 'code', 'message', 'xform', 'warnings' "
+        "and 'itemsets'.",
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="Path for a Unix socket to listen on. Without this argument, requests are "
+        "read from stdin and responses are written to stdout.",
+    )
+    return parser
+
+
+def main_serve(argv: list[str] | None = None) -> None:
+    args = _create_serve_parser().parse_args(argv)
+    _warm_up()
+    if args.socket is None:
+        serve(rfile=sys.stdin, wfile=sys.stdout)
+    else:
+        with get_serve_socket_server(socket_path=args.socket) as server:
+            logger.info("Listening on: %s", args.socket)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                Path(args.socket).unlink(missing_ok=True)
+
+
 def _create_parser():
     """
     Parse command line arguments.
@@ -194,9 +753,43 @@ def _create_parser():
         default=False,
         help="Print XML forms with collapsed whitespace instead of pretty-printed.",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Convert all XLSForms in the path_to_XLSForm directory (or matching it as a "
+        "glob pattern) using N worker processes. The output_path, if provided, is the "
+        "directory to save the XForms to.",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        default=False,
+        help="Keep pyxform loaded and run conversion jobs sent as JSON lines, instead "
+        "of converting path_to_XLSForm. See: xls2xform --serve --help",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        default=False,
+        help="Print the wall time, CPU time, and peak memory of each conversion stage. "
+        "Not allowed with --jobs.",
+    )
     return parser
 
 
+def _format_stats(stats: dict[str, dict[str, float]]) -> str:
+    """Format the conversion stage stats as a table."""
+    lines = [f"{'stage':<17} {'wall (s)':>9} {'cpu (s)':>9} {'peak (KiB)':>11}"]
+    for name, values in stats.items():
+        lines.append(
+            f"{name:<17} {values['wall_seconds']:>9.4f} {values['cpu_seconds']:>9.4f} "
+            f"{values['peak_bytes'] / 1024:>11.0f}"
+        )
+    return "\n".join(lines)
+
+
 def _validator_args_logic(args):
     """
     Implements logic for how validator arguments work in combination.
@@ -222,11 +815,72 @@ def _validator_args_logic(args):
     return args
 
 
+def _main_cli_many(args):
+    """Convert many XLSForms for `main_cli` when the --jobs argument is provided."""
+    xlsform_paths = get_batch_paths(args.path_to_XLSForm)
+    if args.output_path is not None:
+        Path(args.output_path).mkdir(parents=True, exist_ok=True)
+    results = xls2xform_convert_many(
+        xlsform_paths=xlsform_paths,
+        output_dir=args.output_path,
+        max_workers=args.jobs,
+        validate=args.odk_validate,
+        pretty_print=args.pretty_print,
+        enketo=args.enketo_validate,
+    )
+    if args.json:
+        responses = []
+        for (xform_path, result), xlsform_path in zip(
+            results, xlsform_paths, strict=True
+        ):
+            response = {"path": str(xlsform_path), "output_path": str(xform_path)}
+            if isinstance(result, Exception):
+                response.update({"code": 999, "message": str(result), "warnings": []})
+            elif result:
+                response.update(
+                    {"code": 101, "message": "Ok with warnings.", "warnings": result}
+                )
+            else:
+                response.update({"code": 100, "message": "Ok!", "warnings": []})
+            responses.append(response)
+        logger.info(json.dumps(responses))
+    else:
+        for (xform_path, result), xlsform_path in zip(
+            results, xlsform_paths, strict=True
+        ):
+            if isinstance(result, Exception):
+                logger.error("Conversion failed for %s: %s", xlsform_path, result)
+                continue
+            for w in result:
+                logger.warning("%s: %s", xlsform_path, w)
+            logger.info("Conversion complete: %s", xform_path)
+
+
+def _create_serve_flag_parser():
+    """
+    Parse the --serve flag, and leave the other arguments for the `serve` mode parser.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--serve", action="store_true", default=False)
+    return parser
+
+
 def main_cli():
+    serve_args, serve_argv = _create_serve_flag_parser().parse_known_args()
+    if serve_args.serve:
+        main_serve(argv=serve_argv)
+        return
+
     parser = _create_parser()
     raw_args = parser.parse_args()
+    if raw_args.stats and raw_args.jobs is not None:
+        parser.error("argument --stats: not allowed with argument --jobs")
     args = _validator_args_logic(args=raw_args)
 
+    if args.jobs is not None:
+        _main_cli_many(args=args)
+        return
+
     # auto generate an output path if one was not given
     if args.output_path is None:
         args.output_path = get_xml_path(args.path_to_XLSForm)
@@ -235,6 +889,7 @@ def main_cli():
         # Store everything in a list just in case the user wants to output
         # as a JSON encoded string.
         response = {"code": None, "message": None, "warnings": []}
+        stats = {} if args.stats else None
 
         try:
             response["warnings"] = xls2xform_convert(
@@ -243,6 +898,7 @@ def main_cli():
                 validate=args.odk_validate,
                 pretty_print=args.pretty_print,
                 enketo=args.enketo_validate,
+                stats=stats,
             )
 
             response["code"] = 100
@@ -257,8 +913,11 @@ def main_cli():
             response["code"] = 999
             response["message"] = str(e)
 
+        if stats is not None:
+            response["stats"] = stats
         logger.info(json.dumps(response))
     else:
+        stats = {} if args.stats else None
         try:
             warnings = xls2xform_convert(
                 xlsform_path=args.path_to_XLSForm,
@@ -266,19 +925,21 @@ def main_cli():
                 validate=args.odk_validate,
                 pretty_print=args.pretty_print,
                 enketo=args.enketo_validate,
+                stats=stats,
             )
         except OSError:
             # Do not crash if 'java' not installed
             logger.exception("EnvironmentError during conversion")
         except ODKValidateError:
-            # Remove output file if there is an error
-            Path(args.output_path).unlink(missing_ok=True)
+            # xls2xform_convert keeps any existing output file if there is an error.
             logger.exception("ODKValidateError during conversion.")
         else:
             if len(warnings) > 0:
                 logger.warning("Warnings:")
             for w in warnings:
                 logger.warning(w)
+            if stats:
+                logger.info(_format_stats(stats=stats))
             logger.info("Conversion complete!")
 
 
@@ -0,0 +1,485 @@
+"""
+XLSX file readers.
+
+The default "openpyxl" reader uses openpyxl in read-only mode. The optional "native"
+reader parses the workbook parts with the standard library zipfile module and the
+defusedxml ElementTree parser instead. It reads only the shared strings, styles, and
+the worksheets that are requested, and creates a minimal cell object per cell, which is
+much faster for large sheets. It provides the subset of the openpyxl read-only workbook interface used by
+`xls2json_backends.xlsx_to_dict`, and gives the same cell values as openpyxl.
+"""
+
+import datetime
+import os
+import posixpath
+import re
+from collections.abc import Iterator
+from typing import IO
+from warnings import warn
+from zipfile import ZipFile
+
+from defusedxml import DefusedXmlException
+from defusedxml.ElementTree import ParseError, fromstring, iterparse
+
+from pyxform.errors import PyXFormError, PyXFormReadError
+
+XLSX_READER_ENV = "PYXFORM_XLSX_READER"
+XLSX_READER_OPENPYXL = "openpyxl"
+XLSX_READER_NATIVE = "native"
+XLSX_READERS = (XLSX_READER_OPENPYXL, XLSX_READER_NATIVE)
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_CONTENT_TYPES = "{http://schemas.openxmlformats.org/package/2006/content-types}"
+TAG_CELL = f"{NS_MAIN}c"
+TAG_VALUE = f"{NS_MAIN}v"
+TAG_ROW = f"{NS_MAIN}row"
+TAG_DIMENSION = f"{NS_MAIN}dimension"
+TAG_SHEET_DATA = f"{NS_MAIN}sheetData"
+TAG_INLINE_STRING = f"{NS_MAIN}is"
+TAG_SHARED_STRING = f"{NS_MAIN}si"
+TAG_TEXT = f"{NS_MAIN}t"
+TAG_RUN = f"{NS_MAIN}r"
+
+CONTENT_TYPE_WORKBOOKS = (
+    "application/vnd.ms-excel.template.macroEnabled.main+xml",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.template.main+xml",
+    "application/vnd.ms-excel.sheet.macroEnabled.main+xml",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml",
+)
+CONTENT_TYPE_SHARED_STRINGS = (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+)
+STYLES_PATH = "xl/styles.xml"
+
+# The built-in number formats for dates and times; the others are all for numbers.
+BUILTIN_DATE_FORMATS = {
+    14: "mm-dd-yy",
+    15: "d-mmm-yy",
+    16: "d-mmm",
+    17: "mmm-yy",
+    18: "h:mm AM/PM",
+    19: "h:mm:ss AM/PM",
+    20: "h:mm",
+    21: "h:mm:ss",
+    22: "m/d/yy h:mm",
+    45: "mm:ss",
+    46: "[h]:mm:ss",
+    47: "mmss.0",
+}
+# Number format patterns, as used by openpyxl to detect date and time formats.
+RE_FORMAT_STRIP = re.compile(r'".*?"|\[(?!hh?\]|mm?\]|ss?\])[^\]]*\]')
+RE_FORMAT_DATE = re.compile(r"(?<![_\\])[dmhysDMHYS]")
+RE_FORMAT_TIMEDELTA = re.compile(
+    r"\[hh?\](:mm(:ss(\.0*)?)?)?|\[mm?\](:ss(\.0*)?)?|\[ss?\](\.0*)?", re.IGNORECASE
+)
+RE_COORDINATE = re.compile(r"^\$?([A-Za-z]{1,3})\$?(\d+)$")
+RE_RANGE = re.compile(r"^\$?([A-Za-z]{1,3})\$?(\d+)(?::\$?([A-Za-z]{1,3})\$?(\d+))?$")
+WINDOWS_EPOCH = datetime.datetime(1899, 12, 30)
+MAC_EPOCH = datetime.datetime(1904, 1, 1)
+SECONDS_PER_DAY = 86400
+
+
+def get_xlsx_reader(name: str | None = None) -> str:
+    """
+    Get the XLSX reader name, or the name set in the environment, or the default.
+
+    :param name: The reader name. If None, the PYXFORM_XLSX_READER environment variable
+      is used, if it is set.
+    """
+    if name is None:
+        name = os.environ.get(XLSX_READER_ENV) or XLSX_READER_OPENPYXL
+    if name not in XLSX_READERS:
+        raise PyXFormError(
+            f"Unknown XLSX reader '{name}'. Supported readers: {', '.join(XLSX_READERS)}."
+        )
+    return name
+
+
+def is_date_format(fmt: str | None) -> bool:
+    if fmt is None:
+        return False
+    fmt = RE_FORMAT_STRIP.sub("", fmt.split(";")[0])
+    return RE_FORMAT_DATE.search(fmt) is not None
+
+
+def is_timedelta_format(fmt: str | None) -> bool:
+    if fmt is None:
+        return False
+    return RE_FORMAT_TIMEDELTA.search(fmt.split(";")[0]) is not None
+
+
+def from_excel(
+    value: float, epoch: datetime.datetime, timedelta: bool
+) -> datetime.datetime | datetime.time | datetime.timedelta:
+    """Convert an Excel date serial number to a datetime, time, or timedelta."""
+    if timedelta:
+        td = datetime.timedelta(days=value)
+        if td.microseconds:
+            # Round to millisecond precision.
+            td = datetime.timedelta(
+                seconds=td.total_seconds() // 1, microseconds=round(td.microseconds, -3)
+            )
+        return td
+    day, fraction = divmod(value, 1)
+    diff = datetime.timedelta(milliseconds=round(fraction * SECONDS_PER_DAY * 1000))
+    if 0 <= value < 1 and diff.days == 0:
+        minutes, seconds = divmod(diff.seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return datetime.time(hours, minutes, seconds, diff.microseconds)
+    if 0 < value < 60 and epoch == WINDOWS_EPOCH:
+        # Excel's 1900 calendar has a 29th of February 1900.
+        day += 1
+    return epoch + datetime.timedelta(days=day) + diff
+
+
+def column_index(letters: str, _cache: dict[str, int] = {}) -> int:  # noqa: B006
+    """Get the 1-based column index for the column letters, e.g. "AB" is 28."""
+    index = _cache.get(letters)
+    if index is None:
+        index = 0
+        for letter in letters.upper():
+            index = index * 26 + ord(letter) - 64
+        _cache[letters] = index
+    return index
+
+
+def _get_text(element) -> str:
+    """Get the text of a string item, without any phonetic text."""
+    parts = []
+    for child in element:
+        if child.tag == TAG_TEXT:
+            parts.append(child.text or "")
+        elif child.tag == TAG_RUN:
+            text = child.findtext(TAG_TEXT)
+            if text:
+                parts.append(text)
+    return "".join(parts)
+
+
+def _get_relationships(archive: ZipFile, part_path: str) -> dict[str, tuple[str, str]]:
+    """Get the (type, archive path) of each relationship of a part, by ID."""
+    folder, name = posixpath.split(part_path)
+    rels_path = posixpath.join(folder, "_rels", f"{name}.rels")
+    relationships = {}
+    for rel in fromstring(archive.read(rels_path)):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(folder, target))
+        relationships[rel.get("Id")] = (rel.get("Type", ""), target)
+    return relationships
+
+
+class XlsxCell:
+    """A worksheet cell value."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+EMPTY_CELL = XlsxCell(value=None)
+
+
+class XlsxWorksheet:
+    """
+    A worksheet, read from the archive when its rows are iterated.
+
+    Like the openpyxl read-only worksheet, the rows are limited to the sheet dimensions
+    (if the sheet specifies them), and missing rows and cells are filled in as empty.
+    """
+
+    def __init__(self, workbook: "XlsxWorkbook", path: str | None):
+        self.workbook: XlsxWorkbook = workbook
+        self.path: str | None = path
+
+    @property
+    def rows(self) -> Iterator[tuple[XlsxCell, ...]]:
+        return self.iter_rows()
+
+    def iter_rows(
+        self, min_row: int | None = None, max_col: int | None = None
+    ) -> Iterator[tuple[XlsxCell, ...]]:
+        """
+        Get the rows of cells.
+
+        :param min_row: The first row number (1-based) to get.
+        :param max_col: The number of columns to get. If None, the sheet dimensions are
+          used, or failing that, all the cells in each row.
+        """
+        if self.path is None:
+            return
+        min_row = min_row or 1
+        with self.workbook.archive.open(self.path) as source:
+            try:
+                yield from self._iter_rows(
+                    source=source, min_row=min_row, max_col=max_col
+                )
+            except (DefusedXmlException, ParseError) as err:
+                raise PyXFormReadError(f"Error reading .xlsx file: {err}") from err
+
+    def has_dimensions(self) -> bool:
+        """
+        Check if the sheet specifies its dimensions, reading only up to the cell data.
+
+        Without dimensions, the openpyxl read-only worksheet parses every row when it is
+        loaded to find the sheet size, which is slow if there are many formatted rows.
+        """
+        if self.path is None:
+            return True
+        with self.workbook.archive.open(self.path) as source:
+            try:
+                for _, element in iterparse(source, events=("start",)):
+                    if element.tag == TAG_DIMENSION:
+                        return True
+                    elif element.tag == TAG_SHEET_DATA:
+                        return False
+            except (DefusedXmlException, ParseError) as err:
+                raise PyXFormReadError(f"Error reading .xlsx file: {err}") from err
+        return False
+
+    def _iter_rows(
+        self, source: IO[bytes], min_row: int, max_col: int | None
+    ) -> Iterator[tuple[XlsxCell, ...]]:
+        max_col = max_col or None
+        max_row = None
+        dimensions_read = False
+        empty_row = ()
+        counter = min_row
+        row_n = 0
+        for _, element in iterparse(source):
+            tag = element.tag
+            if tag == TAG_DIMENSION:
+                dimensions = RE_RANGE.match(element.get("ref", ""))
+                if dimensions is not None:
+                    end_col, end_row = dimensions.group(3, 4)
+                    if end_col is None:
+                        end_col, end_row = dimensions.group(1, 2)
+                    max_col = max_col or column_index(end_col)
+                    max_row = int(end_row)
+            elif tag == TAG_ROW:
+                if not dimensions_read:
+                    dimensions_read = True
+                    if max_col is not None:
+                        empty_row = (EMPTY_CELL,) * max_col
+                number = element.get("r")
+                if number is None:
+                    row_n += 1
+                else:
+                    try:
+                        row_n = int(number)
+                    except ValueError:
+                        value = float(number)
+                        if not value.is_integer():
+                            raise PyXFormReadError(
+                                f"{number} is not a valid row number"
+                            ) from None
+                        row_n = int(value)
+                if max_row is not None and max_row < row_n:
+                    break
+                while counter < row_n:
+                    counter += 1
+                    yield empty_row
+                if counter <= row_n:
+                    counter += 1
+                    yield self._get_row(row=element, max_col=max_col)
+                element.clear()
+        if max_row is not None and max_row < row_n:
+            for _ in range(counter, max_row + 1):
+                yield empty_row
+
+    def _get_row(self, row, max_col: int | None) -> tuple[XlsxCell, ...]:
+        cells = {}
+        column = 0
+        for cell in row:
+            if cell.tag != TAG_CELL:
+                continue
+            coordinate = cell.get("r")
+            if coordinate is None:
+                column += 1
+            else:
+                match = RE_COORDINATE.match(coordinate)
+                if match is None:
+                    raise PyXFormReadError(f"Invalid cell coordinates ({coordinate})")
+                column = column_index(match.group(1))
+            if max_col is None or column <= max_col:
+                cells[column] = self.workbook.get_cell_value(cell=cell)
+        if not cells and not max_col:
+            return ()
+        if max_col is None:
+            max_col = column
+        new_row = [EMPTY_CELL] * max_col
+        for column, value in cells.items():
+            if 1 <= column:
+                new_row[column - 1] = XlsxCell(value=value)
+        return tuple(new_row)
+
+
+class XlsxWorkbook:
+    """
+    A workbook, with the sheet names and shared data read from the archive.
+
+    :param source: The XLSX file path or binary stream, or an open archive. An open
+      archive is not closed by `close`, since it belongs to the caller.
+    """
+
+    def __init__(self, source: str | os.PathLike[str] | IO[bytes] | ZipFile):
+        if isinstance(source, ZipFile):
+            self.archive: ZipFile = source
+            self._owns_archive: bool = False
+        elif isinstance(source, str | os.PathLike) or hasattr(source, "read"):
+            self.archive: ZipFile = ZipFile(source)
+            self._owns_archive: bool = True
+        else:
+            raise TypeError(f"Expected a file path or stream, got {type(source)}.")
+        try:
+            self._read_workbook()
+        except (DefusedXmlException, ParseError) as err:
+            self.close()
+            raise PyXFormReadError(f"Error reading .xlsx file: {err}") from err
+        except BaseException:
+            self.close()
+            raise
+        self._shared_strings: list[str] | None = None
+
+    def _read_workbook(self) -> None:
+        content_types = fromstring(self.archive.read("[Content_Types].xml"))
+        overrides = {}
+        for override in content_types.iter(f"{NS_CONTENT_TYPES}Override"):
+            overrides.setdefault(override.get("ContentType"), override.get("PartName"))
+        workbook_path = next(
+            (overrides[c] for c in CONTENT_TYPE_WORKBOOKS if overrides.get(c)), None
+        )
+        if workbook_path is None:
+            defaults = {
+                d.get("ContentType")
+                for d in content_types.iter(f"{NS_CONTENT_TYPES}Default")
+            }
+            if defaults.isdisjoint(CONTENT_TYPE_WORKBOOKS):
+                raise OSError("File contains no valid workbook part")
+            workbook_path = "/xl/workbook.xml"
+        workbook_path = workbook_path[1:]
+        shared_strings_path = overrides.get(CONTENT_TYPE_SHARED_STRINGS)
+        self._shared_strings_path: str | None = (
+            shared_strings_path[1:] if shared_strings_path else None
+        )
+
+        workbook = fromstring(self.archive.read(workbook_path))
+        properties = workbook.find(f"{NS_MAIN}workbookPr")
+        date1904 = properties is not None and properties.get("date1904") in {
+            "1",
+            "true",
+        }
+        self.epoch: datetime.datetime = MAC_EPOCH if date1904 else WINDOWS_EPOCH
+
+        relationships = _get_relationships(archive=self.archive, part_path=workbook_path)
+        files = set(self.archive.namelist())
+        self._sheets: dict[str, XlsxWorksheet] = {}
+        for sheet in workbook.iter(f"{NS_MAIN}sheet"):
+            rel_id = sheet.get(f"{NS_REL}id")
+            if not rel_id:
+                warn(
+                    f"File contains an invalid specification for {sheet.get('name')}. "
+                    "This will be removed",
+                    stacklevel=2,
+                )
+                continue
+            rel_type, target = relationships[rel_id]
+            if target not in files:
+                continue
+            # Chart sheets are included in the names, but have no cells.
+            path = None if "chartsheet" in rel_type else target
+            self._sheets[sheet.get("name")] = XlsxWorksheet(workbook=self, path=path)
+        self._read_styles(files=files)
+
+    def _read_styles(self, files: set[str]) -> None:
+        self._date_styles: set[int] = set()
+        self._timedelta_styles: set[int] = set()
+        if STYLES_PATH not in files:
+            return
+        styles = fromstring(self.archive.read(STYLES_PATH))
+        custom = {
+            int(f.get("numFmtId")): f.get("formatCode")
+            for f in styles.iter(f"{NS_MAIN}numFmt")
+        }
+        cell_styles = styles.find(f"{NS_MAIN}cellXfs")
+        if cell_styles is None:
+            return
+        for index, xf in enumerate(cell_styles.iter(f"{NS_MAIN}xf")):
+            format_id = int(xf.get("numFmtId", 0))
+            fmt = custom.get(format_id, BUILTIN_DATE_FORMATS.get(format_id))
+            if is_date_format(fmt):
+                self._date_styles.add(index)
+            if is_timedelta_format(fmt):
+                self._timedelta_styles.add(index)
+
+    @property
+    def sheetnames(self) -> list[str]:
+        return list(self._sheets)
+
+    def __getitem__(self, name: str) -> XlsxWorksheet:
+        return self._sheets[name]
+
+    @property
+    def shared_strings(self) -> list[str]:
+        """The shared strings table, read when it is first used."""
+        if self._shared_strings is None:
+            self._shared_strings = []
+            if self._shared_strings_path is not None:
+                with self.archive.open(self._shared_strings_path) as source:
+                    for _, element in iterparse(source):
+                        if element.tag == TAG_SHARED_STRING:
+                            text = _get_text(element=element)
+                            self._shared_strings.append(text.replace("x005F_", ""))
+                            element.clear()
+        return self._shared_strings
+
+    def get_cell_value(self, cell):
+        """
+        Get the value of a cell element.
+
+        Like openpyxl with data_only=True, formula cells have their cached value, and
+        numbers with a date or time format are converted to datetime types.
+        """
+        data_type = cell.get("t", "n")
+        if data_type == "inlineStr":
+            inline = cell.find(TAG_INLINE_STRING)
+            return None if inline is None else _get_text(element=inline)
+        value = cell.findtext(TAG_VALUE) or None
+        if value is None:
+            return None
+        elif data_type == "n":
+            if "." in value or "E" in value or "e" in value:
+                value = float(value)
+            else:
+                value = int(value)
+            style = cell.get("s", "0")
+            if style and int(style) in self._date_styles:
+                try:
+                    return from_excel(
+                        value=value,
+                        epoch=self.epoch,
+                        timedelta=int(style) in self._timedelta_styles,
+                    )
+                except (OverflowError, ValueError):
+                    return "#VALUE!"
+            return value
+        elif data_type == "s":
+            return self.shared_strings[int(value)]
+        elif data_type == "b":
+            return bool(int(value))
+        elif data_type == "d":
+            # ISO 8601 dates are only written in strict mode, so this is rare.
+            from openpyxl.utils.datetime import from_ISO8601
+
+            return from_ISO8601(value)
+        return value
+
+    def close(self) -> None:
+        if self._owns_archive:
+            self.archive.close()
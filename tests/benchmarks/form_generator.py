@@ -0,0 +1,167 @@
+"""
+Generate synthetic XLSForms for benchmarks.
+"""
+
+from dataclasses import asdict, dataclass
+from io import BytesIO
+from random import Random
+
+from openpyxl import Workbook
+
+# The question types to cycle through, for questions not referring to choices.
+QUESTION_TYPES = ("text", "integer", "decimal", "date", "select_one", "select_multiple")
+# IANA language subtags for the label languages.
+LANGUAGE_CODES = ("en", "fr", "es", "de", "pt", "sw", "ar", "zh", "hi", "ru")
+
+
+@dataclass(frozen=True)
+class FormSpec:
+    """
+    The parameters of a synthetic XLSForm.
+
+    :param questions: The number of questions.
+    :param sections: The number of top-level groups or repeats.
+    :param depth: The nesting depth of each section. Nested sections alternate between
+      groups and repeats, starting with a group, so depth=2 is a repeat in a group.
+    :param languages: The number of label languages. If 1, the labels have no language.
+    :param choice_lists: The number of choice lists.
+    :param choices: The number of choices in each choice list.
+    :param external_instances: The number of external CSV and XML instances. Each one has
+      a question that uses it.
+    :param reference_density: The chance (0 to 1) that each question has a ${} reference
+      to an earlier question in each of the label, relevant, and constraint columns.
+    :param seed: The random seed, so that the same spec generates the same form.
+    """
+
+    questions: int = 100
+    sections: int = 5
+    depth: int = 1
+    languages: int = 1
+    choice_lists: int = 10
+    choices: int = 5
+    external_instances: int = 0
+    reference_density: float = 0.5
+    seed: int = 1
+
+    @property
+    def name(self) -> str:
+        return "-".join(f"{k}={v}" for k, v in asdict(self).items() if k != "seed")
+
+
+def _get_languages(spec: FormSpec) -> list[str]:
+    if spec.languages <= 1:
+        return [""]
+    return [
+        f"::lang{n}({LANGUAGE_CODES[n % len(LANGUAGE_CODES)]})"
+        for n in range(spec.languages)
+    ]
+
+
+def _get_survey_rows(spec: FormSpec, languages: list[str]) -> list[list[str]]:
+    rand = Random(spec.seed)  # noqa: S311 - Not for security.
+    header = [
+        "type",
+        "name",
+        *(f"label{lang}" for lang in languages),
+        "relevant",
+        "constraint",
+        "calculation",
+    ]
+    rows = [header]
+    names = []
+
+    def reference() -> str:
+        return f"${{{rand.choice(names)}}}" if names else ""
+
+    def add_row(q_type, name, label="", relevant="", constraint="", calculation=""):
+        labels = [f"{label}{lang}" if label else "" for lang in languages]
+        rows.append([q_type, name, *labels, relevant, constraint, calculation])
+
+    def add_question(n: int):
+        q_type = QUESTION_TYPES[n % len(QUESTION_TYPES)]
+        if q_type.startswith("select") and 0 < spec.choice_lists:
+            q_type = f"{q_type} list{n % spec.choice_lists}"
+        elif q_type.startswith("select"):
+            q_type = "text"
+        label = f"Question {n}"
+        relevant = constraint = ""
+        if rand.random() < spec.reference_density:
+            label = f"{label} after {reference()}"
+        if rand.random() < spec.reference_density:
+            relevant = f"{reference()} != ''"
+        if q_type == "integer" and rand.random() < spec.reference_density:
+            constraint = f". > {reference()} or {reference()} = ''"
+        name = f"q{n}"
+        add_row(q_type, name, label, relevant, constraint)
+        names.append(name)
+
+    # Spread the questions evenly between the innermost level of each section.
+    sections = max(1, spec.sections)
+    per_section = [spec.questions // sections] * sections
+    for n in range(spec.questions % sections):
+        per_section[n] += 1
+    n = 0
+    for s, count in enumerate(per_section):
+        for d in range(spec.depth):
+            kind = "repeat" if d % 2 else "group"
+            add_row(f"begin {kind}", f"s{s}_{kind}{d}", f"Section {s} {d}")
+        for _ in range(count):
+            add_question(n)
+            n += 1
+        for d in reversed(range(spec.depth)):
+            kind = "repeat" if d % 2 else "group"
+            add_row(f"end {kind}", "")
+
+    for e in range(spec.external_instances):
+        add_row(f"select_one_from_file ext{e}.csv", f"ext_csv{e}", f"External {e}")
+        add_row("xml-external", f"ext_xml{e}")
+        key = reference() or "'a'"
+        lookup = f"instance('ext_xml{e}')/root/item[name = {key}]/label"
+        add_row("calculate", f"ext_calc{e}", calculation=lookup)
+    return rows
+
+
+def _get_choices_rows(spec: FormSpec, languages: list[str]) -> list[list[str]]:
+    rows = [["list_name", "name", *(f"label{lang}" for lang in languages)]]
+    for n in range(spec.choice_lists):
+        for c in range(spec.choices):
+            labels = [f"Choice {c}{lang}" for lang in languages]
+            rows.append([f"list{n}", f"c{c}", *labels])
+    return rows
+
+
+def get_form_sheets(spec: FormSpec) -> dict[str, list[list[str]]]:
+    """
+    Generate the sheets of an XLSForm.
+
+    :param spec: The form parameters.
+    :return: The rows of each sheet, with the column headers in the first row.
+    """
+    languages = _get_languages(spec=spec)
+    settings = [["form_title", "form_id"], ["Benchmark", "benchmark"]]
+    if 1 < len(languages):
+        settings[0].append("default_language")
+        settings[1].append(languages[0][2:])
+    sheets = {
+        "survey": _get_survey_rows(spec=spec, languages=languages),
+        "choices": _get_choices_rows(spec=spec, languages=languages),
+        "settings": settings,
+    }
+    return sheets
+
+
+def get_form_xlsx(spec: FormSpec) -> bytes:
+    """
+    Generate an XLSForm .xlsx file.
+
+    :param spec: The form parameters.
+    :return: The file content.
+    """
+    wb = Workbook(write_only=True)
+    for name, rows in get_form_sheets(spec=spec).items():
+        sheet = wb.create_sheet(title=name)
+        for row in rows:
+            sheet.append([v or None for v in row])
+    data = BytesIO()
+    wb.save(data)
+    return data.getvalue()
@@ -0,0 +1,233 @@
+"""
+Run the conversion benchmarks, and write the results to a JSON report.
+
+Each stage of `convert` is timed separately: reading the file, workbook_to_json, the
+builder, Survey.xml, and serializing the XML. The stages are measured with the same
+`conversion_stats` used by `convert`. The time is the best of the runs, and the memory
+is the peak allocated by each stage (measured in a separate run, since tracing
+allocations slows down the conversion).
+
+Usage, to run the benchmarks and compare the results to a previous report:
+
+    python -m tests.benchmarks.run_benchmarks --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+from collections.abc import Iterable
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from pyxform import __version__, builder, conversion_stats, xls2json
+from pyxform.parsing.expression import expression_cache
+from pyxform.xls2json_backends import definition_to_dict, get_definition_data
+
+from tests.benchmarks.form_generator import FormSpec, get_form_xlsx
+
+STAGE_SURVEY_XML = "survey_xml"
+STAGE_SERIALIZATION = "serialization"
+STAGES = (
+    conversion_stats.STAGE_FILE_READ,
+    conversion_stats.STAGE_WORKBOOK_TO_JSON,
+    conversion_stats.STAGE_BUILDER,
+    STAGE_SURVEY_XML,
+    STAGE_SERIALIZATION,
+)
+PRESETS = {
+    "small": (
+        FormSpec(questions=100),
+        FormSpec(questions=100, depth=3, languages=3, external_instances=2),
+    ),
+    "medium": (
+        FormSpec(questions=1000, sections=20),
+        FormSpec(questions=1000, sections=20, depth=3, languages=5, choices=20),
+        FormSpec(questions=1000, sections=20, reference_density=1.0),
+    ),
+    "large": (
+        FormSpec(questions=5000, sections=50),
+        FormSpec(questions=5000, sections=50, depth=4, languages=5, choices=50),
+        FormSpec(
+            questions=5000, sections=50, external_instances=20, reference_density=1.0
+        ),
+    ),
+}
+
+
+def _run_stages(data: bytes, trace_memory: bool) -> dict[str, dict[str, float]]:
+    """Run the conversion stages, and get the `conversion_stats` for each stage."""
+    with (
+        expression_cache(),
+        conversion_stats.collect_stats(trace_memory=trace_memory) as stats,
+    ):
+        with conversion_stats.stage(conversion_stats.STAGE_FILE_READ):
+            workbook_dict = definition_to_dict(
+                definition=get_definition_data(definition=data)
+            )
+        with conversion_stats.stage(conversion_stats.STAGE_WORKBOOK_TO_JSON):
+            pyxform_data = xls2json.workbook_to_json(
+                workbook_dict=workbook_dict, fallback_form_name="benchmark"
+            )
+        with conversion_stats.stage(conversion_stats.STAGE_BUILDER):
+            survey = builder.create_survey_element_from_dict(pyxform_data)
+        with conversion_stats.stage(STAGE_SURVEY_XML):
+            root = survey.xml()
+        with conversion_stats.stage(STAGE_SERIALIZATION):
+            root.toprettyxml(indent="  ")
+    return stats.as_dict()
+
+
+def time_stages(data: bytes) -> dict[str, float]:
+    """Get the time in seconds of each conversion stage."""
+    stats = _run_stages(data=data, trace_memory=False)
+    return {name: s["wall_seconds"] for name, s in stats.items()}
+
+
+def trace_stages(data: bytes) -> dict[str, int]:
+    """Get the peak memory in bytes allocated during each conversion stage."""
+    stats = _run_stages(data=data, trace_memory=True)
+    return {name: s["peak_bytes"] for name, s in stats.items()}
+
+
+def run_benchmark(spec: FormSpec, runs: int = 5) -> dict[str, Any]:
+    """
+    Run the benchmark for a form.
+
+    :param spec: The form parameters.
+    :param runs: The number of timed runs.
+    :return: The form parameters, and the best time and peak memory for each stage.
+    """
+    data = get_form_xlsx(spec=spec)
+    times = [time_stages(data=data) for _ in range(runs)]
+    peaks = trace_stages(data=data)
+    stages = {
+        name: {
+            "seconds": min(t[name] for t in times),
+            "peak_bytes": peaks[name],
+        }
+        for name in STAGES
+    }
+    return {
+        "name": spec.name,
+        "spec": asdict(spec),
+        "file_bytes": len(data),
+        "total_seconds": sum(s["seconds"] for s in stages.values()),
+        "stages": stages,
+    }
+
+
+def _get_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S607 - git from PATH.
+            capture_output=True,
+            check=True,
+            cwd=Path(__file__).parent,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run_benchmarks(specs: Iterable[FormSpec], runs: int = 5) -> dict[str, Any]:
+    """
+    Run the benchmarks, and get the report.
+
+    :param specs: The forms to benchmark.
+    :param runs: The number of timed runs for each form.
+    """
+    return {
+        "pyxform_version": __version__,
+        "commit": _get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.now(tz=timezone.utc).isoformat(),
+        "runs": runs,
+        "results": [run_benchmark(spec=spec, runs=runs) for spec in specs],
+    }
+
+
+def compare_reports(
+    base: dict[str, Any], new: dict[str, Any]
+) -> list[dict[str, str | float]]:
+    """
+    Compare two reports, for the forms in both reports.
+
+    :param base: The report to compare against, e.g. from the previous commit.
+    :param new: The new report.
+    :return: For each form and stage, the base and new values and their ratio, where a
+      ratio less than 1 is an improvement.
+    """
+    base_results = {r["name"]: r for r in base["results"]}
+    rows = []
+    for result in new["results"]:
+        base_result = base_results.get(result["name"])
+        if base_result is None:
+            continue
+        for stage in (*STAGES, "total"):
+            if stage == "total":
+                old, now = base_result["total_seconds"], result["total_seconds"]
+                metrics = (("seconds", old, now),)
+            else:
+                old_stage, new_stage = (
+                    base_result["stages"][stage],
+                    result["stages"][stage],
+                )
+                metrics = tuple(
+                    (k, old_stage[k], new_stage[k]) for k in ("seconds", "peak_bytes")
+                )
+            for metric, old_value, new_value in metrics:
+                rows.append(
+                    {
+                        "name": result["name"],
+                        "stage": stage,
+                        "metric": metric,
+                        "base": old_value,
+                        "new": new_value,
+                        "ratio": new_value / old_value if old_value else 0.0,
+                    }
+                )
+    return rows
+
+
+def _format_comparison(rows: list[dict[str, str | float]]) -> str:
+    lines = []
+    name = None
+    for row in rows:
+        if row["name"] != name:
+            name = row["name"]
+            lines.append(name)
+        spec = ".4f" if row["metric"] == "seconds" else ",.0f"
+        lines.append(
+            f"  {row['stage']:<17} {row['metric']:<10} {row['base']:>14{spec}} "
+            f"{row['new']:>14{spec}} {row['ratio']:>7.2f}x"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--preset", choices=PRESETS, default="small")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="Path to write the JSON report to.")
+    parser.add_argument("--compare", type=Path, help="Path to a report to compare to.")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(specs=PRESETS[args.preset], runs=args.runs)
+    if args.output:
+        with open(args.output, mode="w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        print(_format_comparison(rows=compare_reports(base=base, new=report)))
+
+
+if __name__ == "__main__":
+    main()
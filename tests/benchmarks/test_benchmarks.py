@@ -0,0 +1,105 @@
+"""
+Test the benchmark form generator and runner.
+"""
+
+import json
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skip
+
+from pyxform.xls2xform import convert
+
+from tests.benchmarks.form_generator import FormSpec, get_form_sheets, get_form_xlsx
+from tests.benchmarks.run_benchmarks import (
+    STAGES,
+    compare_reports,
+    main,
+    run_benchmark,
+    run_benchmarks,
+)
+
+
+class TestFormGenerator(TestCase):
+    def test_get_form_sheets__counts(self):
+        """Should generate the requested number of questions, sections, and choices."""
+        spec = FormSpec(questions=10, sections=2, depth=2, choice_lists=3, choices=4)
+        sheets = get_form_sheets(spec=spec)
+        types = [r[0] for r in sheets["survey"][1:]]
+        self.assertEqual(10, sum(1 for t in types if not t.startswith(("begin", "end"))))
+        self.assertEqual(2, types.count("begin group"))
+        self.assertEqual(2, types.count("begin repeat"))
+        self.assertEqual(12, len(sheets["choices"]) - 1)
+
+    def test_get_form_sheets__deterministic(self):
+        """Should generate the same form for the same spec."""
+        spec = FormSpec(questions=20, reference_density=0.5, seed=3)
+        self.assertEqual(get_form_sheets(spec=spec), get_form_sheets(spec=spec))
+
+    def test_get_form_sheets__reference_density(self):
+        """Should add references according to the reference density."""
+        none = get_form_sheets(spec=FormSpec(questions=20, reference_density=0))
+        every = get_form_sheets(spec=FormSpec(questions=20, reference_density=1))
+        self.assertNotIn("${", json.dumps(none["survey"]))
+        self.assertLess(20, json.dumps(every["survey"]).count("${"))
+
+    def test_get_form_xlsx__converts(self):
+        """Should generate forms that convert without errors or warnings."""
+        specs = (
+            FormSpec(questions=12),
+            FormSpec(questions=12, depth=3, languages=3, external_instances=2),
+            FormSpec(questions=12, choice_lists=0, reference_density=1),
+        )
+        for spec in specs:
+            with self.subTest(spec=spec.name):
+                warnings = []
+                result = convert(xlsform=get_form_xlsx(spec=spec), warnings=warnings)
+                self.assertIn('<data id="benchmark">', result.xform)
+                self.assertEqual([], warnings)
+
+
+class TestRunBenchmarks(TestCase):
+    def test_run_benchmark(self):
+        """Should get the time and memory for each stage."""
+        result = run_benchmark(spec=FormSpec(questions=10), runs=1)
+        self.assertEqual(set(STAGES), set(result["stages"]))
+        for stage in result["stages"].values():
+            self.assertLess(0, stage["seconds"])
+            self.assertLess(0, stage["peak_bytes"])
+
+    def test_compare_reports(self):
+        """Should compare the results for forms in both reports."""
+        base = run_benchmarks(specs=[FormSpec(questions=10)], runs=1)
+        new = json.loads(json.dumps(base))
+        new["results"][0]["total_seconds"] *= 2
+        new["results"].append({**new["results"][0], "name": "other"})
+        rows = compare_reports(base=base, new=new)
+        self.assertEqual(len(STAGES) * 2 + 1, len(rows))
+        total = next(r for r in rows if r["stage"] == "total")
+        self.assertAlmostEqual(2.0, total["ratio"])
+
+    def test_main__report(self):
+        """Should write the JSON report, and compare it to another report."""
+        with TemporaryDirectory() as tmp:
+            path = Path(tmp) / "report.json"
+            main(["--runs", "1", "--output", str(path)])
+            with open(path, encoding="utf-8") as f:
+                report = json.load(f)
+            self.assertEqual(2, len(report["results"]))
+            with redirect_stdout(StringIO()) as stdout:
+                main(["--runs", "1", "--output", str(path), "--compare", str(path)])
+            self.assertIn("1.00x", stdout.getvalue())
+
+    @skip("Slow performance test. Un-skip to run as needed.")
+    def test_benchmarks__medium(self):
+        """
+        Should convert the medium preset forms within a few seconds.
+
+        Results with Python 3.11.7, best of 3 runs (seconds), peak allocated memory (MB):
+        | form                              | read  | to_json | builder | xml   | total |
+        | 1000 q                            | 0.108 | 0.062   | 0.031   | 0.137 | 0.355 |
+        | 1000 q, depth 3, 5 langs, 20 ch.  | 0.354 | 0.258   | 0.049   | 0.477 | 1.217 |
+        | 1000 q, reference density 1.0     | 0.182 | 0.111   | 0.050   | 0.177 | 0.550 |
+        """
+        main(["--preset", "medium", "--runs", "3"])
@@ -1,4 +1,11 @@
-from pyxform.parsing.expression import is_xml_tag
+from pyxform.parsing.expression import (
+    ExpressionCache,
+    expression_cache,
+    get_expression_cache,
+    has_last_saved,
+    is_xml_tag,
+    parse_expression,
+)
 
 from tests.pyxform_test_case import PyxformTestCase
 
@@ -50,3 +57,80 @@ class TestExpression(PyxformTestCase):
         for case, description in negative:
             with self.subTest(case=case, description=description):
                 self.assertFalse(is_xml_tag(case))
+
+    def test_has_last_saved__deprecated(self):
+        """Should find the deprecated has_last_saved warns and gives the tree result."""
+        for value, expected in (("${last-saved#abc}", True), ("${abc}", False)):
+            with self.subTest(value):
+                with self.assertWarns(DeprecationWarning) as warned:
+                    self.assertEqual(expected, has_last_saved(value))
+                self.assertEqual(__file__, warned.filename)
+
+
+class TestExpressionCache(PyxformTestCase):
+    def test_parse_expression__no_cache(self):
+        """Should parse without caching if not within a conversion."""
+        self.assertIsNone(get_expression_cache())
+        tokens, _ = parse_expression("${a} + 1")
+        self.assertIsNot(tokens, parse_expression("${a} + 1")[0])
+
+    def test_parse_expression__cache(self):
+        """Should count cache hits and misses within a conversion."""
+        with expression_cache() as cache:
+            tokens, _ = parse_expression("${a} + 1")
+            self.assertIs(tokens, parse_expression("${a} + 1")[0])
+            parse_expression("${b}")
+            stats = cache.get_stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(2, stats["misses"])
+        self.assertEqual(2, stats["entries"])
+        self.assertLess(0, stats["size"])
+
+    def test_expression_cache__released(self):
+        """Should release the cached values when the conversion ends."""
+        with expression_cache() as cache:
+            parse_expression("${a} + 1")
+            self.assertIs(cache, get_expression_cache())
+        self.assertIsNone(get_expression_cache())
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.size)
+
+    def test_expression_cache__nested(self):
+        """Should use the outer cache in a nested conversion step."""
+        with expression_cache() as outer:
+            parse_expression("${a} + 1")
+            with expression_cache() as inner:
+                self.assertIs(outer, inner)
+                parse_expression("${a} + 1")
+            self.assertIs(outer, get_expression_cache())
+        self.assertEqual(1, outer.hits)
+
+    def test_expression_cache__max_size(self):
+        """Should remove the least recently used values to stay within the size."""
+        cache = ExpressionCache(max_size=100)
+        cache.add(key="a", value=1, size=40)
+        cache.add(key="b", value=2, size=40)
+        self.assertEqual(1, cache.get(key="a"))
+        cache.add(key="c", value=3, size=40)
+        self.assertIsNone(cache.get(key="b"))
+        self.assertEqual(1, cache.get(key="a"))
+        self.assertEqual(3, cache.get(key="c"))
+        self.assertEqual(80, cache.size)
+        # Values larger than the cache are not added.
+        cache.add(key="d", value=4, size=101)
+        self.assertIsNone(cache.get(key="d"))
+        self.assertEqual(80, cache.size)
+
+    def test_convert__shares_cache(self):
+        """Should parse each distinct expression once across the conversion steps."""
+        md = """
+        | survey |
+        |        | type    | name | label | relevant  |
+        |        | integer | a    | A     |           |
+        |        | text    | b    | B     | ${a} > 1  |
+        |        | text    | c    | C     | ${a} > 1  |
+        """
+        with expression_cache() as cache:
+            self.assertPyxformXform(md=md, xml__contains=["<h:head>"])
+            self.assertLess(0, cache.hits)
+        self.assertEqual(0, len(cache))
@@ -0,0 +1,156 @@
+from pyxform.parsing.expression import expression_cache
+from pyxform.parsing.expression_tree import (
+    FunctionCall,
+    Group,
+    InvalidReference,
+    Path,
+    Predicate,
+    PyxformReference,
+    TokenNode,
+    get_expression,
+    has_last_saved,
+)
+
+from tests.pyxform_test_case import PyxformTestCase
+
+
+class TestExpressionTree(PyxformTestCase):
+    def test_nodes__function_call(self):
+        """Should parse function call arguments into separate node lists."""
+        expression = get_expression("concat(${a}, 'b', /data/c)")
+        self.assertEqual(1, len(expression.nodes))
+        func = expression.nodes[0]
+        self.assertIsInstance(func, FunctionCall)
+        self.assertEqual("concat", func.name)
+        self.assertEqual(3, len(func.args))
+        self.assertIsInstance(func.args[0][0], PyxformReference)
+        self.assertEqual("a", func.args[0][0].name)
+        self.assertIsInstance(func.args[1][1], TokenNode)
+        self.assertEqual("SYSTEM_LITERAL", func.args[1][1].token.name)
+        self.assertIsInstance(func.args[2][1], Path)
+        self.assertEqual((0, 26), (func.start, func.end))
+
+    def test_nodes__path_with_predicate(self):
+        """Should group path steps and predicates into one path node."""
+        text = "instance('c')/root/item[name = ${x}]/label"
+        expression = get_expression(text)
+        self.assertIsInstance(expression.nodes[0], FunctionCall)
+        path = expression.nodes[1]
+        self.assertIsInstance(path, Path)
+        self.assertEqual(text[path.start : path.end], "/root/item[name = ${x}]/label")
+        predicate = next(s for s in path.steps if isinstance(s, Predicate))
+        self.assertEqual("item", predicate.step)
+        self.assertEqual(["x"], [r.name for r in expression.references])
+
+    def test_nodes__group(self):
+        """Should parse parenthesised expressions into a group."""
+        expression = get_expression("(${a} + 1) * 2")
+        self.assertIsInstance(expression.nodes[0], Group)
+        self.assertEqual(["a"], [r.name for r in expression.references])
+
+    def test_nodes__last_saved(self):
+        """Should note last-saved references."""
+        expression = get_expression("${last-saved#a} + ${b}")
+        refs = expression.references
+        self.assertEqual(
+            [("a", True), ("b", False)], [(r.name, r.last_saved) for r in refs]
+        )
+
+    def test_nodes__unclosed(self):
+        """Should parse unclosed or unmatched parts without errors."""
+        cases = ("concat(${a}, 'b'", "(1 + 2", "item[1", ")", "]", "a, b")
+        for case in cases:
+            with self.subTest(case=case):
+                nodes = list(get_expression(case).iter_nodes())
+                self.assertLess(0, len(nodes))
+
+    def test_has_invalid_reference(self):
+        """Should find invalid pyxform reference syntax."""
+        cases = (
+            ("${a}", False),
+            ("${a} and ${b}", False),
+            ("concat(${a}, ${last-saved#b})", False),
+            ("${a", True),
+            ("${a ", True),
+            ("${a + 1}", True),
+            ("${${a}}", True),
+            ("concat(${a, 'b')", True),
+            ("${a} ${", True),
+            ("$ {a}", False),
+        )
+        for case, expected in cases:
+            with self.subTest(case=case):
+                expression = get_expression(case)
+                self.assertEqual(expected, expression.has_invalid_reference())
+                if expected:
+                    self.assertTrue(
+                        any(
+                            isinstance(n, InvalidReference)
+                            for n in expression.iter_nodes()
+                        )
+                    )
+
+    def test_is_dynamic(self):
+        """Should find the same result for hyphenated types as other types."""
+        cases = (
+            ("1", None, False),
+            ("1 + 1", None, True),
+            ("today()", None, True),
+            ("${a}", None, True),
+            ("2020-01-01", "date", False),
+            ("2020-01-01", "string", False),
+            ("1 - 1", "date", False),
+            ("1 - 1", "string", True),
+            ("today() - 1", "date", True),
+        )
+        for case, element_type, expected in cases:
+            with self.subTest(case=case, element_type=element_type):
+                self.assertEqual(expected, get_expression(case).is_dynamic(element_type))
+
+    def test_bracketed_references(self):
+        """Should find the valid references in the tree, including in string literals."""
+        cases = (
+            ("${a}", [("a", False, 0, 4)]),
+            (
+                "'${a}' and ${last-saved#b}",
+                [("a", False, 1, 5), ("b", True, 11, 26)],
+            ),
+            ("concat('x ${a} y', ${b})", [("a", False, 10, 14), ("b", False, 19, 23)]),
+            ("no refs", []),
+            ("${a b}", []),
+            ("${}", [("", False, 0, 3)]),
+        )
+        for case, expected in cases:
+            with self.subTest(case=case):
+                observed = [
+                    (r.name, r.last_saved, r.start, r.end)
+                    for r in get_expression(case).bracketed_references
+                ]
+                self.assertEqual(expected, observed)
+
+    def test_expression_cache__counts_tree(self):
+        """Should update the size of the cached expression when the tree is parsed."""
+        with expression_cache() as cache:
+            expression = get_expression("concat(${a}, 'b')")
+            _ = expression.tokens
+            cache_size = cache.size
+            expression_size = expression.get_size()
+            _ = expression.nodes
+            self.assertLess(expression_size, expression.get_size())
+            self.assertEqual(
+                expression.get_size() - expression_size, cache.size - cache_size
+            )
+
+    def test_has_last_saved(self):
+        """Should find valid last-saved references only."""
+        self.assertTrue(has_last_saved("${last-saved#abc}"))
+        self.assertTrue(has_last_saved("concat(${a}, ${last-saved#abc})"))
+        self.assertFalse(has_last_saved("${abc} last-saved#abc"))
+        self.assertFalse(has_last_saved("${last-saved#a b}"))
+        self.assertFalse(has_last_saved(""))
+
+    def test_get_expression__cached(self):
+        """Should get the same expression object for the same text, within a conversion."""
+        self.assertIsNot(get_expression("${a} + 1"), get_expression("${a} + 1"))
+        with expression_cache():
+            self.assertIs(get_expression("${a} + 1"), get_expression("${a} + 1"))
@@ -0,0 +1,18 @@
+from pyxform.parsing.instance_expression import find_boundaries
+
+from tests.pyxform_test_case import PyxformTestCase
+
+
+class TestInstanceExpression(PyxformTestCase):
+    def test_find_boundaries(self):
+        """Should find the boundaries of each instance expression."""
+        text = "a instance('c')/root/item[name = 'x']/label b instance('d')/root/l c"
+        self.assertEqual(
+            ["instance('c')/root/item[name = 'x']/label", "instance('d')/root/l"],
+            [text[s:e] for s, e in find_boundaries(xml_text=text)],
+        )
+
+    def test_find_boundaries__none(self):
+        """Should find no boundaries if there is no instance expression."""
+        self.assertEqual([], find_boundaries(xml_text=""))
+        self.assertEqual([], find_boundaries(xml_text="concat(${a}, 'b')"))
@@ -0,0 +1,126 @@
+"""
+Test conversion_cache module.
+"""
+
+import os
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from pyxform.conversion_cache import DiskLRUCache, get_cache_key
+from pyxform.xls2xform import convert
+
+from tests import example_xls
+from tests.utils import get_temp_dir
+
+
+class TestGetCacheKey(TestCase):
+    def test_key_changes_with_inputs(self):
+        """Should find a different key if the data, options or version differ."""
+        key = get_cache_key(data=b"a", options={"validate": False})
+        self.assertEqual(key, get_cache_key(data=b"a", options={"validate": False}))
+        self.assertNotEqual(key, get_cache_key(data=b"b", options={"validate": False}))
+        self.assertNotEqual(key, get_cache_key(data=b"a", options={"validate": True}))
+        with patch("pyxform.conversion_cache.__version__", "0.0.0"):
+            self.assertNotEqual(
+                key, get_cache_key(data=b"a", options={"validate": False})
+            )
+
+
+class TestDiskLRUCache(TestCase):
+    def test_get_set(self):
+        """Should find a stored value, and None for a missing or corrupt entry."""
+        with get_temp_dir() as td:
+            cache = DiskLRUCache(path=td)
+            self.assertIsNone(cache.get("a"))
+            cache.set("a", {"xform": "x", "warnings": [], "itemsets": None})
+            self.assertEqual("x", cache.get("a")["xform"])
+            (Path(td) / "b.json").write_text("{")
+            self.assertIsNone(cache.get("b"))
+            self.assertFalse((Path(td) / "b.json").exists())
+
+    def test_evicts_least_recently_used(self):
+        """Should delete the least recently used entries when over the size limit."""
+        with get_temp_dir() as td:
+            value = {"xform": "x" * 100, "warnings": [], "itemsets": None}
+            cache = DiskLRUCache(path=td, max_bytes=500)
+            for i, key in enumerate(("a", "b", "c")):
+                cache.set(key, value)
+                os.utime(Path(td) / f"{key}.json", ns=(i, i))
+            # Reading "a" makes "b" the least recently used.
+            self.assertIsNotNone(cache.get("a"))
+            cache.set("d", value)
+            self.assertIsNone(cache.get("b"))
+            for key in ("a", "c", "d"):
+                self.assertIsNotNone(cache.get(key), msg=key)
+
+    def test_evict_only_over_limit(self):
+        """Should find the directory is only scanned when the total size is over."""
+        with get_temp_dir() as td:
+            value = {"xform": "x" * 100, "warnings": [], "itemsets": None}
+            cache = DiskLRUCache(path=td, max_bytes=500)
+            with patch.object(cache, "evict", wraps=cache.evict) as evict:
+                for key in ("a", "b", "c"):
+                    cache.set(key, value)
+                # Replacing an entry doesn't change the total.
+                cache.set("a", value)
+                evict.assert_not_called()
+                cache.set("d", value)
+                evict.assert_called_once()
+            sizes = [p.stat().st_size for p in Path(td).iterdir()]
+            self.assertEqual(sum(sizes), cache._total_bytes)
+            self.assertLessEqual(cache._total_bytes, 500 * cache.EVICT_TO_RATIO)
+
+    def test_existing_entries_counted(self):
+        """Should find the size of existing entries when the cache is created."""
+        with get_temp_dir() as td:
+            DiskLRUCache(path=td).set("a", {"xform": "x", "warnings": []})
+            size = (Path(td) / "a.json").stat().st_size
+            self.assertEqual(size, DiskLRUCache(path=td)._total_bytes)
+
+    def test_corrupt_entry_removed_from_total(self):
+        """Should find the size of a removed corrupt entry is taken off the total."""
+        with get_temp_dir() as td:
+            (Path(td) / "b.json").write_text("{" * 10)
+            cache = DiskLRUCache(path=td)
+            cache.set("a", {"xform": "x", "warnings": []})
+            self.assertIsNone(cache.get("b"))
+            size = (Path(td) / "a.json").stat().st_size
+            self.assertEqual(size, cache._total_bytes)
+
+
+class TestConvertWithCache(TestCase):
+    def test_cache_hit_skips_conversion(self):
+        """Should find that a cache hit returns the stored result without converting."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        with get_temp_dir() as td:
+            cache = DiskLRUCache(path=td)
+            expected = convert(xlsform=md_path, pretty_print=True, cache=cache)
+            self.assertIsNotNone(expected._survey)
+            with patch("pyxform.xls2json.workbook_to_json") as mock_to_json:
+                observed = convert(xlsform=md_path, pretty_print=True, cache=cache)
+                mock_to_json.assert_not_called()
+            self.assertEqual(expected.xform, observed.xform)
+            self.assertEqual(expected.warnings, observed.warnings)
+            self.assertEqual(expected.itemsets, observed.itemsets)
+            self.assertIsNone(observed._survey)
+            # A different option is a different cache entry.
+            compact = convert(xlsform=md_path, pretty_print=False, cache=cache)
+            self.assertIsNotNone(compact._survey)
+            self.assertEqual(2, len(list(Path(td).iterdir())))
+
+    def test_cache_keeps_warnings(self):
+        """Should find that cached warnings are added to the provided warnings list."""
+        md = """
+        | survey |
+        |        | type   | name | label::English |
+        |        | text   | a    | A              |
+        """
+        with get_temp_dir() as td:
+            cache = DiskLRUCache(path=td)
+            expected = convert(xlsform=md, cache=cache)
+            self.assertGreater(len(expected.warnings), 0)
+            warnings = ["existing"]
+            observed = convert(xlsform=md, cache=cache, warnings=warnings)
+            self.assertIsNone(observed._survey)
+            self.assertEqual(["existing", *expected.warnings], warnings)
@@ -0,0 +1,100 @@
+"""
+Test that importing pyxform stays fast, with submodules and the lexer loaded lazily.
+"""
+
+import subprocess
+import sys
+from unittest import TestCase
+
+# Cumulative import time budget for "import pyxform", in microseconds. Generous, to
+# allow for slow test machines; a typical import takes around 20ms.
+IMPORT_PYXFORM_BUDGET_US = 250_000
+
+
+def get_import_times(statement: str) -> dict[str, int]:
+    """
+    Run the statement in a new interpreter with "-X importtime".
+
+    :return: The cumulative import time in microseconds, for each imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # e.g. "import time:       355 |     289932 | pyxform"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(TestCase):
+    def test_import_pyxform__budget(self):
+        """Should import the package within the budget."""
+        times = get_import_times("import pyxform")
+        self.assertLess(times["pyxform"], IMPORT_PYXFORM_BUDGET_US)
+
+    def test_import_pyxform__lazy_submodules(self):
+        """Should not import the converter or spreadsheet libraries until needed."""
+        times = get_import_times("import pyxform")
+        for module in ("pyxform.builder", "pyxform.survey", "openpyxl", "xlrd"):
+            with self.subTest(module=module):
+                self.assertNotIn(module, times)
+
+    def test_import_pyxform__lazy_attribute(self):
+        """Should import the submodule for a package attribute when it's first used."""
+        statement = (
+            "import sys, pyxform;"
+            "assert 'pyxform.survey' not in sys.modules;"
+            "from pyxform import Survey;"
+            "assert sys.modules['pyxform.survey'].Survey is Survey"
+        )
+        get_import_times(statement)
+
+    def test_import_pyxform__lazy_submodule_attribute(self):
+        """Should import a submodule when it's first used as a package attribute."""
+        statement = (
+            "import sys, pyxform;"
+            "assert 'pyxform.builder' not in sys.modules;"
+            "assert pyxform.builder is sys.modules['pyxform.builder'];"
+            "assert pyxform.xls2json.SurveyReader is pyxform.ExcelSurveyReader;"
+            "assert pyxform.constants.SURVEY == 'survey'"
+        )
+        get_import_times(statement)
+
+    def test_import_pyxform__unknown_attribute(self):
+        """Should raise an AttributeError for names that aren't package attributes."""
+        import pyxform
+
+        with self.assertRaises(AttributeError):
+            _ = pyxform.not_a_submodule
+
+    def test_import_xform2json__lazy_submodules(self):
+        """Should not import the converter for tools that only use xform2json."""
+        times = get_import_times("import pyxform.xform2json")
+        for module in ("pyxform.builder", "pyxform.survey", "openpyxl", "xlrd"):
+            with self.subTest(module=module):
+                self.assertNotIn(module, times)
+
+    def test_import_xls2json_backends__lazy_spreadsheet_libraries(self):
+        """Should import a spreadsheet library only when its file type is processed."""
+        times = get_import_times("import pyxform.xls2json_backends")
+        self.assertNotIn("openpyxl", times)
+        self.assertNotIn("xlrd", times)
+
+    def test_expression_lexer__compiled_on_first_use(self):
+        """Should compile the expression lexer when first used, not on import."""
+        statement = (
+            "from pyxform.parsing import expression as e;"
+            "assert e.get_lexer.cache_info().currsize == 0;"
+            "assert e.get_pattern.cache_info().currsize == 0;"
+            "e.parse_expression('1 + 1');"
+            "assert e.get_lexer.cache_info().currsize == 1"
+        )
+        get_import_times(statement)
@@ -174,12 +174,12 @@ class Json2XformQuestionValidationTests(TestCase):
         # Inspect XML Control
         observed = q.xml_control(survey=self.s)
         self.assertEqual("input", observed.nodeName)
-        self.assertEqual("/test/phone_number_q", observed.attributes["ref"].nodeValue)
+        self.assertEqual("/test/phone_number_q", observed.getAttribute("ref"))
         observed_label = observed.childNodes[0]
         self.assertEqual("label", observed_label.nodeName)
         self.assertEqual(
             "jr:itext('/test/phone_number_q:label')",
-            observed_label.attributes["ref"].nodeValue,
+            observed_label.getAttribute("ref"),
         )
         observed_hint = observed.childNodes[1]
         self.assertEqual("hint", observed_hint.nodeName)
@@ -1,11 +1,44 @@
+import gzip
+import logging
+import threading
+from io import BytesIO, StringIO
+from pathlib import Path
+from time import perf_counter
+from unittest import skip
+from unittest.mock import patch
+
+from defusedxml.minidom import parseString
+from pyxform.builder import create_survey_element_from_dict
+from pyxform.question import Question
+from pyxform.section import Section
+from pyxform.survey import (
+    ReferenceIndex,
+    Survey,
+    is_parent_a_repeat,
+    share_same_repeat_parent,
+)
+from pyxform.utils import node
+from pyxform.validators import enketo_validate, odk_validate
+from pyxform.xls2xform import convert
+
 from tests.pyxform_test_case import PyxformTestCase
 
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
 
 class TestSurvey(PyxformTestCase):
     """
     Tests for the Survey class.
     """
 
+    MD_SIMPLE = """
+    | survey |
+    |        | type | name | label |
+    |        | text | q1   | Q1    |
+    """
+
     def test_many_xpath_references_do_not_hit_64_recursion_limit__one_to_one(self):
         """Should be able to pipe a question into one note more than 64 times."""
         self.assertPyxformXform(
@@ -65,3 +98,361 @@ class TestSurvey(PyxformTestCase):
                 """
             ],
         )
+
+    def test_to_xml__no_file_io_without_validators(self):
+        """Should find that the XForm is not written to a file if not validating."""
+        survey = convert(xlsform=self.MD_SIMPLE)._survey
+        with patch("pyxform.validators.util.tempfile.NamedTemporaryFile") as mock_tmp:
+            xml = survey.to_xml(validate=False, enketo=False)
+            mock_tmp.assert_not_called()
+        self.assertIn("<h:title>data</h:title>", xml)
+
+    def test_reference_index(self):
+        """Should find the index gives the same relations as searching the survey."""
+        md = """
+        | survey |
+        |        | type         | name | label |
+        |        | text         | q0   | Q0    |
+        |        | begin repeat | r1   | R1    |
+        |        | text         | q1   | Q1    |
+        |        | begin group  | g1   | G1    |
+        |        | text         | q2   | Q2    |
+        |        | begin repeat | r2   | R2    |
+        |        | text         | q3   | Q3    |
+        |        | end repeat   |      |       |
+        |        | end group    |      |       |
+        |        | end repeat   |      |       |
+        |        | begin repeat | r3   | R3    |
+        |        | text         | q4   | Q4    |
+        |        | end repeat   |      |       |
+        """
+        survey = convert(xlsform=md)._survey
+        index = ReferenceIndex(survey=survey)
+        self.assertEqual({"/data/r1", "/data/r1/g1/r2", "/data/r3"}, index.repeat_xpaths)
+        self.assertEqual("/data/r1/g1/r2", index.get_repeat_parent("/data/r1/g1/r2/q3"))
+        self.assertEqual("/data/r1", index.get_repeat_parent("/data/r1/g1/r2"))
+        self.assertFalse(index.get_repeat_parent("/data/q0"))
+        elements = list(
+            survey.iter_descendants(condition=lambda i: isinstance(i, Question | Section))
+        )
+        # Elements in r1 share that repeat; others are only related to their parent.
+        in_r1 = ("q1", "g1", "q2", "r2", "q3")
+        related = {(a, b) for a in in_r1 for b in in_r1}
+        related |= {("q4", "q4"), ("q1", "r1"), ("g1", "r1"), ("q4", "r3")}
+        related |= {("data", n) for n in ("q0", "r1", "r3", "meta")}
+        related |= {("meta", "instanceID")}
+        for element in elements:
+            for other in elements:
+                with self.subTest((element.name, other.name)):
+                    expected = (element.name, other.name) in related or (
+                        other.name,
+                        element.name,
+                    ) in related
+                    self.assertEqual(expected, index.is_related(element, other))
+
+    def test_reference_index__deprecated_functions(self):
+        """Should find the deprecated functions warn and give the ReferenceIndex result."""
+        md = """
+        | survey |
+        |        | type         | name | label |
+        |        | begin repeat | r1   | R1    |
+        |        | text         | q1   | Q1    |
+        |        | begin group  | g1   | G1    |
+        |        | begin repeat | r2   | R2    |
+        |        | text         | q2   | Q2    |
+        |        | end repeat   |      |       |
+        |        | end group    |      |       |
+        |        | end repeat   |      |       |
+        |        | text         | q3   | Q3    |
+        """
+        survey = convert(xlsform=md)._survey
+        elements = {
+            e.name: e
+            for e in survey.iter_descendants(
+                condition=lambda i: isinstance(i, Question | Section)
+            )
+        }
+        cases = (
+            ("q2", "q1", ("Common Ancestor Repeat", 3, "r1")),
+            ("q1", "r1", ("Parent (other)", 1, "r1")),
+            ("r1", "q1", ("Parent (self)", 1, "r1")),
+            ("q2", "q3", ("Unrelated", None, None)),
+        )
+        for name, other, expected in cases:
+            with self.subTest((name, other)):
+                with self.assertWarns(DeprecationWarning) as warned:
+                    relation, steps, ancestor = elements[name].has_common_repeat_parent(
+                        elements[other]
+                    )
+                self.assertEqual(__file__, warned.filename)
+                self.assertEqual(expected, (relation, steps, ancestor and ancestor.name))
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(
+                "/data/r1/g1/r2", is_parent_a_repeat(survey, "/data/r1/g1/r2/q2")
+            )
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(
+                (3, "/q1"),
+                share_same_repeat_parent(survey, "/data/r1/q1", "/data/r1/g1/r2/q2"),
+            )
+
+    def test_insert_xpaths__memo(self):
+        """Should find that repeated expressions are memoised, except for relative paths
+        from different places in a repeat."""
+        md = """
+        | survey |
+        |        | type         | name | label | relevant     |
+        |        | text         | a    | A     |              |
+        |        | text         | b    | B     | ${a} = 'yes' |
+        |        | text         | c    | C     | ${a} = 'yes' |
+        |        | begin repeat | r    | R     |              |
+        |        | text         | d    | D     |              |
+        |        | text         | e    | E     | ${d} = 'yes' |
+        |        | begin group  | g    | G     |              |
+        |        | text         | f    | F     | ${d} = 'yes' |
+        |        | end group    |      |       |              |
+        |        | end repeat   |      |       |              |
+        """
+        survey = convert(xlsform=md)._survey
+        self.assertEqual(
+            {"hits": 1, "misses": 3, "hit_rate": 0.25},
+            survey.get_insert_xpaths_stats(),
+        )
+        self.assertPyxformXform(
+            md=md,
+            xml__xpath_match=[
+                """/h:html/h:head/x:model/x:bind[@nodeset='/test_name/c' and @relevant=" /test_name/a  = 'yes'"]""",
+                """/h:html/h:head/x:model/x:bind[@nodeset='/test_name/r/e' and @relevant=" ../d  = 'yes'"]""",
+                """/h:html/h:head/x:model/x:bind[@nodeset='/test_name/r/g/f' and @relevant=" ../../d  = 'yes'"]""",
+            ],
+        )
+        # A change to the survey tree resets the memo.
+        survey.add_child(survey.children[0])
+        self.assertEqual(0, survey.get_insert_xpaths_stats()["misses"])
+
+    def test_get_output_content(self):
+        """Should find the output content has the text and output elements for references."""
+        md = """
+        | survey  |
+        |         | type          | name | label |
+        |         | text          | a    | A     |
+        |         | select_one c1 | b    | B     |
+        | choices |
+        |         | list_name | name | label |
+        |         | c1        | n1   | N1    |
+        """
+        survey = convert(xlsform=md)._survey
+        context = survey.children[0]
+        cases = (
+            ("plain", "", "<value>plain</value>"),
+            ("plain", "jr://images/", "<value>jr://images/plain</value>"),
+            ("-", "", "<value>-</value>"),
+            ("${a}", "", '<value><output value=" /data/a "/></value>'),
+            (
+                "${a}",
+                "jr://images/",
+                '<value> jr://images/<output value=" /data/a "/> </value>',
+            ),
+            (
+                "${a}${b}",
+                "",
+                '<value><output value=" /data/a "/><output value=" /data/b "/></value>',
+            ),
+            (" ${a} ", "", '<value>  <output value=" /data/a "/>  </value>'),
+            (
+                'a "b" & <c> ${a} &amp; &lt;',
+                "",
+                "<value> a &quot;b&quot; &amp; &lt;c&gt; "
+                '<output value=" /data/a "/> &amp;amp; &amp;lt; </value>',
+            ),
+            (
+                "line\r\nend\r${a}\tx\n",
+                "",
+                '<value> line\nend\n<output value=" /data/a "/>\tx\n </value>',
+            ),
+            (
+                "instance('c1')/root/item[name = ${b}]/label",
+                "",
+                "<value><output value=\"instance('c1')/root/item[name =  /data/b ]/label\"/>"
+                "</value>",
+            ),
+            (
+                "x instance('c1')/root/item[name < ${b} and\r\nname = 'a']/label y",
+                "",
+                "<value> x <output value=\"instance('c1')/root/item"
+                "[name &amp;lt;  /data/b  and name = 'a']/label\"/> y </value>",
+            ),
+            (
+                "${last-saved#a} and ${b}",
+                "",
+                "<value><output value=\" instance('__last-saved')/data/a \"/> and "
+                '<output value=" /data/b "/> </value>',
+            ),
+        )
+        for text, prefix, expected in cases:
+            with self.subTest((text, prefix)):
+                observed = node(
+                    "value", *survey.get_output_content(text, context, prefix=prefix)
+                )
+                self.assertEqual(expected, observed.toxml())
+
+    @skip("Slow performance test. Un-skip to run as needed.")
+    def test_get_output_content__performance(self):
+        """
+        Should find that building output content is faster than parsing the XML text.
+
+        Results with Python 3.11.7 on VM with 4vCPU, 2000 questions each with a label and
+        hint that refer to the previous question, in 3 languages, average of 5 runs of
+        Survey.to_xml (seconds):
+        | parse XML | build content |
+        |    2.0514 |        0.9916 |
+        """
+        header = """
+        | survey |
+        |        | type | name | label::en (en) | label::fr (fr) | label::es (es) | hint::en (en) |
+        |        | text | q0   | Q0             | Q0             | Q0             | H0            |
+        """
+        row = """
+        |        | text | q{i} | Q{i} ${{q{j}}} "a" | Q{i} ${{q{j}}} | Q{i} ${{q{j}}} | H ${{q{j}}} |
+        """
+        md = "".join((header, *(row.format(i=i, j=i - 1) for i in range(1, 2000))))
+
+        def parse_content(self, text, context=None, prefix=""):
+            parts = self._split_output_values(text=text, context=context)
+            if text == "-" or not any(is_output for _, is_output in parts):
+                return [f"{prefix}{text}"]
+            value = "".join(
+                node("output", value=v).toxml() if is_output else v
+                for v, is_output in parts
+            )
+            parsed = parseString(f"<x>{prefix}{value}</x>".encode()).documentElement
+            return [c.cloneNode(deep=False) for c in parsed.childNodes]
+
+        pyxform_data = convert(xlsform=md)._pyxform
+
+        def run(name):
+            results = []
+            for _ in range(5):
+                survey = create_survey_element_from_dict(pyxform_data)
+                start = perf_counter()
+                survey.to_xml(validate=False)
+                results.append(perf_counter() - start)
+            logger.info("%s %s", name, round(sum(results) / len(results), 4))
+
+        run(name="build content (seconds):")
+        with patch.object(Survey, "get_output_content", parse_content):
+            run(name="parse XML (seconds):")
+
+    def test_write_xml__same_as_to_xml(self):
+        """Should find that the streamed XForm is the same as the XForm string."""
+        for pretty_print in (True, False):
+            with self.subTest(pretty_print):
+                expected = convert(xlsform=self.MD_SIMPLE)._survey.to_xml(
+                    validate=False, pretty_print=pretty_print
+                )
+                survey = convert(xlsform=self.MD_SIMPLE)._survey
+                observed = StringIO()
+                survey.write_xml(fp=observed, pretty_print=pretty_print)
+                self.assertEqual(expected, observed.getvalue())
+
+    def test_write_xml__binary_stream(self):
+        """Should find that the XForm is written to a binary stream as UTF-8."""
+        md = """
+        | survey |
+        |        | type | name | label |
+        |        | text | q1   | Qué   |
+        """
+        expected = convert(xlsform=md)._survey.to_xml(validate=False)
+        buffer = BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb") as f:
+            convert(xlsform=md)._survey.write_xml(fp=f)
+        self.assertEqual(expected, gzip.decompress(buffer.getvalue()).decode("utf-8"))
+
+    def test_to_xml__output_written_after_validators(self):
+        """Should find that the XForm is only written to the output if it is valid."""
+        expected = convert(xlsform=self.MD_SIMPLE)._survey.to_xml(validate=False)
+        output = StringIO()
+        with patch("pyxform.validators.odk_validate.check_xform", return_value=[]):
+            observed = convert(xlsform=self.MD_SIMPLE)._survey.to_xml(output=output)
+        self.assertIsNone(observed)
+        self.assertEqual(expected, output.getvalue())
+
+        output = StringIO()
+        with (
+            patch(
+                "pyxform.validators.odk_validate.check_xform",
+                side_effect=odk_validate.ODKValidateError("odk"),
+            ),
+            self.assertRaises(odk_validate.ODKValidateError),
+        ):
+            convert(xlsform=self.MD_SIMPLE)._survey.to_xml(output=output)
+        self.assertEqual("", output.getvalue())
+
+    def test_to_xml__validators_share_one_file(self):
+        """Should find that the validators read the same temporary file of the XForm."""
+        survey = convert(xlsform=self.MD_SIMPLE)._survey
+        paths = []
+
+        def check_xform(path):
+            paths.append(path)
+            self.assertEqual(xml, Path(path).read_text(encoding="utf-8"))
+            return []
+
+        xml = survey.to_xml(validate=False, pretty_print=True)
+        with (
+            patch("pyxform.validators.odk_validate.check_xform", side_effect=check_xform),
+            patch(
+                "pyxform.validators.enketo_validate.check_xform", side_effect=check_xform
+            ),
+        ):
+            observed = survey.to_xml(validate=True, enketo=True, pretty_print=True)
+        self.assertEqual(xml, observed)
+        self.assertEqual(2, len(paths))
+        self.assertEqual(paths[0], paths[1])
+        self.assertFalse(Path(paths[0]).exists())
+
+    def test_to_xml__validators_run_concurrently(self):
+        """Should find that the validators run at the same time, with ordered warnings."""
+        md = """
+        | survey |
+        |        | type | name | label::English |
+        |        | text | q1   | Q1             |
+        """
+        survey = convert(xlsform=md)._survey
+        # Each validator waits for the other, so this fails if they run in sequence.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def check_xform(name):
+            def check(path):
+                barrier.wait()
+                return [name]
+
+            return check
+
+        warnings = []
+        with (
+            patch("pyxform.validators.odk_validate.check_xform", check_xform("odk")),
+            patch(
+                "pyxform.validators.enketo_validate.check_xform", check_xform("enketo")
+            ),
+        ):
+            survey.to_xml(validate=True, enketo=True, warnings=warnings)
+        self.assertEqual(["odk", "enketo"], warnings[:2])
+        self.assertEqual(3, len(warnings))
+        self.assertIn("language declarations", warnings[2])
+
+    def test_to_xml__validator_errors_raised_in_order(self):
+        """Should find that the ODK Validate error is raised if both validators fail."""
+        survey = convert(xlsform=self.MD_SIMPLE)._survey
+        with (
+            patch(
+                "pyxform.validators.odk_validate.check_xform",
+                side_effect=odk_validate.ODKValidateError("odk"),
+            ),
+            patch(
+                "pyxform.validators.enketo_validate.check_xform",
+                side_effect=enketo_validate.EnketoValidateError("enketo"),
+            ),
+            self.assertRaises(odk_validate.ODKValidateError),
+        ):
+            survey.to_xml(validate=True, enketo=True)
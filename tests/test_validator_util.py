@@ -2,11 +2,18 @@
 Test pyxform.validators.utils module.
 """
 
+import asyncio
 import os
+import sys
+import time
 from unittest import TestCase
 
 from pyxform.validators.error_cleaner import ErrorCleaner
-from pyxform.validators.util import XFORM_SPEC_PATH, check_readable
+from pyxform.validators.util import (
+    XFORM_SPEC_PATH,
+    check_readable,
+    run_popen_with_timeout_async,
+)
 
 from tests.utils import prep_class_config
 
@@ -69,6 +76,41 @@ class TestCheckReadable(TestCase):
             check_readable(file_path=fake_file, retry_limit=2, wait_seconds=0.1)
 
 
+class TestRunPopenWithTimeoutAsync(TestCase):
+    def test_result(self):
+        """Should find the return code and output of the sub-program."""
+        command = [sys.executable, "-c", "import sys; print('out'); sys.exit('err')"]
+        result = asyncio.run(run_popen_with_timeout_async(command, 10))
+        self.assertEqual(1, result.return_code)
+        self.assertFalse(result.timeout)
+        self.assertEqual("out", result.stdout.strip())
+        self.assertEqual("err", result.stderr.strip())
+
+    def test_timeout(self):
+        """Should find that the sub-program is killed after the timeout."""
+        command = [sys.executable, "-c", "import time; time.sleep(30)"]
+        start = time.perf_counter()
+        result = asyncio.run(run_popen_with_timeout_async(command, 0.5))
+        self.assertTrue(result.timeout)
+        self.assertNotEqual(0, result.return_code)
+        self.assertLess(time.perf_counter() - start, 10)
+
+    def test_cancel(self):
+        """Should find that the sub-program is killed if the task is cancelled."""
+        command = [sys.executable, "-c", "import time; time.sleep(30)"]
+
+        async def run():
+            task = asyncio.create_task(run_popen_with_timeout_async(command, 60))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        self.assertLess(time.perf_counter() - start, 10)
+
+
 class TestErrorMessageCleaning(TestCase):
     def should_clean_odk_validate_stacktrace(self):
         message = """java.lang.NullPointerException Null Pointer\norg.javarosa.xform.parse.XFormParseException Parser"""
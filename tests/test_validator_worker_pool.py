@@ -0,0 +1,156 @@
+"""
+Test pyxform.validators.worker_pool module.
+"""
+
+import asyncio
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+
+from pyxform.errors import PyXFormError
+from pyxform.validators import enketo_validate
+from pyxform.validators.enketo_validate import EnketoValidateError
+from pyxform.validators.util import PopenResult
+from pyxform.validators.worker_pool import (
+    WORKER_CRASHED,
+    WorkerCrashedError,
+    WorkerPool,
+)
+
+from tests.utils import get_temp_file
+
+HERE = Path(__file__).parent
+FAKE_WORKER = [sys.executable, str(HERE / "validators" / "fake_worker.py")]
+FAKE_ENKETO_MODULE = str(HERE / "validators" / "fake_enketo_validate.js")
+
+
+class TestWorkerPool(TestCase):
+    def test_run(self):
+        """Should find that jobs reuse a worker and get the worker response."""
+        with WorkerPool(command=FAKE_WORKER, size=1) as pool:
+            first = pool.run(path="a")
+            second = pool.run(path="invalid")
+        self.assertEqual(
+            (0, False, "a"), (first.return_code, first.timeout, first.stderr)
+        )
+        self.assertEqual((1, "invalid"), (second.return_code, second.stderr))
+        self.assertEqual(first.stdout, second.stdout)
+
+    def test_recycle_after_max_jobs(self):
+        """Should find that a worker is replaced after max_jobs."""
+        with WorkerPool(command=FAKE_WORKER, size=1, max_jobs=2) as pool:
+            pids = [pool.run(path="a").stdout for _ in range(3)]
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+
+    def test_recycle_after_crash(self):
+        """Should find that a crash is retried once, then raises, and gets a new worker."""
+        with WorkerPool(command=FAKE_WORKER, size=1) as pool:
+            before = pool.run(path="a").stdout
+            with self.assertRaises(WorkerCrashedError) as err:
+                pool.run(path="crash")
+            after = pool.run(path="a").stdout
+        self.assertEqual(WORKER_CRASHED, str(err.exception))
+        self.assertNotEqual(before, after)
+
+    def test_retry_after_crash(self):
+        """Should find that a job is retried on a new worker if the worker crashes."""
+        with get_temp_file() as marker, WorkerPool(command=FAKE_WORKER, size=1) as pool:
+            Path(marker).unlink()
+            before = pool.run(path="a").stdout
+            retried = pool.run(path=f"crash-once:{marker}")
+        self.assertEqual((0, False), (retried.return_code, retried.timeout))
+        self.assertEqual(f"crash-once:{marker}", retried.stderr)
+        self.assertNotEqual(before, retried.stdout)
+
+    def test_recycle_after_timeout(self):
+        """Should find that a timeout is reported and the worker is replaced."""
+        with WorkerPool(command=FAKE_WORKER, size=1, timeout=0.5) as pool:
+            before = pool.run(path="a").stdout
+            timed_out = pool.run(path="sleep")
+            after = pool.run(path="a").stdout
+        self.assertTrue(timed_out.timeout)
+        self.assertNotEqual(before, after)
+
+    def test_concurrent_jobs_bounded_by_size(self):
+        """Should find that concurrent jobs use no more than `size` workers."""
+        with (
+            WorkerPool(command=FAKE_WORKER, size=2) as pool,
+            ThreadPoolExecutor(max_workers=4) as executor,
+        ):
+            results = list(executor.map(pool.run, [str(i) for i in range(12)]))
+        self.assertEqual([str(i) for i in range(12)], [r.stderr for r in results])
+        self.assertLessEqual(len({r.stdout for r in results}), 2)
+
+    def test_closed(self):
+        """Should raise an error if the pool is used after it is closed."""
+        pool = WorkerPool(command=FAKE_WORKER, size=1)
+        pool.run(path="a")
+        pool.close()
+        with self.assertRaises(PyXFormError):
+            pool.run(path="a")
+
+
+class TestEnketoValidateWorkerPool(TestCase):
+    def test_check_xform_without_pool(self):
+        """Should find that check_xform reads the result of a one-off validator run."""
+        with (
+            patch("pyxform.validators.enketo_validate.install_exists", return_value=True),
+            patch(
+                "pyxform.validators.enketo_validate._call_validator",
+                return_value=PopenResult(0, False, b"warning", b""),
+            ),
+        ):
+            self.assertEqual(
+                ["Enketo Validate Warnings:\nwarning"],
+                enketo_validate.check_xform(path_to_xform="a"),
+            )
+
+    def test_check_xform_worker_crash(self):
+        """Should raise an error if the worker crashes, instead of passing the form."""
+        with WorkerPool(command=FAKE_WORKER, size=1) as pool:
+            for check in (
+                lambda: enketo_validate.check_xform(path_to_xform="crash", pool=pool),
+                lambda: asyncio.run(
+                    enketo_validate.check_xform_async(path_to_xform="crash", pool=pool)
+                ),
+            ):
+                with self.assertRaises(EnketoValidateError) as err:
+                    check()
+                self.assertIn(WORKER_CRASHED, str(err.exception))
+
+    def test_stop_worker_pool_at_exit(self):
+        """Should find that the module worker pool is stopped when Python exits."""
+        code = (
+            "import atexit; from pyxform.validators import enketo_validate as ev;"
+            "from pyxform.validators.worker_pool import WorkerPool;"
+            f"ev._WORKER_POOL = pool = WorkerPool(command={FAKE_WORKER!r}, size=1);"
+            "pool.run(path='a'); atexit._run_exitfuncs();"
+            "print(ev._WORKER_POOL is None, pool._closed, len(pool._workers))"
+        )
+        observed = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, check=True, text=True
+        )
+        self.assertEqual("True True 0", observed.stdout.strip())
+
+    @skipIf(shutil.which("node") is None, "Node.js not found.")
+    def test_check_xform_with_worker(self):
+        """Should find that the worker script reports warnings and errors."""
+        with get_temp_file() as valid, get_temp_file() as invalid:
+            Path(valid).write_text("<h:html/>", encoding="utf-8")
+            Path(invalid).write_text("<h:html>invalid</h:html>", encoding="utf-8")
+            enketo_validate.start_worker_pool(size=1, module=FAKE_ENKETO_MODULE)
+            try:
+                self.assertEqual(
+                    ["Enketo Validate Warnings:\nWarning in form"],
+                    enketo_validate.check_xform(path_to_xform=valid),
+                )
+                with self.assertRaises(EnketoValidateError) as err:
+                    enketo_validate.check_xform(path_to_xform=invalid)
+                self.assertIn("Error in form", str(err.exception))
+            finally:
+                enketo_validate.stop_worker_pool()
@@ -4,18 +4,28 @@ Test xls2json_backends module functionality.
 
 import datetime
 import os
-from unittest import TestCase
+from concurrent.futures import ProcessPoolExecutor
+from io import SEEK_CUR, SEEK_END, BytesIO
+from pathlib import Path
+from unittest import TestCase, mock
 
 import openpyxl
 import xlrd
 from pyxform.xls2json_backends import (
+    MappedFile,
+    SupportedFileTypes,
+    definition_to_dict,
+    get_definition_data,
+    get_excel_rows,
     xls_to_dict,
     xls_value_to_unicode,
     xlsx_to_dict,
     xlsx_value_to_str,
 )
+from pyxform.xls2xform import convert
+from pyxform.xlsx_reader import XlsxCell
 
-from tests import bug_example_xls, utils
+from tests import bug_example_xls, example_xls, utils
 
 
 class TestXLS2JSONBackends(TestCase):
@@ -76,6 +86,79 @@ class TestXLS2JSONBackends(TestCase):
             self.maxDiff = None
             self.assertEqual(xls_inp, xlsx_inp)
 
+    def test_sheet_workers(self):
+        """Should find the same data when the sheets are read concurrently."""
+        cases = [
+            (xls_to_dict, {}, "specify_other.xls"),
+            (xlsx_to_dict, {}, "specify_other.xlsx"),
+            (xlsx_to_dict, {"reader": "native"}, "specify_other.xlsx"),
+        ]
+        for func, kwargs, fixture in cases:
+            path = utils.path_to_text_fixture(fixture)
+            for source in (path, Path(path).read_bytes()):
+                with self.subTest(msg=(fixture, kwargs, type(source))):
+                    expected = func(source, **kwargs)
+                    with (
+                        mock.patch("os.cpu_count", return_value=2),
+                        mock.patch(
+                            "pyxform.xls2json_backends.ProcessPoolExecutor",
+                            wraps=ProcessPoolExecutor,
+                        ) as executor,
+                    ):
+                        observed = func(source, sheet_workers=2, **kwargs)
+                    executor.assert_called_once_with(max_workers=2)
+                    self.assertEqual(expected, observed)
+                    self.assertEqual(list(expected), list(observed))
+
+    def test_sheet_workers__not_used(self):
+        """Should find no worker processes are used for one CPU or one XLSForm sheet."""
+        cases = (
+            (1, "specify_other.xlsx"),
+            (1, "specify_other.xls"),
+            (4, "group.xlsx"),
+        )
+        for cpu_count, fixture in cases:
+            with self.subTest(msg=(cpu_count, fixture)):
+                path = utils.path_to_text_fixture(fixture)
+                with (
+                    mock.patch("os.cpu_count", return_value=cpu_count),
+                    mock.patch(
+                        "pyxform.xls2json_backends.ProcessPoolExecutor"
+                    ) as executor,
+                ):
+                    observed = definition_to_dict(path, sheet_workers=4)
+                executor.assert_not_called()
+                self.assertEqual(definition_to_dict(path), observed)
+
+    def test_sheet_names(self):
+        """Should find only the named sheets are read, and the others are empty."""
+        path = utils.path_to_text_fixture("specify_other.xlsx")
+        expected = xlsx_to_dict(path)
+        observed = xlsx_to_dict(path, sheet_names={"choices"})
+        self.assertEqual(expected["choices"], observed["choices"])
+        self.assertEqual([], observed["survey"])
+        self.assertNotIn("survey_header", observed)
+
+    def test_get_excel_rows__max_adjacent_empty_rows(self):
+        """Should find the rows after a run of empty rows are not read."""
+        rows = [
+            (XlsxCell(value="a"),),
+            (XlsxCell(value=None),),
+            (XlsxCell(value=None),),
+            (XlsxCell(value="b"),),
+        ]
+
+        def get_rows(**kwargs):
+            return get_excel_rows(
+                headers=["name"],
+                rows=iter(rows),
+                cell_func=lambda c, r, k: c.value,
+                **kwargs,
+            )
+
+        self.assertEqual([{"name": "a"}, {}, {}, {"name": "b"}], get_rows())
+        self.assertEqual([{"name": "a"}], get_rows(max_adjacent_empty_rows=1))
+
     def test_xls_with_many_empty_cells(self):
         """Should quickly produce expected data, and find large input sheet dimensions."""
         self.maxDiff = None
@@ -159,3 +242,136 @@ class TestXLS2JSONBackends(TestCase):
         self.assertTupleEqual((2, 2), (settings.max_row, settings.max_column))
 
         wb.close()
+
+
+class TestGetDefinitionData(TestCase):
+    """
+    Test get_definition_data, for the types of input data.
+    """
+
+    def test_path__mapped(self):
+        """Should find that a file path is memory-mapped, and read like the bytes."""
+        xlsx_path = Path(example_xls.PATH) / "group.xlsx"
+        with get_definition_data(definition=xlsx_path) as definition:
+            self.assertIsInstance(definition.data, MappedFile)
+            self.assertEqual(SupportedFileTypes.xlsx, definition.file_type)
+            self.assertEqual("group", definition.file_path_stem)
+            self.assertEqual(xlsx_path.read_bytes(), definition.data.getvalue())
+            self.assertEqual(
+                xlsx_to_dict(xlsx_path.read_bytes()), definition_to_dict(definition)
+            )
+            # The caller's Definition is left open.
+            self.assertFalse(definition.data.closed)
+        self.assertTrue(definition.data.closed)
+
+    def test_path__mapped_file_closed(self):
+        """Should find that a file mapped for a path is closed after it's read."""
+        streams = []
+        mapped_file_init = MappedFile.__init__
+
+        def init(self, path):
+            mapped_file_init(self, path)
+            streams.append(self)
+
+        for name in ("group.xlsx", "group.xls", "group.md", "group.csv"):
+            with self.subTest(msg=name):
+                streams.clear()
+                path = Path(example_xls.PATH) / name
+                with mock.patch.object(MappedFile, "__init__", init):
+                    definition_to_dict(definition=path)
+                    convert(xlsform=path)
+                self.assertEqual(2, len(streams))
+                self.assertTrue(all(s.closed for s in streams))
+
+    def test_seekable_stream__left_open(self):
+        """Should find that the caller's stream is not closed."""
+        path = Path(example_xls.PATH) / "group.xlsx"
+        with open(path, mode="rb") as f:
+            with get_definition_data(definition=f) as definition:
+                definition_to_dict(definition=definition)
+            f.seek(0)
+            definition_to_dict(definition=f)
+            self.assertFalse(f.closed)
+
+    def test_path__empty_file(self):
+        """Should find that an empty file, which can't be mapped, is read into memory."""
+        with utils.get_temp_file() as path:
+            definition = get_definition_data(definition=path)
+        self.assertIsInstance(definition.data, BytesIO)
+        self.assertEqual(b"", definition.get_content())
+
+    def test_mapped_file__read_seek(self):
+        """Should find that the mapped file stream reads and seeks like a file."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        expected = md_path.read_bytes()
+        stream = MappedFile(path=md_path)
+        self.assertEqual(expected[:10], stream.read(10))
+        self.assertEqual(10, stream.tell())
+        self.assertEqual(15, stream.seek(5, SEEK_CUR))
+        self.assertEqual(expected[15:], stream.read())
+        self.assertEqual(b"", stream.read())
+        self.assertEqual(len(expected) - 3, stream.seek(-3, SEEK_END))
+        buffer = bytearray(5)
+        self.assertEqual(3, stream.readinto(buffer))
+        self.assertEqual(expected[-3:], bytes(buffer[:3]))
+        with self.assertRaises(OSError):
+            stream.seek(-1)
+        stream.close()
+        self.assertTrue(stream.closed)
+
+    def test_seekable_stream__not_copied(self):
+        """Should find that a seekable binary stream at the start is used as-is."""
+        for name in ("group.xlsx", "group.xls", "group.md", "group.csv"):
+            with self.subTest(msg=name):
+                path = Path(example_xls.PATH) / name
+                with open(path, mode="rb") as f:
+                    definition = get_definition_data(definition=f)
+                    self.assertIs(f, definition.data)
+                    self.assertEqual(path.read_bytes(), definition.get_content())
+                    self.assertEqual(
+                        definition_to_dict(path.read_bytes()),
+                        definition_to_dict(definition),
+                    )
+
+    def test_seekable_stream__current_position(self):
+        """Should find that a seekable binary stream is read from its current position."""
+        for name in ("group.xlsx", "group.xls", "group.md", "group.csv"):
+            with self.subTest(msg=name), utils.get_temp_file() as temp_path:
+                path = Path(example_xls.PATH) / name
+                Path(temp_path).write_bytes(b"prefix" + path.read_bytes())
+                with open(temp_path, mode="rb") as f:
+                    f.seek(6)
+                    definition = get_definition_data(definition=f)
+                    self.assertEqual(path.read_bytes(), definition.get_content())
+                    self.assertEqual(
+                        definition_to_dict(path.read_bytes()),
+                        definition_to_dict(definition),
+                    )
+
+    def test_detected_file_type(self):
+        """Should find the file type detected from the data, regardless of the suffix."""
+        cases = (
+            ("group.xlsx", SupportedFileTypes.xlsx),
+            ("group.xls", SupportedFileTypes.xls),
+            ("group.md", SupportedFileTypes.md),
+            ("group.csv", SupportedFileTypes.csv),
+        )
+        for name, expected in cases:
+            with self.subTest(msg=name):
+                data = (Path(example_xls.PATH) / name).read_bytes()
+                definition = get_definition_data(definition=data)
+                self.assertIsNone(definition.file_type)
+                self.assertEqual(expected, definition.detected_file_type)
+        self.assertIsNone(get_definition_data(definition=b"unknown").detected_file_type)
+
+    def test_detected_file_type__only_processor(self):
+        """Should find that only the detected type's processor is used, if it succeeds."""
+        data = (Path(example_xls.PATH) / "group.csv").read_bytes()
+        with (
+            mock.patch("pyxform.xls2json_backends.xlsx_to_dict") as xlsx_mock,
+            mock.patch("pyxform.xls2json_backends.xls_to_dict") as xls_mock,
+        ):
+            observed = definition_to_dict(definition=data)
+        xlsx_mock.assert_not_called()
+        xls_mock.assert_not_called()
+        self.assertIn("survey", observed)
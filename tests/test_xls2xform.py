@@ -6,25 +6,52 @@ Test xls2xform module.
 # pyxform.create_survey. We have a test here to make sure no one
 # breaks that function.
 import argparse
+import asyncio
+import base64
+import json
 import logging
-from io import BytesIO
+import multiprocessing
+import os
+import socket
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO, StringIO
 from itertools import product
 from pathlib import Path
-from unittest import TestCase, mock
+from unittest import TestCase, mock, skipIf
 
+from pyxform.conversion_cache import DiskLRUCache
+from pyxform.conversion_stats import collect_stats
 from pyxform.errors import PyXFormError
+from pyxform.validators.enketo_validate import EnketoValidateError
+from pyxform.validators.odk_validate import ODKValidateError
 from pyxform.xls2xform import (
     ConvertResult,
     _create_parser,
     _validator_args_logic,
     convert,
+    convert_async,
+    convert_many,
+    get_batch_paths,
+    get_serve_socket_server,
     get_xml_path,
     main_cli,
+    serve,
     xls2xform_convert,
+    xls2xform_convert_many,
 )
 
 from tests import example_xls
-from tests.utils import get_temp_file, path_to_text_fixture
+from tests.utils import get_temp_dir, get_temp_file, path_to_text_fixture
+
+
+def _convert_or_exit(xlsform, **kwargs):
+    """Stop the process for the XLSForm b"exit", otherwise convert it."""
+    if xlsform == b"exit":
+        os._exit(1)
+    return convert(xlsform=xlsform, **kwargs)
 
 
 class XLS2XFormTests(TestCase):
@@ -98,6 +125,11 @@ class XLS2XFormTests(TestCase):
         args = _create_parser().parse_args(["xlsform.xlsx", "."])
         self.assertFalse(args.pretty_print)
 
+    def test_create_parser_stats_default_false(self):
+        """Should have stats default to False."""
+        args = _create_parser().parse_args(["xlsform.xlsx"])
+        self.assertEqual(False, args.stats)
+
     def test_validator_args_logic_skip_validate_alone(self):
         """Should deactivate both validators."""
         raw_args = _create_parser().parse_args(["xlsform.xlsx", ".", "--skip_validate"])
@@ -160,6 +192,8 @@ class XLS2XFormTests(TestCase):
             odk_validate=False,
             enketo_validate=False,
             pretty_print=False,
+            jobs=None,
+            stats=False,
         ),
     )
     @mock.patch("pyxform.xls2xform.xls2xform_convert")
@@ -176,6 +210,7 @@ class XLS2XFormTests(TestCase):
             validate=False,
             pretty_print=False,
             enketo=False,
+            stats=None,
         )
 
     @mock.patch(
@@ -188,6 +223,8 @@ class XLS2XFormTests(TestCase):
             odk_validate=False,
             enketo_validate=False,
             pretty_print=False,
+            jobs=None,
+            stats=False,
         ),
     )
     @mock.patch("pyxform.xls2xform.xls2xform_convert")
@@ -205,6 +242,7 @@ class XLS2XFormTests(TestCase):
             validate=False,
             pretty_print=False,
             enketo=False,
+            stats=None,
         )
 
     @mock.patch(
@@ -217,6 +255,8 @@ class XLS2XFormTests(TestCase):
             odk_validate=True,
             enketo_validate=True,
             pretty_print=True,
+            jobs=None,
+            stats=False,
         ),
     )
     def test_xls2xform_convert_throwing_odk_error(self, parser_mock_args):
@@ -274,6 +314,48 @@ class TestXLS2XFormConvert(TestCase):
                                 (Path(xform).parent / "itemsets.csv").is_file()
                             )
 
+    def test_xls2xform_convert__error_keeps_existing_xform(self):
+        """Should find an existing XForm file is unchanged if the conversion fails."""
+        with get_temp_dir() as td:
+            xlsform = Path(td) / "bad.md"
+            xlsform.write_text("bad")
+            xform = Path(td) / "bad.xml"
+            xform.write_text("<previous/>")
+            with self.assertRaises(PyXFormError):
+                xls2xform_convert(xlsform_path=xlsform, xform_path=xform, validate=False)
+            self.assertEqual("<previous/>", xform.read_text())
+            self.assertEqual({"bad.md", "bad.xml"}, {p.name for p in Path(td).iterdir()})
+
+    def test_main_cli__validate_error_keeps_existing_xform(self):
+        """Should find an existing XForm file is unchanged if the CLI validation fails."""
+        with get_temp_dir() as td:
+            xform = Path(td) / "group.xml"
+            xform.write_text("<previous/>")
+            args = argparse.Namespace(
+                path_to_XLSForm=Path(example_xls.PATH) / "group.md",
+                output_path=xform,
+                json=False,
+                skip_validate=True,
+                odk_validate=True,
+                enketo_validate=False,
+                pretty_print=False,
+                jobs=None,
+                stats=False,
+            )
+            logger = logging.getLogger("pyxform.xls2xform")
+            with (
+                mock.patch("argparse.ArgumentParser.parse_args", return_value=args),
+                mock.patch(
+                    "pyxform.validators.odk_validate.check_xform",
+                    side_effect=ODKValidateError("invalid"),
+                ),
+                mock.patch.object(logger, "exception") as mock_exception,
+            ):
+                main_cli()
+            mock_exception.assert_called_once()
+            self.assertEqual("<previous/>", xform.read_text())
+            self.assertEqual({"group.xml"}, {p.name for p in Path(td).iterdir()})
+
 
 class TestXLS2XFormConvertAPI(TestCase):
     """
@@ -407,3 +489,424 @@ class TestXLS2XFormConvertAPI(TestCase):
         observed = convert(xlsform=ss_structure)
         self.assertIsInstance(observed, ConvertResult)
         self.assertGreater(len(observed.xform), 0)
+
+    def test_output_stream(self):
+        """Should find that the XForm is written to the output stream, with or without
+        a cache."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        expected = convert(xlsform=md_path, pretty_print=True)
+        output = StringIO()
+        observed = convert(xlsform=md_path, pretty_print=True, output=output)
+        self.assertIsNone(observed.xform)
+        self.assertEqual(expected.xform, output.getvalue())
+        self.assertEqual(expected.warnings, observed.warnings)
+        with get_temp_dir() as td:
+            cache = DiskLRUCache(path=td)
+            for _ in range(2):  # A cache miss, then a cache hit.
+                output = BytesIO()
+                observed = convert(
+                    xlsform=md_path, pretty_print=True, cache=cache, output=output
+                )
+                self.assertIsNone(observed.xform)
+                self.assertEqual(expected.xform, output.getvalue().decode("utf-8"))
+
+    def test_stats(self):
+        """Should find stats for each conversion stage only if requested."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        self.assertIsNone(convert(xlsform=md_path).stats)
+        observed = convert(xlsform=md_path, stats=True)
+        self.assertEqual(
+            ["file_read", "workbook_to_json", "builder", "xml"], list(observed.stats)
+        )
+        for name, values in observed.stats.items():
+            with self.subTest(msg=name):
+                self.assertEqual(
+                    {"wall_seconds", "cpu_seconds", "peak_bytes"}, set(values)
+                )
+                self.assertGreaterEqual(values["wall_seconds"], 0)
+                self.assertGreater(values["peak_bytes"], 0)
+        self.assertEqual(convert(xlsform=md_path).xform, observed.xform)
+
+    def test_stats__concurrent(self):
+        """Should wait to collect stats until another conversion's stats are collected."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with collect_stats():
+                future = executor.submit(convert, xlsform=md_path, stats=True)
+                with self.assertRaises(TimeoutError):
+                    future.result(timeout=0.5)
+            observed = future.result()
+        self.assertGreater(observed.stats["xml"]["peak_bytes"], 0)
+
+    def test_stats__nested(self):
+        """Should not wait for itself if stats are collected within a collect_stats."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        with collect_stats():
+            observed = convert(xlsform=md_path, stats=True)
+        self.assertIn("xml", observed.stats)
+
+    def test_stats__existing_tracemalloc(self):
+        """Should not stop or reset tracemalloc if it was already started."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        tracemalloc.start()
+        try:
+            observed = convert(xlsform=md_path, stats=True)
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+        for values in observed.stats.values():
+            self.assertEqual(0, values["peak_bytes"])
+
+    def test_stats__main_cli(self):
+        """Should find the stats table in the CLI output, if requested."""
+        with get_temp_dir() as td:
+            args = argparse.Namespace(
+                path_to_XLSForm=Path(example_xls.PATH) / "group.md",
+                output_path=Path(td) / "group.xml",
+                json=False,
+                skip_validate=False,
+                odk_validate=False,
+                enketo_validate=False,
+                pretty_print=False,
+                jobs=None,
+                stats=True,
+            )
+            logger = logging.getLogger("pyxform.xls2xform")
+            with (
+                mock.patch("argparse.ArgumentParser.parse_args", return_value=args),
+                mock.patch.object(logger, "info") as mock_info,
+            ):
+                main_cli()
+        table = mock_info.call_args_list[0][0][0]
+        self.assertTrue(table.startswith("stage"))
+        self.assertIn("workbook_to_json", table)
+
+
+class TestXLS2XFormConvertMany(TestCase):
+    """
+    Tests for the `convert_many` batch API and the `--jobs` CLI mode.
+    """
+
+    def test_convert_many__ok(self):
+        """Should find results in input order, with errors returned rather than raised."""
+        xlsforms = [
+            Path(example_xls.PATH) / "group.xlsx",
+            b"bad",
+            Path(example_xls.PATH) / "choice_name_as_type.xls",
+            (Path(example_xls.PATH) / "group.md").read_bytes(),
+        ]
+        for max_workers in (1, 2):
+            with self.subTest(msg=f"max_workers={max_workers}"):
+                observed = convert_many(xlsforms=xlsforms, max_workers=max_workers)
+                self.assertEqual(4, len(observed))
+                self.assertIsInstance(observed[0], ConvertResult)
+                self.assertIsInstance(observed[1], PyXFormError)
+                self.assertIsInstance(observed[2], ConvertResult)
+                self.assertIsInstance(observed[3], ConvertResult)
+                self.assertIn("<h:title>group</h:title>", observed[0].xform)
+                self.assertIsNotNone(observed[2].itemsets)
+                expected = convert(xlsform=xlsforms[3])
+                self.assertEqual(expected.xform, observed[3].xform)
+
+    def test_convert_many__no_internal_representations(self):
+        """Should find the results only have the XForm, warnings and itemsets."""
+        xlsform = Path(example_xls.PATH) / "group.xlsx"
+        for max_workers in (1, 2):
+            with self.subTest(msg=f"max_workers={max_workers}"):
+                observed = convert_many(xlsforms=[xlsform] * 2, max_workers=max_workers)
+                self.assertIsNone(observed[0]._pyxform)
+                self.assertIsNone(observed[0]._survey)
+
+    @skipIf(
+        multiprocessing.get_start_method() != "fork",
+        "The worker processes must see the patched convert.",
+    )
+    def test_convert_many__worker_exit(self):
+        """Should find that only the XLSForm that stopped a worker process fails."""
+        xlsforms = [b"exit", *[(Path(example_xls.PATH) / "group.md").read_bytes()] * 3]
+        with mock.patch("pyxform.xls2xform.convert", side_effect=_convert_or_exit):
+            observed = convert_many(xlsforms=xlsforms, max_workers=2)
+        self.assertIsInstance(observed[0], BrokenProcessPool)
+        for result in observed[1:]:
+            self.assertIsInstance(result, ConvertResult)
+
+    def test_xls2xform_convert_many__same_xform_path(self):
+        """Should find an error for each XLSForm with the same XForm path as another."""
+        with get_temp_dir() as td, get_temp_dir() as out:
+            paths = [Path(td) / n for n in ("a.md", "a.xlsx", "b.md")]
+            paths[0].write_text((Path(example_xls.PATH) / "group.md").read_text())
+            paths[1].write_bytes((Path(example_xls.PATH) / "group.xlsx").read_bytes())
+            paths[2].write_text((Path(example_xls.PATH) / "group.md").read_text())
+            observed = xls2xform_convert_many(
+                xlsform_paths=paths, output_dir=out, max_workers=1, validate=False
+            )
+            self.assertEqual(
+                [Path(out) / n for n in ("a.xml", "a.xml", "b.xml")],
+                [xform_path for xform_path, _ in observed],
+            )
+            self.assertIsInstance(observed[0][1], PyXFormError)
+            self.assertIsInstance(observed[1][1], PyXFormError)
+            self.assertIn("is the same for more than one XLSForm", str(observed[0][1]))
+            self.assertEqual([], observed[2][1])
+            self.assertEqual({"b.xml"}, {p.name for p in Path(out).iterdir()})
+
+    def test_xls2xform_convert_many__write_error(self):
+        """Should find a write error is returned for the XLSForm, and others written."""
+        with get_temp_dir() as out:
+            (Path(out) / "group.xml").mkdir()
+            paths = [
+                Path(example_xls.PATH) / "group.md",
+                Path(example_xls.PATH) / "choice_name_as_type.xls",
+            ]
+            observed = xls2xform_convert_many(
+                xlsform_paths=paths, output_dir=out, max_workers=1, validate=False
+            )
+            self.assertIsInstance(observed[0][1], OSError)
+            self.assertIsInstance(observed[1][1], list)
+            self.assertEqual(
+                {"group.xml", "choice_name_as_type.xml", "itemsets.csv"},
+                {p.name for p in Path(out).iterdir()},
+            )
+            self.assertTrue((Path(out) / "group.xml").is_dir())
+
+    def test_main_cli_jobs__stats(self):
+        """Should exit if --stats is used with --jobs."""
+        with (
+            mock.patch("sys.argv", ["xls2xform", "forms", "--jobs", "2", "--stats"]),
+            mock.patch("sys.stderr", new_callable=StringIO) as stderr,
+            self.assertRaises(SystemExit),
+        ):
+            main_cli()
+        self.assertIn("--stats: not allowed with argument --jobs", stderr.getvalue())
+
+    def test_get_batch_paths(self):
+        """Should find XLSForms in a directory, or matching a glob pattern."""
+        with get_temp_dir() as td:
+            for name in ("b.xlsx", "a.md", "c.txt"):
+                (Path(td) / name).write_text("")
+            self.assertEqual(
+                [Path(td) / "a.md", Path(td) / "b.xlsx"], get_batch_paths(td)
+            )
+            self.assertEqual(
+                [Path(td) / "b.xlsx"], get_batch_paths(str(Path(td) / "*.xlsx"))
+            )
+
+    def test_main_cli_jobs(self):
+        """Should convert all the XLSForms in a directory, continuing past errors."""
+        with get_temp_dir() as td, get_temp_dir() as out:
+            src = Path(td)
+            (src / "group.md").write_text(
+                (Path(example_xls.PATH) / "group.md").read_text()
+            )
+            (src / "bad.md").write_text("bad")
+            args = argparse.Namespace(
+                path_to_XLSForm=td,
+                output_path=out,
+                json=True,
+                skip_validate=False,
+                odk_validate=False,
+                enketo_validate=False,
+                pretty_print=False,
+                jobs=2,
+                stats=False,
+            )
+            logger = logging.getLogger("pyxform.xls2xform")
+            with (
+                mock.patch("argparse.ArgumentParser.parse_args", return_value=args),
+                mock.patch.object(logger, "info") as mock_info,
+            ):
+                main_cli()
+            responses = json.loads(mock_info.call_args[0][0])
+            self.assertEqual([999, 100], [r["code"] for r in responses])
+            self.assertFalse((Path(out) / "bad.xml").exists())
+            self.assertTrue((Path(out) / "group.xml").is_file())
+
+
+class TestXLS2XFormConvertAsync(TestCase):
+    """
+    Tests for the `convert_async` API.
+    """
+
+    md_path = Path(example_xls.PATH) / "group.md"
+
+    def test_convert_async__no_validators(self):
+        """Should find the same result as convert when not validating."""
+        expected = convert(xlsform=self.md_path)
+        observed = asyncio.run(convert_async(xlsform=self.md_path))
+        self.assertEqual(expected.xform, observed.xform)
+        self.assertEqual(expected.warnings, observed.warnings)
+
+    def test_convert_async__converts_in_thread(self):
+        """Should find that the conversion runs outside of the event loop thread."""
+        threads = []
+
+        def convert_in_thread(**kwargs):
+            threads.append(threading.get_ident())
+            return convert(**kwargs)
+
+        with mock.patch("pyxform.xls2xform.convert", side_effect=convert_in_thread):
+            observed = asyncio.run(convert_async(xlsform=self.md_path, stats=True))
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertIn("workbook_to_json", observed.stats)
+
+    def test_convert_async__output_written_after_validators(self):
+        """Should find the XForm is written to the output only if the validators pass."""
+        expected = convert(xlsform=self.md_path).xform
+        cases = (
+            ({"return_value": []}, expected),
+            ({"side_effect": ODKValidateError("odk")}, ""),
+        )
+        for check_kwargs, written in cases:
+            with self.subTest(check_kwargs):
+                output = StringIO()
+                with mock.patch(
+                    "pyxform.validators.odk_validate.check_xform_async", **check_kwargs
+                ):
+                    try:
+                        observed = asyncio.run(
+                            convert_async(
+                                xlsform=self.md_path, validate=True, output=output
+                            )
+                        )
+                    except ODKValidateError:
+                        pass
+                    else:
+                        self.assertIsNone(observed.xform)
+                self.assertEqual(written, output.getvalue())
+
+    def test_convert_async__validators_run_concurrently(self):
+        """Should find that the validators run at the same time, with ordered warnings."""
+        started = []
+
+        async def run():
+            # Each validator waits for the other, so this fails if they run in sequence.
+            both_started = asyncio.Event()
+
+            def check_xform_async(name):
+                async def check(path):
+                    self.assertIn("<h:title>group</h:title>", Path(path).read_text())
+                    started.append(name)
+                    if len(started) == 2:
+                        both_started.set()
+                    await asyncio.wait_for(both_started.wait(), timeout=5)
+                    return [name]
+
+                return check
+
+            with (
+                mock.patch(
+                    "pyxform.validators.odk_validate.check_xform_async",
+                    check_xform_async("odk"),
+                ),
+                mock.patch(
+                    "pyxform.validators.enketo_validate.check_xform_async",
+                    check_xform_async("enketo"),
+                ),
+            ):
+                return await convert_async(
+                    xlsform=self.md_path,
+                    warnings=["existing"],
+                    validate=True,
+                    enketo=True,
+                )
+
+        observed = asyncio.run(run())
+        self.assertEqual(["existing", "odk", "enketo"], observed.warnings)
+
+    def test_convert_async__validator_errors_raised_in_order(self):
+        """Should find that the ODK Validate error is raised if both validators fail."""
+        with (
+            mock.patch(
+                "pyxform.validators.odk_validate.check_xform_async",
+                side_effect=ODKValidateError("odk"),
+            ),
+            mock.patch(
+                "pyxform.validators.enketo_validate.check_xform_async",
+                side_effect=EnketoValidateError("enketo"),
+            ),
+            self.assertRaises(ODKValidateError),
+        ):
+            asyncio.run(convert_async(xlsform=self.md_path, validate=True, enketo=True))
+
+
+class TestXLS2XFormServe(TestCase):
+    """
+    Tests for the `serve` mode JSON lines protocol.
+    """
+
+    def test_serve_stream__ok(self):
+        """Should write a response for each request, including for failed jobs."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        xlsx_path = Path(example_xls.PATH) / "group.xlsx"
+        requests = [
+            {"id": 1, "xlsform": str(md_path), "pretty_print": True},
+            {"id": "b", "data": base64.b64encode(xlsx_path.read_bytes()).decode()},
+            {"id": 3, "data": base64.b64encode(b"bad").decode()},
+            "not an object",
+        ]
+        rfile = StringIO("\n".join(json.dumps(r) for r in requests) + "\n\n")
+        wfile = StringIO()
+        serve(rfile=rfile, wfile=wfile)
+        observed = [json.loads(line) for line in wfile.getvalue().splitlines()]
+        self.assertEqual([1, "b", 3, None], [r["id"] for r in observed])
+        self.assertEqual([100, 100, 999, 999], [r["code"] for r in observed])
+        self.assertEqual(
+            convert(xlsform=md_path, pretty_print=True).xform, observed[0]["xform"]
+        )
+        self.assertIn("<h:title>data</h:title>", observed[1]["xform"])
+
+    def test_serve_stream__stats(self):
+        """Should refuse a request for stats, since they'd include other jobs."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        rfile = StringIO(json.dumps({"xlsform": str(md_path), "stats": True}) + "\n")
+        wfile = StringIO()
+        serve(rfile=rfile, wfile=wfile)
+        observed = json.loads(wfile.getvalue())
+        self.assertEqual(999, observed["code"])
+        self.assertIn("not supported in the serve mode", observed["message"])
+
+    def test_main_cli__serve_flag(self):
+        """Should run the serve mode with the --serve flag, passing on the other args."""
+        with (
+            mock.patch("sys.argv", ["xls2xform", "--serve", "--socket", "a.sock"]),
+            mock.patch("pyxform.xls2xform.main_serve") as mock_serve,
+        ):
+            main_cli()
+        mock_serve.assert_called_once_with(argv=["--socket", "a.sock"])
+
+    def test_main_cli__file_named_serve(self):
+        """Should convert an XLSForm file named "serve", rather than run the serve mode."""
+        with (
+            mock.patch("sys.argv", ["xls2xform", "serve", "--skip_validate"]),
+            mock.patch("pyxform.xls2xform.main_serve") as mock_serve,
+            mock.patch(
+                "pyxform.xls2xform.xls2xform_convert", return_value=[]
+            ) as mock_convert,
+        ):
+            main_cli()
+        mock_serve.assert_not_called()
+        self.assertEqual("serve", mock_convert.call_args.kwargs["xlsform_path"])
+
+    @skipIf(not hasattr(socket, "AF_UNIX"), "Unix sockets not available.")
+    def test_serve_socket__ok(self):
+        """Should respond to requests sent over a Unix socket."""
+        md_path = Path(example_xls.PATH) / "group.md"
+        with get_temp_dir() as td:
+            socket_path = Path(td) / "pyxform.sock"
+            with get_serve_socket_server(socket_path=socket_path) as server:
+                thread = threading.Thread(target=server.serve_forever, daemon=True)
+                thread.start()
+                try:
+                    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                        client.connect(str(socket_path))
+                        with client.makefile(mode="rw", encoding="utf-8") as f:
+                            for i in range(2):
+                                f.write(json.dumps({"id": i, "xlsform": str(md_path)}))
+                                f.write("\n")
+                                f.flush()
+                                observed = json.loads(f.readline())
+                                self.assertEqual(i, observed["id"])
+                                self.assertEqual(100, observed["code"])
+                finally:
+                    server.shutdown()
+                    thread.join()
@@ -0,0 +1,233 @@
+"""
+Test xlsx_reader module.
+"""
+
+import datetime
+import os
+import warnings
+from io import BytesIO
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from zipfile import ZipFile
+
+from defusedxml import DefusedXmlException
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.rich_text import CellRichText, TextBlock
+from openpyxl.cell.text import InlineFont
+from openpyxl.styles import Font
+from pyxform.errors import PyXFormError, PyXFormReadError
+from pyxform.xls2json import workbook_to_json
+from pyxform.xls2json_backends import xlsx_to_dict
+from pyxform.xls2xform import convert
+from pyxform.xlsx_reader import XLSX_READER_ENV, XlsxWorkbook, get_xlsx_reader
+
+from tests import bug_example_xls, example_xls
+
+
+def get_xlsx_data(epoch: datetime.datetime | None = None) -> bytes:
+    """Get an XLSX file with each type of cell value, and rows with gaps."""
+    wb = Workbook()
+    if epoch is not None:
+        wb.epoch = epoch
+    survey = wb.active
+    survey.title = "survey"
+    survey.append(["type", "name", "label", "default", "hint", "constraint", "other"])
+    survey.append(
+        [
+            "date",
+            "a",
+            CellRichText("rich ", TextBlock(InlineFont(b=True), "text")),
+            datetime.datetime(2020, 1, 2, 3, 4, 5),
+            datetime.time(1, 2, 3),
+            datetime.timedelta(hours=30),
+            datetime.date(1900, 1, 15),
+        ]
+    )
+    survey.append(["integer", "b", " label ", True, 1.0, 2.5, "=1+1"])
+    survey["A40"] = "text"
+    survey["B40"] = "c"
+    # After a run of empty rows, so not read.
+    survey["A200"] = "text"
+    survey["B200"] = "d"
+    choices = wb.create_sheet("choices")
+    choices.append(["list_name", "name", "label"])
+    choices.append(["list", "1", "x005F_x000D_"])
+    wb.create_sheet("not_xlsform").append(["a", "b"])
+    data = BytesIO()
+    wb.save(data)
+    return data.getvalue()
+
+
+def get_phantom_rows_data(n_rows: int) -> bytes:
+    """Get an XLSX file with no sheet dimensions, and many formatted empty rows."""
+    wb = Workbook(write_only=True)
+    survey = wb.create_sheet("survey")
+    survey.append(["type", "name", "label"])
+    survey.append(["text", "a", "A"])
+    font = Font(bold=True)
+    for _ in range(n_rows):
+        cell = WriteOnlyCell(survey, value=None)
+        cell.font = font
+        survey.append([cell])
+    data = BytesIO()
+    wb.save(data)
+    return data.getvalue()
+
+
+class TestXlsxReader(TestCase):
+    maxDiff = None
+
+    def test_native_conformance(self):
+        """Should find the native reader output is the same as the openpyxl reader."""
+        paths = sorted(
+            p
+            for d in (example_xls.PATH, bug_example_xls.PATH)
+            for p in Path(d).iterdir()
+            if p.suffix == ".xlsx"
+        )
+        for path in paths:
+            with self.subTest(msg=path.name), warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                try:
+                    expected = xlsx_to_dict(path, reader="openpyxl")
+                except PyXFormError as err:
+                    with self.assertRaises(type(err)) as observed:
+                        xlsx_to_dict(path, reader="native")
+                    self.assertEqual(err.args, observed.exception.args)
+                else:
+                    self.assertEqual(expected, xlsx_to_dict(path, reader="native"))
+
+    def test_native_conformance__cell_types(self):
+        """Should find the native reader gets the same cell values as openpyxl."""
+        for epoch in (None, datetime.datetime(1904, 1, 1)):
+            with self.subTest(msg=f"epoch={epoch}"):
+                data = get_xlsx_data(epoch=epoch)
+                expected = xlsx_to_dict(data, reader="openpyxl")
+                self.assertEqual(expected, xlsx_to_dict(data, reader="native"))
+                names = [r["name"] for r in expected["survey"] if r]
+                self.assertEqual(["a", "b", "c"], names)
+                self.assertEqual("2020-01-02 03:04:05", expected["survey"][0]["default"])
+
+    def test_native_workbook(self):
+        """Should find the sheets in order, and only read the rows that are iterated."""
+        wb = XlsxWorkbook(source=BytesIO(get_xlsx_data()))
+        try:
+            self.assertEqual(["survey", "choices", "not_xlsform"], wb.sheetnames)
+            self.assertIsNone(wb._shared_strings)
+            rows = wb["choices"].iter_rows(min_row=2, max_col=2)
+            self.assertEqual(["list", "1"], [c.value for c in next(rows)])
+            self.assertEqual([], list(rows))
+        finally:
+            wb.close()
+
+    def test_native_conformance__workbook_to_json(self):
+        """Should find the same workbook_to_json output when using either reader."""
+        paths = sorted(
+            p
+            for d in (example_xls.PATH, bug_example_xls.PATH)
+            for p in Path(d).iterdir()
+            if p.suffix == ".xlsx"
+        )
+        sources = [(p.name, p) for p in paths]
+        sources.append(("phantom_rows", get_phantom_rows_data(n_rows=10)))
+        for name, source in sources:
+            with self.subTest(msg=name), warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                try:
+                    expected = workbook_to_json(
+                        xlsx_to_dict(source, reader="openpyxl"), form_name="data"
+                    )
+                except PyXFormError as err:
+                    with self.assertRaises(type(err)) as observed:
+                        workbook_to_json(
+                            xlsx_to_dict(source, reader="native"), form_name="data"
+                        )
+                    self.assertEqual(err.args, observed.exception.args)
+                else:
+                    observed = workbook_to_json(
+                        xlsx_to_dict(source, reader="native"), form_name="data"
+                    )
+                    self.assertEqual(expected, observed)
+
+    def test_native_convert(self):
+        """Should find the same XForm when converting with either reader."""
+        path = Path(example_xls.PATH) / "group.xlsx"
+        self.assertEqual(
+            convert(xlsform=path).xform,
+            convert(xlsform=path, xlsx_reader="native").xform,
+        )
+
+    def test_phantom_rows(self):
+        """Should find the native reader is used if a sheet has no dimensions."""
+        data = get_phantom_rows_data(n_rows=1000)
+        wb = XlsxWorkbook(source=BytesIO(data))
+        try:
+            self.assertFalse(wb["survey"].has_dimensions())
+        finally:
+            wb.close()
+        expected = xlsx_to_dict(data, reader="openpyxl")
+        with (
+            patch.dict(os.environ, {XLSX_READER_ENV: ""}),
+            patch("openpyxl.reader.excel.ExcelReader.read") as excel_reader_read,
+            patch(
+                "pyxform.xlsx_reader.XlsxWorkbook", wraps=XlsxWorkbook
+            ) as native_workbook,
+            self.assertLogs("pyxform.xls2json_backends", level="INFO") as logs,
+        ):
+            observed = xlsx_to_dict(data)
+        excel_reader_read.assert_not_called()
+        self.assertIn("native XLSX reader", logs.output[0])
+        self.assertIn("survey", logs.output[0])
+        # The dimensions are checked using the archive opened for openpyxl.
+        native_workbook.assert_called_once()
+        self.assertIsInstance(native_workbook.call_args.kwargs["source"], ZipFile)
+        self.assertEqual(expected, observed)
+        self.assertEqual(["a"], [r["name"] for r in observed["survey"]])
+
+    def test_phantom_rows__reader_set(self):
+        """Should find the requested reader is used even if a sheet has no dimensions."""
+        data = get_phantom_rows_data(n_rows=10)
+        for env, reader in (("openpyxl", None), ("", "openpyxl")):
+            with (
+                self.subTest(env=env, reader=reader),
+                patch.dict(os.environ, {XLSX_READER_ENV: env}),
+                patch("pyxform.xlsx_reader.XlsxWorkbook") as native_workbook,
+            ):
+                observed = xlsx_to_dict(data, reader=reader)
+                native_workbook.assert_not_called()
+                self.assertEqual(["a"], [r["name"] for r in observed["survey"]])
+
+    def test_phantom_rows__dimensions(self):
+        """Should find the openpyxl reader is used by default if sheets have dimensions."""
+        wb = XlsxWorkbook(source=BytesIO(get_xlsx_data()))
+        try:
+            self.assertTrue(all(wb[n].has_dimensions() for n in wb.sheetnames))
+        finally:
+            wb.close()
+
+    def test_native_workbook__entities_forbidden(self):
+        """Should find the native reader refuses XML entity declarations."""
+        source = BytesIO(get_xlsx_data())
+        data = BytesIO()
+        with ZipFile(source) as zin, ZipFile(data, mode="w") as zout:
+            for item in zin.infolist():
+                content = zin.read(item.filename)
+                if item.filename == "[Content_Types].xml":
+                    content = b'<!DOCTYPE Types [<!ENTITY a "aaaa">]>' + content
+                zout.writestr(item, content)
+        with self.assertRaises(PyXFormReadError) as err:
+            XlsxWorkbook(source=data)
+        self.assertIsInstance(err.exception.__cause__, DefusedXmlException)
+
+    def test_get_xlsx_reader(self):
+        """Should find the reader from the argument, environment, or default."""
+        with patch.dict(os.environ, {XLSX_READER_ENV: ""}):
+            self.assertEqual("openpyxl", get_xlsx_reader())
+            self.assertEqual("native", get_xlsx_reader(name="native"))
+        with patch.dict(os.environ, {XLSX_READER_ENV: "native"}):
+            self.assertEqual("native", get_xlsx_reader())
+            self.assertEqual("openpyxl", get_xlsx_reader(name="openpyxl"))
+        with self.assertRaises(PyXFormError):
+            get_xlsx_reader(name="bad")
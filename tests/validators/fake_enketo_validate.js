@@ -0,0 +1,15 @@
+/**
+ * An enketo-validate module stand-in for testing the Enketo Validate worker.
+ *
+ * An XForm containing "invalid" gets an error, and anything else gets a warning.
+ */
+'use strict';
+
+module.exports = {
+    validate: async (xform) => {
+        if (xform.includes('invalid')) {
+            return { warnings: [], errors: ['Error in form'] };
+        }
+        return { warnings: ['Warning in form'], errors: [] };
+    },
+};
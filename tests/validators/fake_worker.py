@@ -0,0 +1,40 @@
+"""
+A validator worker for testing the worker pool protocol.
+
+The response depends on the request path: "crash" exits, "crash-once:<file>" exits if
+the file doesn't exist yet (and creates it), "sleep" waits, "invalid" gets a return code
+of 1, and anything else gets a return code of 0. The stdout is the worker
+process ID, so that tests can check if a worker was replaced.
+"""
+
+import json
+import os
+import sys
+import time
+
+
+def main():
+    for line in sys.stdin:
+        path = json.loads(line)["path"]
+        if path == "crash":
+            sys.exit(1)
+        elif path.startswith("crash-once:"):
+            marker = path.split(":", 1)[1]
+            if not os.path.exists(marker):
+                with open(marker, "w"):
+                    pass
+                sys.exit(1)
+        elif path == "sleep":
+            time.sleep(30)
+        return_code = 1 if path == "invalid" else 0
+        response = {
+            "return_code": return_code,
+            "stdout": str(os.getpid()),
+            "stderr": path,
+        }
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ from unittest import TestCase
 from xml.dom.minidom import getDOMImplementation
 
 from pyxform import create_survey_from_xls
-from pyxform.utils import node
+from pyxform.utils import EscapedText, node
 
 from tests.utils import path_to_text_fixture
 from tests.xform_test_case.base import XFormTestCase
@@ -103,3 +103,42 @@ class MinidomTextWriterMonkeyPatchTest(TestCase):
         root.appendChild(text_node)
         observed = root.toprettyxml(indent="", newl="")
         self.assertEqual(expected, observed)
+
+
+class DetachableElementTest(TestCase):
+    def test_same_output_as_minidom(self):
+        """Should find the same output as minidom for attributes and nested elements."""
+        attr = "' \" & < >"
+        root = node("root", node("a", "text", b=attr), node("c"), d=attr)
+        document = getDOMImplementation().createDocument(None, "root", None)
+        expected = document.documentElement
+        expected.setAttribute("d", attr)
+        a = document.createElement("a")
+        a.setAttribute("b", attr)
+        a.appendChild(document.createTextNode("text"))
+        expected.appendChild(a)
+        expected.appendChild(document.createElement("c"))
+        self.assertEqual(expected.toxml(), root.toxml())
+        self.assertEqual(expected.toprettyxml(indent="  "), root.toprettyxml(indent="  "))
+
+    def test_mixed_content(self):
+        """Should find mixed content is written without indents, with escaped text."""
+        label = node(
+            "label",
+            EscapedText('a "b" '),
+            node("output", value=" /x "),
+            EscapedText(" c"),
+        )
+        observed = node("root", label).toprettyxml(indent="  ")
+        expected = '<root>\n  <label> a &quot;b&quot; <output value=" /x "/> c </label>\n</root>\n'
+        self.assertEqual(expected, observed)
+
+    def test_insert_before_moves_node(self):
+        """Should find that a node added to a new parent is removed from the old one."""
+        a, b = node("a"), node("b")
+        first = node("first", a)
+        second = node("second", b)
+        second.insertBefore(a, b)
+        self.assertEqual("<first/>", first.toxml())
+        self.assertEqual("<second><a/><b/></second>", second.toxml())
+        self.assertIs(b, second.lastChild)